@@ -3,7 +3,35 @@ import os
 import jwt
 import psycopg2
 import base64
-from typing import Dict, Any, Optional
+import hashlib
+import hmac
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import urlencode
+from typing import Dict, Any, Optional, Tuple, Iterable, Iterator
+
+# Largest slice returned per range request, keeping responses under the platform payload limit
+MAX_RANGE_BYTES = int(os.environ.get('MAX_RANGE_BYTES', str(2 * 1024 * 1024)))
+
+# Lifetime of signed playback URLs
+PLAYBACK_URL_TTL_SECONDS = int(os.environ.get('PLAYBACK_URL_TTL_SECONDS', '900'))
+# Segment URLs are signed afresh on every HLS playlist fetch and live this long (at least twice the video's duration),
+# so playback that outlasts the playlist URL, pauses included, keeps loading segments
+HLS_SEGMENT_URL_TTL_SECONDS = int(os.environ.get('HLS_SEGMENT_URL_TTL_SECONDS', str(6 * 3600)))
+
+# Process-local LRU of STORAGE_BLOCK_SIZE blocks of video keyed by (stored video, block index), bounded by total size;
+# lives as long as the warm instance, and ranges of videos larger than the whole cache still hit on their hot blocks
+VIDEO_CACHE_MAX_BYTES = int(os.environ.get('VIDEO_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+video_cache: 'OrderedDict[Tuple[Any, int], bytes]' = OrderedDict()
+video_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+
+# Where new video bytes are stored: 'postgres' (large objects) or 'local' (files under VIDEO_STORAGE_DIR)
+VIDEO_STORAGE_BACKEND = os.environ.get('VIDEO_STORAGE_BACKEND', 'postgres')
+VIDEO_STORAGE_DIR = os.environ.get('VIDEO_STORAGE_DIR', '/var/lib/video-leads')
+# Block size for hashing and copying videos without loading them whole
+STORAGE_BLOCK_SIZE = 1024 * 1024
 
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
     '''Verify JWT token and return user data'''
@@ -14,6 +42,474 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
     except:
         return None
 
+class PostgresBlobStore:
+    '''Video bytes in Postgres large objects, outside the video_leads rows; the key is the object OID'''
+    name = 'postgres'
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        video_object = self.conn.lobject(0, 'wb')
+        try:
+            for block in blocks:
+                video_object.write(bytes(block))
+            return str(video_object.oid)
+        finally:
+            video_object.close()
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            video_object.seek(offset)
+            return video_object.read(length)
+        finally:
+            video_object.close()
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            while True:
+                block = video_object.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+        finally:
+            video_object.close()
+    
+    def delete(self, key: str) -> None:
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT lo_unlink(%s)", (int(key),))
+
+class LocalBlobStore:
+    '''Video bytes as files under a local directory; the key is the path relative to it'''
+    name = 'local'
+    
+    def __init__(self, root: str):
+        self.root = root
+    
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        # Every write gets its own file, like a new large object OID, so deleting the key of one
+        # dropped row never removes bytes that a concurrent upload of the same content just wrote
+        key = f'{content_hash[:2]}/{content_hash}-{uuid.uuid4().hex}'
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so readers never see a partial file
+        partial_path = f'{path}.partial'
+        with open(partial_path, 'wb') as video_file:
+            for block in blocks:
+                video_file.write(block)
+        os.replace(partial_path, path)
+        return key
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        with open(self.path(key), 'rb') as video_file:
+            video_file.seek(offset)
+            return video_file.read(length)
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        with open(self.path(key), 'rb') as video_file:
+            while True:
+                block = video_file.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+    
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+def get_blob_store(conn, backend: Optional[str] = None):
+    '''Blob store for a backend name, VIDEO_STORAGE_BACKEND by default'''
+    backend = backend or VIDEO_STORAGE_BACKEND
+    if backend == 'postgres':
+        return PostgresBlobStore(conn)
+    if backend == 'local':
+        return LocalBlobStore(VIDEO_STORAGE_DIR)
+    raise ValueError(f"Unknown video storage backend: {backend}")
+
+def cache_get(key: Tuple[Any, int]) -> Optional[bytes]:
+    '''Return a cached video block and mark it most recently used'''
+    video_data = video_cache.get(key)
+    if video_data is None:
+        video_cache_stats['misses'] += 1
+        return None
+    video_cache.move_to_end(key)
+    video_cache_stats['hits'] += 1
+    return video_data
+
+def cache_put(key: Tuple[Any, int], video_data: bytes) -> None:
+    '''Cache a video block, evicting least recently used blocks beyond VIDEO_CACHE_MAX_BYTES'''
+    if len(video_data) > VIDEO_CACHE_MAX_BYTES:
+        return
+    previous = video_cache.pop(key, None)
+    if previous is not None:
+        video_cache_stats['bytes'] -= len(previous)
+    video_cache[key] = video_data
+    video_cache_stats['bytes'] += len(video_data)
+    while video_cache_stats['bytes'] > VIDEO_CACHE_MAX_BYTES:
+        _, evicted = video_cache.popitem(last=False)
+        video_cache_stats['bytes'] -= len(evicted)
+        video_cache_stats['evictions'] += 1
+
+def video_cache_id(lead_id: int, updated_at: Optional[datetime], storage_backend: Optional[str], storage_key: Optional[str], total_size: int) -> Optional[Tuple[Any, ...]]:
+    '''Cache identity of a video's bytes: a stored blob never changes, an inline video changes with the lead; None when unknown'''
+    if storage_key:
+        return (storage_backend, storage_key, total_size)
+    if updated_at:
+        return (lead_id, updated_at)
+    return None
+
+def read_video_cached(conn, lead_id: int, storage_backend: Optional[str], storage_key: Optional[str], cache_id: Optional[Tuple[Any, ...]], offset: int, length: int) -> Tuple[bytes, bool]:
+    '''Read a slice of a video through the block cache; returns the bytes and whether every block was cached'''
+    if cache_id is None or length <= 0:
+        return read_video(conn, lead_id, storage_backend, storage_key, offset, length), False
+    
+    first_block = offset // STORAGE_BLOCK_SIZE
+    last_block = (offset + length - 1) // STORAGE_BLOCK_SIZE
+    blocks = [cache_get((cache_id, index)) for index in range(first_block, last_block + 1)]
+    missing = [index for index, block in enumerate(blocks, first_block) if block is None]
+    if missing:
+        # One storage read covers every block from the first missing to the last missing one
+        read_from, read_to = missing[0], missing[-1]
+        video_data = read_video(conn, lead_id, storage_backend, storage_key,
+                                read_from * STORAGE_BLOCK_SIZE, (read_to - read_from + 1) * STORAGE_BLOCK_SIZE)
+        for index in range(read_from, read_to + 1):
+            block = video_data[(index - read_from) * STORAGE_BLOCK_SIZE:(index - read_from + 1) * STORAGE_BLOCK_SIZE]
+            if not block:
+                break
+            blocks[index - first_block] = block
+            cache_put((cache_id, index), block)
+    
+    skip = offset - first_block * STORAGE_BLOCK_SIZE
+    return b''.join(block for block in blocks if block)[skip:skip + length], not missing
+
+def video_etag(lead_id: str, updated_at: Optional[datetime], blob_sha256: Optional[str], variant: str = '') -> str:
+    '''Strong ETag from the content hash when known, otherwise from lead id and last update time'''
+    version = blob_sha256 or f"{lead_id}-{int(updated_at.timestamp() * 1000000) if updated_at else 0}"
+    return f'"{version}{variant}"'
+
+def signed_playback_etag(storage_backend: str, storage_key: str, total_size: int) -> str:
+    '''Strong ETag for a signed playback URL; the signed storage key and size pin the content, whatever the expiry'''
+    return '"' + hashlib.sha256(f'{storage_backend}:{storage_key}:{total_size}'.encode('utf-8')).hexdigest()[:32] + '"'
+
+def is_not_modified(headers: Dict[str, Any], etag: str) -> bool:
+    '''Check If-None-Match against the current ETag'''
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+
+def parse_range(range_header: str, total_size: int) -> Optional[Tuple[int, int]]:
+    '''Parse the first range of a "bytes=" Range header into inclusive (start, end), capped at MAX_RANGE_BYTES'''
+    units, _, spec = range_header.partition('=')
+    if units.strip().lower() != 'bytes' or total_size <= 0:
+        return None
+    first, _, last = spec.split(',')[0].strip().partition('-')
+    try:
+        if first == '':
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix <= 0:
+                return None
+            start, end = max(total_size - suffix, 0), total_size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else total_size - 1
+    except ValueError:
+        return None
+    if start >= total_size or end < start:
+        return None
+    return start, min(end, total_size - 1, start + MAX_RANGE_BYTES - 1)
+
+def read_video(conn, lead_id: int, storage_backend: Optional[str], storage_key: Optional[str], offset: int = 0, length: int = -1) -> bytes:
+    '''Read a video or a slice of it from its blob store, or from the legacy video_data column'''
+    if storage_key:
+        return get_blob_store(conn, storage_backend).read(storage_key, offset, length)
+    with conn.cursor() as cursor:
+        if length < 0:
+            cursor.execute("SELECT substring(video_data from %s) FROM video_leads WHERE id = %s", (offset + 1, lead_id))
+        else:
+            cursor.execute("SELECT substring(video_data from %s for %s) FROM video_leads WHERE id = %s", (offset + 1, length, lead_id))
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b''
+
+def serve_video_range(conn, lead_id: int, range_header: str, content_type: str, total_size: int, storage_backend: Optional[str] = None, storage_key: Optional[str] = None, cache_id: Optional[Tuple[Any, ...]] = None) -> Dict[str, Any]:
+    '''Return a 206 response with only the requested slice of the video, read through the block cache'''
+    byte_range = parse_range(range_header, total_size or 0)
+    if byte_range:
+        start, end = byte_range
+        video_slice, cached = read_video_cached(conn, lead_id, storage_backend, storage_key, cache_id, start, end - start + 1)
+    if not byte_range or not video_slice:
+        return {
+            'statusCode': 416,
+            'headers': {'Content-Range': f'bytes */{total_size or 0}', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': ''
+        }
+    
+    # Headers describe the bytes actually read; stored videos shorter than their recorded size end early
+    end = start + len(video_slice) - 1
+    
+    return {
+        'statusCode': 206,
+        'headers': {
+            'Content-Type': content_type or 'video/mp4',
+            'Content-Range': f'bytes {start}-{end}/{total_size}',
+            'Content-Length': str(len(video_slice)),
+            'Accept-Ranges': 'bytes',
+            'X-Cache': 'HIT' if cached else 'MISS',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag, X-Cache, Content-Range, Content-Length, Accept-Ranges'
+        },
+        'isBase64Encoded': True,
+        'body': base64.b64encode(video_slice).decode('ascii')
+    }
+
+def sign_playback(lead_id: int, storage_backend: str, storage_key: str, total_size: int, content_type: str, expires: int) -> str:
+    '''HMAC-SHA256 signature binding a playback URL to one stored video and an expiry time'''
+    secret = os.environ.get('PLAYBACK_URL_SECRET') or os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+    message = f'{lead_id}:{storage_backend}:{storage_key}:{total_size}:{content_type}:{expires}'.encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def playback_url_response(lead_id: str, storage_backend: Optional[str], storage_key: Optional[str], total_size: int, content_type: str, hls_created_at: Optional[datetime] = None) -> Dict[str, Any]:
+    '''Issue a short-lived signed query string that a <video> element can use without X-Auth-Token'''
+    expires = int(time.time()) + PLAYBACK_URL_TTL_SECONDS
+    content_type = content_type or 'video/mp4'
+    params = {
+        'id': int(lead_id),
+        'store': storage_backend or '',
+        'key': storage_key or '',
+        'size': total_size,
+        'type': content_type,
+        'expires': expires
+    }
+    params['sig'] = sign_playback(params['id'], params['store'], params['key'], total_size, content_type, expires)
+    
+    body = {
+        'playback_query': urlencode(params),
+        'expires_at': expires,
+        'content_type': content_type,
+        'size': total_size
+    }
+    if hls_created_at:
+        body['hls_query'] = hls_playlist_query(int(lead_id), int(hls_created_at.timestamp()))
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps(body)
+    }
+
+def serve_signed_playback(event: Dict[str, Any], query_params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Serve a signed playback URL; only the signature and expiry are checked, users and leads are not queried'''
+    try:
+        lead_id = int(query_params['id'])
+        total_size = int(query_params['size'])
+        expires = int(query_params['expires'])
+    except (KeyError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Invalid playback URL'})
+        }
+    
+    storage_backend = query_params.get('store', '')
+    storage_key = query_params.get('key', '')
+    content_type = query_params.get('type', 'video/mp4')
+    expected_sig = sign_playback(lead_id, storage_backend, storage_key, total_size, content_type, expires)
+    if not hmac.compare_digest(expected_sig, query_params.get('sig', '')):
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Invalid playback signature'})
+        }
+    
+    remaining = expires - int(time.time())
+    if remaining <= 0:
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Playback URL expired'})
+        }
+    
+    headers = event.get('headers', {}) or {}
+    range_header = headers.get('Range') or headers.get('range')
+    
+    # The signature pins the content, so any cache may keep it until the URL expires
+    etag = signed_playback_etag(storage_backend, storage_key, total_size)
+    if is_not_modified(headers, etag):
+        return {
+            'statusCode': 304,
+            'headers': {'ETag': etag, 'Cache-Control': f'public, max-age={remaining}', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': ''
+        }
+    
+    cache_id = video_cache_id(lead_id, None, storage_backend, storage_key, total_size)
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        if range_header:
+            response = serve_video_range(conn, lead_id, range_header, content_type, total_size, storage_backend, storage_key, cache_id)
+        else:
+            # Plain GET (e.g. a download via fetch): only the first range, capped like any other,
+            # and read past the block cache so one download cannot evict what players are using
+            response = serve_video_range(conn, lead_id, 'bytes=0-', content_type, total_size, storage_backend, storage_key, None)
+    finally:
+        conn.close()
+    
+    if response['statusCode'] == 206:
+        response['headers']['ETag'] = etag
+    response['headers']['Cache-Control'] = f'public, max-age={remaining}'
+    return response
+
+def sign_asset(lead_id: int, kind: str, version: int, expires: int) -> str:
+    '''HMAC-SHA256 signature binding a poster/thumbnail/HLS URL to one lead asset version and an expiry time'''
+    secret = os.environ.get('PLAYBACK_URL_SECRET') or os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+    message = f'asset:{lead_id}:{kind}:{version}:{expires}'.encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def hls_playlist_query(lead_id: int, version: int, ttl: int = PLAYBACK_URL_TTL_SECONDS) -> str:
+    '''Signed query string for a lead's HLS playlist, or with a longer ttl for the segment URIs inside it'''
+    expires = int(time.time()) + ttl
+    params = {'id': lead_id, 'asset': 'hls', 'v': version, 'expires': expires}
+    params['sig'] = sign_asset(lead_id, 'hls', version, expires)
+    return urlencode(params)
+
+def serve_hls(lead_id: int, query_params: Dict[str, Any], remaining: int) -> Dict[str, Any]:
+    '''Serve an HLS media playlist built from stored segment rows, or one segment of it when ?segment= is given'''
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        with conn.cursor() as cursor:
+            if 'segment' in query_params:
+                try:
+                    segment_index = int(query_params['segment'])
+                except ValueError:
+                    segment_index = -1
+                cursor.execute("SELECT storage_backend, storage_key FROM video_hls_segments WHERE lead_id = %s AND segment_index = %s", 
+                               (lead_id, segment_index))
+                segment = cursor.fetchone()
+                segment_data = get_blob_store(conn, segment[0]).read(segment[1]) if segment else None
+            else:
+                cursor.execute("SELECT target_duration FROM video_hls_renditions WHERE lead_id = %s", (lead_id,))
+                rendition = cursor.fetchone()
+                cursor.execute("SELECT segment_index, duration FROM video_hls_segments WHERE lead_id = %s ORDER BY segment_index", (lead_id,))
+                segments = cursor.fetchall()
+    finally:
+        conn.close()
+    
+    if 'segment' in query_params:
+        if segment_data is None:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Segment not found'})
+            }
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'video/mp2t',
+                'Cache-Control': f'public, max-age={remaining}',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'isBase64Encoded': True,
+            'body': base64.b64encode(segment_data).decode('ascii')
+        }
+    
+    if not rendition or not segments:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'HLS rendition not found'})
+        }
+    
+    # Segment URIs are relative to the playlist URL and signed for this fetch, not with the playlist's own expiry
+    total_duration = sum(duration for _, duration in segments)
+    signed_query = hls_playlist_query(lead_id, int(query_params['v']), max(HLS_SEGMENT_URL_TTL_SECONDS, int(total_duration * 2)))
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{rendition[0]}', '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:VOD']
+    for segment_index, duration in segments:
+        lines.append(f'#EXTINF:{duration:.3f},')
+        lines.append(f'?{signed_query}&segment={segment_index}')
+    lines.append('#EXT-X-ENDLIST')
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/vnd.apple.mpegurl',
+            'Cache-Control': f'public, max-age={remaining}',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'isBase64Encoded': False,
+        'body': '\n'.join(lines) + '\n'
+    }
+
+def serve_signed_asset(query_params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Serve a precomputed poster, thumbnail or HLS rendition from a signed URL; images are small, so no range support'''
+    try:
+        lead_id = int(query_params['id'])
+        kind = query_params['asset']
+        version = int(query_params['v'])
+        expires = int(query_params['expires'])
+    except (KeyError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Invalid asset URL'})
+        }
+    
+    remaining = expires - int(time.time())
+    if not hmac.compare_digest(sign_asset(lead_id, kind, version, expires), query_params.get('sig', '')) or remaining <= 0:
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Invalid or expired asset URL'})
+        }
+    
+    if kind == 'hls':
+        return serve_hls(lead_id, query_params, remaining)
+    
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT content_type, data FROM video_lead_assets WHERE lead_id = %s AND kind = %s", (lead_id, kind))
+            asset = cursor.fetchone()
+    finally:
+        conn.close()
+    
+    if not asset:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Asset not found'})
+        }
+    
+    content_type, data = asset
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': content_type,
+            # The URL carries the asset version, so the image never changes under it
+            'Cache-Control': f'public, max-age={remaining}, immutable',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'isBase64Encoded': True,
+        'body': base64.b64encode(data).decode('ascii')
+    }
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Admin video access - serve any video file from database
@@ -29,7 +525,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, Range, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'isBase64Encoded': False,
@@ -45,6 +541,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
+        # Signed playback and poster/thumbnail URLs carry their own authorization
+        query_params = event.get('queryStringParameters', {}) or {}
+        if query_params.get('sig') and query_params.get('asset'):
+            return serve_signed_asset(query_params)
+        if query_params.get('sig'):
+            return serve_signed_playback(event, query_params)
+        
         # Get auth token from headers
         headers = event.get('headers', {})
         auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
@@ -80,6 +583,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         query_params = event.get('queryStringParameters', {}) or {}
         lead_id = query_params.get('id')
         
+        if query_params.get('action') == 'cache_stats':
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({
+                    **video_cache_stats,
+                    'entries': len(video_cache),
+                    'max_bytes': VIDEO_CACHE_MAX_BYTES
+                })
+            }
+        
         if not lead_id:
             return {
                 'statusCode': 400,
@@ -93,15 +608,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         conn = psycopg2.connect(db_url)
         cursor = conn.cursor()
         
-        # Admin can access any video
+        # Metadata first; bytes are read only when needed
         cursor.execute("""
-            SELECT video_data, video_content_type, video_filename
-            FROM video_leads 
-            WHERE id = %s
+            SELECT l.video_content_type, COALESCE(l.video_size, octet_length(l.video_data)), l.video_filename, l.updated_at, l.blob_sha256,
+                COALESCE(b.storage_backend, CASE WHEN l.video_oid IS NOT NULL THEN 'postgres' END), COALESCE(b.storage_key, l.video_oid::text)
+            FROM video_leads l LEFT JOIN video_blobs b ON b.sha256 = l.blob_sha256
+            WHERE l.id = %s
         """, (lead_id,))
         
-        result = cursor.fetchone()
-        if not result:
+        video_meta = cursor.fetchone()
+        if not video_meta or not video_meta[1]:
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -109,30 +625,62 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Video not found'})
             }
         
-        video_data, content_type, filename = result
+        content_type, total_size, filename, updated_at, blob_sha256, storage_backend, storage_key = video_meta
+        range_header = headers.get('Range') or headers.get('range')
+        
+        if query_params.get('action') == 'playback_url':
+            cursor.execute("SELECT created_at FROM video_hls_renditions WHERE lead_id = %s", (lead_id,))
+            hls_rendition = cursor.fetchone()
+            return playback_url_response(lead_id, storage_backend, storage_key, total_size, content_type, hls_rendition[0] if hls_rendition else None)
         
-        if not video_data:
+        # Byte ranges and the data URL JSON are different representations, so their ETags differ
+        is_range = bool(range_header) or query_params.get('mode') == 'range'
+        etag = video_etag(lead_id, updated_at, blob_sha256, '' if is_range else '-json')
+        if is_not_modified(headers, etag):
             return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'statusCode': 304,
+                'headers': {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Access-Control-Allow-Origin': '*'},
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'No video data found'})
+                'body': ''
             }
         
-        # Return video as base64 data URL
-        video_base64 = base64.b64encode(video_data).decode('utf-8')
-        data_url = f"data:{content_type};base64,{video_base64}"
+        cache_id = video_cache_id(int(lead_id), updated_at, storage_backend, storage_key, total_size)
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({
-                'video_url': data_url,
-                'filename': filename,
-                'content_type': content_type
+        if is_range:
+            # Byte-range mode: only the requested slice is read and sent
+            response = serve_video_range(conn, int(lead_id), range_header or 'bytes=0-', content_type, total_size, storage_backend, storage_key, cache_id)
+        else:
+            video_data, cached = read_video_cached(conn, int(lead_id), storage_backend, storage_key, cache_id, 0, total_size)
+            if not video_data:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'No video data found'})
+                }
+            
+            # Return video as base64 data URL
+            video_base64 = base64.b64encode(video_data).decode('utf-8')
+            data_url = f"data:{content_type};base64,{video_base64}"
+            
+            response = {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'X-Cache': 'HIT' if cached else 'MISS', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({
+                    'video_url': data_url,
+                    'filename': filename,
+                    'content_type': content_type
+                })
+            }
+        
+        if response['statusCode'] in (200, 206):
+            response['headers'].update({
+                'ETag': etag,
+                'Cache-Control': 'private, no-cache',
+                'Access-Control-Expose-Headers': 'ETag, X-Cache, Content-Range, Content-Length, Accept-Ranges'
             })
-        }
+        return response
     
     except Exception as e:
         return {
@@ -2,13 +2,149 @@ import json
 import os
 import jwt
 import psycopg2
-from typing import Dict, Any, Optional
+import base64
+import hashlib
+import hmac
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+from typing import Dict, Any, Optional, List, Tuple
+
+# Signed poster/thumbnail URLs stay the same for a whole window so browsers keep the images cached
+ASSET_URL_TTL_SECONDS = int(os.environ.get('ASSET_URL_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Full-text search: the query matches both the Russian and the English half of search_vector; results are capped
+LEADS_SEARCH_QUERY = "websearch_to_tsquery('russian', %s) || websearch_to_tsquery('english', %s)"
+SEARCH_HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "'
+SEARCH_MAX_RESULTS = 200
+
+# Lead columns shared by the per-user leads page and search results (aliases: vl lead, thumbnail/poster assets)
+LEAD_COLUMNS = """
+    vl.id, vl.title, vl.comments, vl.created_at, vl.video_filename, vl.video_content_type, vl.video_size,
+    vl.video_duration_ms, vl.video_width, vl.video_height, vl.video_codec, vl.audio_codec,
+    thumbnail.created_at, poster.created_at
+"""
+
+# User summaries: lead counts come from one aggregate per user on the page, so listing users never loads their leads
+USER_COLUMNS = "u.id, u.name, u.email, u.created_at, stats.lead_count, stats.video_count, stats.last_lead_at"
+USER_STATS_JOIN = """
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS lead_count, COUNT(video_filename) AS video_count, MAX(created_at) AS last_lead_at
+        FROM video_leads WHERE user_id = u.id
+    ) stats ON TRUE
+"""
+
+# Page sizes for the users list and for one user's leads: default when ?limit is absent, and the most one page may hold
+USERS_PAGE_SIZE = 50
+LEADS_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Dashboard totals come from planner statistics (pg_class.reltuples); tables estimated below this many rows are counted exactly
+EXACT_COUNT_MAX_ROWS = 10000
+
+def sign_asset(lead_id: int, kind: str, version: int, expires: int) -> str:
+    '''HMAC-SHA256 signature binding a poster/thumbnail URL to one lead asset version and an expiry time'''
+    secret = os.environ.get('PLAYBACK_URL_SECRET') or os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+    message = f'asset:{lead_id}:{kind}:{version}:{expires}'.encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def asset_query(lead_id: int, kind: str, created_at: datetime) -> str:
+    '''Signed query string for a lead's poster or thumbnail, identical within one ASSET_URL_TTL_SECONDS window'''
+    version = int(created_at.timestamp())
+    expires = (int(time.time()) // ASSET_URL_TTL_SECONDS + 2) * ASSET_URL_TTL_SECONDS
+    params = {'id': lead_id, 'asset': kind, 'v': version, 'expires': expires}
+    params['sig'] = sign_asset(lead_id, kind, version, expires)
+    return urlencode(params)
+
+def dashboard_totals(cursor) -> Dict[str, Any]:
+    '''User, lead and video totals without scanning large tables; 'estimated' tells whether any figure is approximate'''
+    cursor.execute("""
+        SELECT c.relname, c.reltuples, s.null_frac
+        FROM pg_class c
+        LEFT JOIN pg_stats s ON s.schemaname = c.relnamespace::regnamespace::text AND s.tablename = c.relname AND s.attname = 'video_filename'
+        WHERE c.oid IN ('users'::regclass, 'video_leads'::regclass)
+    """)
+    # reltuples is -1 (or 0 on older servers) until the table is first analyzed
+    estimates = {relname: (max(reltuples, 0), null_frac or 0) for relname, reltuples, null_frac in cursor.fetchall()}
+    users_estimate = estimates['users'][0]
+    leads_estimate, filename_null_frac = estimates['video_leads']
+    estimated = False
+    
+    if users_estimate < EXACT_COUNT_MAX_ROWS:
+        cursor.execute("SELECT COUNT(*) FROM users")
+        total_users = cursor.fetchone()[0]
+    else:
+        total_users = int(users_estimate)
+        estimated = True
+    
+    if leads_estimate < EXACT_COUNT_MAX_ROWS:
+        cursor.execute("SELECT COUNT(*), COUNT(video_filename) FROM video_leads")
+        total_leads, total_videos = cursor.fetchone()
+    else:
+        total_leads = int(leads_estimate)
+        total_videos = round(leads_estimate * (1 - filename_null_frac))
+        estimated = True
+    
+    return {'total_users': total_users, 'total_leads': total_leads, 'total_videos': total_videos, 'estimated': estimated}
+
+def encode_page_cursor(created_at: datetime, row_id: int) -> str:
+    '''Opaque keyset cursor for the position right after (created_at, id)'''
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), row_id]).encode('utf-8')).decode('ascii')
+
+def decode_page_cursor(cursor_value: str) -> Tuple[datetime, int]:
+    '''Position encoded by encode_page_cursor; raises ValueError for anything else'''
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor_value.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+def build_lead(row: Tuple) -> Dict[str, Any]:
+    '''Lead dict from the LEAD_COLUMNS part of a row, plus search rank and snippets when the row has them'''
+    (lead_id, lead_title, lead_comments, lead_created_at, video_filename, video_content_type, video_size, video_duration_ms,
+     video_width, video_height, video_codec, audio_codec, thumbnail_at, poster_at, search_rank, title_snippet, comments_snippet) = row
+    lead_data = {
+        'id': lead_id,
+        'title': lead_title,
+        'comments': lead_comments,
+        'created_at': lead_created_at.isoformat() if lead_created_at else None,
+        'video_filename': video_filename,
+        'has_video': bool(video_filename),
+        # Probed at ingest, so the panel can describe a video without fetching it
+        'video_content_type': video_content_type,
+        'video_size': video_size,
+        'video_duration_ms': video_duration_ms,
+        'video_width': video_width,
+        'video_height': video_height,
+        'video_codec': video_codec,
+        'audio_codec': audio_codec,
+        # Signed query strings for the admin-video function; absent until the asset worker has run
+        'thumbnail_query': asset_query(lead_id, 'thumbnail', thumbnail_at) if thumbnail_at else None,
+        'poster_query': asset_query(lead_id, 'poster', poster_at) if poster_at else None
+    }
+    if search_rank is not None:
+        # Snippets mark matches with <mark>…</mark>; the rest is plain text
+        lead_data.update({'search_rank': search_rank, 'title_snippet': title_snippet, 'comments_snippet': comments_snippet})
+    return lead_data
+
+def build_user(row: Tuple) -> Dict[str, Any]:
+    '''User summary dict from (id, name, email, created_at, lead_count, video_count, last_lead_at)'''
+    user_id, user_name, user_email, user_created_at, lead_count, video_count, last_lead_at = row
+    return {
+        'id': user_id,
+        'name': user_name,
+        'email': user_email,
+        'created_at': user_created_at.isoformat() if user_created_at else None,
+        'lead_count': lead_count,
+        'video_count': video_count,
+        'last_lead_at': last_lead_at.isoformat() if last_lead_at else None
+    }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Admin panel API for viewing all user data and videos
-    Args: event with httpMethod, headers with X-Auth-Token
-    Returns: All users data with their videos and comments
+    Business: Admin panel API: paginated users with lead counts, one user's leads, or full-text search over all leads
+    Args: event with httpMethod, headers with X-Auth-Token, query params limit/cursor, user_id (that user's leads) or search
+    Returns: A page of users (statistics with the first page), a page of one user's leads, or users with their matching leads
     '''
     method: str = event.get('httpMethod', 'GET')
     
@@ -69,84 +205,120 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Invalid token'})
             }
         
+        query_params = event.get('queryStringParameters') or {}
+        search = (query_params.get('search') or '').strip()
+        
+        try:
+            default_size = LEADS_PAGE_SIZE if query_params.get('user_id') else USERS_PAGE_SIZE
+            page_size = min(max(int(query_params.get('limit', default_size)), 1), MAX_PAGE_SIZE)
+            after = decode_page_cursor(query_params['cursor']) if query_params.get('cursor') else None
+            owner_id = int(query_params['user_id']) if query_params.get('user_id') else None
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': str(e)})
+            }
+        
         # Connect to database
         db_url = os.environ.get('DATABASE_URL')
         conn = psycopg2.connect(db_url)
         cursor = conn.cursor()
         
-        # Get all users with their leads
-        cursor.execute("""
-            SELECT 
-                u.id as user_id,
-                u.name as user_name, 
-                u.email as user_email,
-                u.created_at as user_created_at,
-                vl.id as lead_id,
-                vl.title as lead_title,
-                vl.comments as lead_comments,
-                vl.created_at as lead_created_at,
-                vl.video_filename
-            FROM users u
-            LEFT JOIN video_leads vl ON u.id = vl.user_id
-            ORDER BY u.created_at DESC, vl.created_at DESC
-        """)
-        
-        results = cursor.fetchall()
-        
-        # Organize data by users
-        users_data = {}
-        
-        for row in results:
-            user_id, user_name, user_email, user_created_at, lead_id, lead_title, lead_comments, lead_created_at, video_filename = row
+        if owner_id is not None:
+            # One page of a single user's leads, newest first, walking idx_video_leads_user_created_id
+            cursor.execute(f"""
+                SELECT {LEAD_COLUMNS}, NULL, NULL, NULL
+                FROM video_leads vl
+                LEFT JOIN video_lead_assets thumbnail ON thumbnail.lead_id = vl.id AND thumbnail.kind = 'thumbnail'
+                LEFT JOIN video_lead_assets poster ON poster.lead_id = vl.id AND poster.kind = 'poster'
+                WHERE vl.user_id = %s AND (%s OR (vl.created_at, vl.id) < (%s, %s))
+                ORDER BY vl.created_at DESC, vl.id DESC
+                LIMIT %s
+            """, (owner_id, after is None, after[0] if after else None, after[1] if after else None, page_size + 1))
             
-            # Create user entry if not exists
-            if user_id not in users_data:
-                users_data[user_id] = {
-                    'id': user_id,
-                    'name': user_name,
-                    'email': user_email,
-                    'created_at': user_created_at.isoformat() if user_created_at else None,
-                    'leads': []
-                }
+            rows = cursor.fetchall()
+            next_cursor = encode_page_cursor(rows[page_size - 1][3], rows[page_size - 1][0]) if len(rows) > page_size else None
             
-            # Add lead if exists
-            if lead_id:
-                lead_data = {
-                    'id': lead_id,
-                    'title': lead_title,
-                    'comments': lead_comments,
-                    'created_at': lead_created_at.isoformat() if lead_created_at else None,
-                    'video_filename': video_filename,
-                    'has_video': bool(video_filename)
-                }
-                users_data[user_id]['leads'].append(lead_data)
-        
-        # Convert to list
-        users_list = list(users_data.values())
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({
+                    'success': True,
+                    'leads': [build_lead(row) for row in rows[:page_size]],
+                    'next_cursor': next_cursor
+                })
+            }
         
-        # Get total statistics
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
+        if search:
+            # Best-matching leads across all users via the GIN-indexed search_vector, grouped under their users below
+            cursor.execute(f"""
+                WITH matches AS (
+                    SELECT vl.id, ts_rank_cd(vl.search_vector, q.query) AS rank, q.query
+                    FROM video_leads vl, (SELECT {LEADS_SEARCH_QUERY} AS query) q
+                    WHERE vl.search_vector @@ q.query
+                    ORDER BY rank DESC, vl.created_at DESC, vl.id DESC
+                    LIMIT %s
+                )
+                SELECT 
+                    vl.user_id,
+                    {LEAD_COLUMNS},
+                    m.rank,
+                    ts_headline('russian', vl.title, m.query, %s),
+                    ts_headline('russian', vl.comments, m.query, %s)
+                FROM matches m
+                JOIN video_leads vl ON vl.id = m.id
+                LEFT JOIN video_lead_assets thumbnail ON thumbnail.lead_id = vl.id AND thumbnail.kind = 'thumbnail'
+                LEFT JOIN video_lead_assets poster ON poster.lead_id = vl.id AND poster.kind = 'poster'
+                ORDER BY m.rank DESC, vl.created_at DESC, vl.id DESC
+            """, (search, search, SEARCH_MAX_RESULTS, SEARCH_HEADLINE_OPTIONS, SEARCH_HEADLINE_OPTIONS))
+            
+            matched_leads: Dict[int, List[Dict[str, Any]]] = {}
+            for row in cursor.fetchall():
+                matched_leads.setdefault(row[0], []).append(build_lead(row[1:]))
+            
+            # Users in order of their best match, each carrying only the matching leads
+            cursor.execute(f"""
+                SELECT {USER_COLUMNS}
+                FROM users u
+                {USER_STATS_JOIN}
+                WHERE u.id = ANY(%s)
+            """, (list(matched_leads),))
+            
+            summaries = {row[0]: build_user(row) for row in cursor.fetchall()}
+            users_list = [{**summaries[user_id], 'leads': leads} for user_id, leads in matched_leads.items() if user_id in summaries]
+            next_cursor = None
+        else:
+            # One page of users, newest first; leads are fetched per user with ?user_id
+            cursor.execute(f"""
+                SELECT {USER_COLUMNS}
+                FROM (
+                    SELECT id, name, email, created_at FROM users
+                    WHERE %s OR (created_at, id) < (%s, %s)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                ) u
+                {USER_STATS_JOIN}
+                ORDER BY u.created_at DESC, u.id DESC
+            """, (after is None, after[0] if after else None, after[1] if after else None, page_size + 1))
+            
+            rows = cursor.fetchall()
+            next_cursor = encode_page_cursor(rows[page_size - 1][3], rows[page_size - 1][0]) if len(rows) > page_size else None
+            users_list = [build_user(row) for row in rows[:page_size]]
         
-        cursor.execute("SELECT COUNT(*) FROM video_leads")
-        total_leads = cursor.fetchone()[0]
+        response_body: Dict[str, Any] = {'success': True, 'users': users_list, 'next_cursor': next_cursor}
         
-        cursor.execute("SELECT COUNT(*) FROM video_leads WHERE video_filename IS NOT NULL")
-        total_videos = cursor.fetchone()[0]
+        # Totals only with the first page; later pages are appended under the same numbers
+        if after is None:
+            response_body['statistics'] = dashboard_totals(cursor)
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'isBase64Encoded': False,
-            'body': json.dumps({
-                'success': True,
-                'statistics': {
-                    'total_users': total_users,
-                    'total_leads': total_leads,
-                    'total_videos': total_videos
-                },
-                'users': users_list
-            })
+            'body': json.dumps(response_body)
         }
     
     except Exception as e:
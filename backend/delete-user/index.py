@@ -1,11 +1,109 @@
 import json
 import os
 import re
-from typing import Dict, Any
+import uuid
+from typing import Dict, Any, Optional, Iterable, Iterator
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import jwt
 
+# Where new video bytes are stored: 'postgres' (large objects) or 'local' (files under VIDEO_STORAGE_DIR)
+VIDEO_STORAGE_BACKEND = os.environ.get('VIDEO_STORAGE_BACKEND', 'postgres')
+VIDEO_STORAGE_DIR = os.environ.get('VIDEO_STORAGE_DIR', '/var/lib/video-leads')
+# Block size for hashing and copying videos without loading them whole
+STORAGE_BLOCK_SIZE = 1024 * 1024
+
+class PostgresBlobStore:
+    '''Video bytes in Postgres large objects, outside the video_leads rows; the key is the object OID'''
+    name = 'postgres'
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        video_object = self.conn.lobject(0, 'wb')
+        try:
+            for block in blocks:
+                video_object.write(bytes(block))
+            return str(video_object.oid)
+        finally:
+            video_object.close()
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            video_object.seek(offset)
+            return video_object.read(length)
+        finally:
+            video_object.close()
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            while True:
+                block = video_object.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+        finally:
+            video_object.close()
+    
+    def delete(self, key: str) -> None:
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT lo_unlink(%s)", (int(key),))
+
+class LocalBlobStore:
+    '''Video bytes as files under a local directory; the key is the path relative to it'''
+    name = 'local'
+    
+    def __init__(self, root: str):
+        self.root = root
+    
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        # Every write gets its own file, like a new large object OID, so deleting the key of one
+        # dropped row never removes bytes that a concurrent upload of the same content just wrote
+        key = f'{content_hash[:2]}/{content_hash}-{uuid.uuid4().hex}'
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so readers never see a partial file
+        partial_path = f'{path}.partial'
+        with open(partial_path, 'wb') as video_file:
+            for block in blocks:
+                video_file.write(block)
+        os.replace(partial_path, path)
+        return key
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        with open(self.path(key), 'rb') as video_file:
+            video_file.seek(offset)
+            return video_file.read(length)
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        with open(self.path(key), 'rb') as video_file:
+            while True:
+                block = video_file.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+    
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+def get_blob_store(conn, backend: Optional[str] = None):
+    '''Blob store for a backend name, VIDEO_STORAGE_BACKEND by default'''
+    backend = backend or VIDEO_STORAGE_BACKEND
+    if backend == 'postgres':
+        return PostgresBlobStore(conn)
+    if backend == 'local':
+        return LocalBlobStore(VIDEO_STORAGE_DIR)
+    raise ValueError(f"Unknown video storage backend: {backend}")
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Admin endpoint to delete and edit user accounts
@@ -166,18 +264,49 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         # Delete all related data in correct order (foreign key dependencies)
         # Delete video_leads first
         print("Deleting video_leads...")
+        # Lock first: a store job moving one of these videos into the blob store finishes before we look at it
+        cursor.execute(f"SELECT id FROM t_p72874800_user_registration_vi.video_leads WHERE user_id = {user_id} ORDER BY id FOR UPDATE")
+        cursor.execute(f"SELECT lo_unlink(video_oid) FROM t_p72874800_user_registration_vi.video_leads WHERE user_id = {user_id} AND video_oid IS NOT NULL AND blob_sha256 IS NULL")
+        cursor.execute(f"""
+            UPDATE t_p72874800_user_registration_vi.video_blobs vb SET ref_count = vb.ref_count - released.refs
+            FROM (
+                SELECT blob_sha256, COUNT(*) AS refs FROM t_p72874800_user_registration_vi.video_leads 
+                WHERE user_id = {user_id} AND blob_sha256 IS NOT NULL GROUP BY blob_sha256
+            ) released
+            WHERE vb.sha256 = released.blob_sha256
+        """)
+        cursor.execute(f"""
+            SELECT s.storage_backend, s.storage_key FROM t_p72874800_user_registration_vi.video_hls_segments s 
+            JOIN t_p72874800_user_registration_vi.video_leads l ON l.id = s.lead_id WHERE l.user_id = {user_id}
+        """)
+        hls_segments = cursor.fetchall()
         cursor.execute(f"DELETE FROM t_p72874800_user_registration_vi.video_leads WHERE user_id = {user_id}")
         leads_deleted = cursor.rowcount
         print(f"Deleted {leads_deleted} video_leads")
         
-        # Delete chunked uploads (simpler approach)
+        # Delete video blobs no lead references any more
+        cursor.execute("DELETE FROM t_p72874800_user_registration_vi.video_blobs WHERE ref_count <= 0 RETURNING storage_backend, storage_key")
+        dropped_blobs = cursor.fetchall() + hls_segments
+        
+        # Delete buffered chunks and partially assembled videos of the user's upload sessions
+        print("Deleting upload_chunks...")
+        cursor.execute(f"SELECT lo_unlink(video_oid) FROM t_p72874800_user_registration_vi.chunked_uploads WHERE user_id = {user_id} AND video_oid IS NOT NULL")
+        cursor.execute(f"DELETE FROM t_p72874800_user_registration_vi.upload_chunks WHERE upload_id IN (SELECT upload_id FROM t_p72874800_user_registration_vi.chunked_uploads WHERE user_id = {user_id})")
+        chunks_deleted = cursor.rowcount
+        print(f"Deleted {chunks_deleted} upload_chunks")
+        
+        # Delete chunked uploads
         print("Deleting chunked_uploads...")
         cursor.execute(f"DELETE FROM t_p72874800_user_registration_vi.chunked_uploads WHERE user_id = {user_id}")
         uploads_deleted = cursor.rowcount
         print(f"Deleted {uploads_deleted} chunked_uploads")
         
-        # Set chunks_deleted to 0 for now (since upload_chunks is complex)
-        chunks_deleted = 0
+        # Delete the user's export archives
+        cursor.execute(f"DELETE FROM t_p72874800_user_registration_vi.video_exports WHERE user_id = {user_id} RETURNING storage_backend, storage_key")
+        dropped_blobs += cursor.fetchall()
+        
+        # Delete stored idempotent responses
+        cursor.execute(f"DELETE FROM t_p72874800_user_registration_vi.idempotency_keys WHERE user_id = {user_id}")
         
         # Finally delete the user
         print("Deleting user...")
@@ -187,6 +316,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         # Commit all changes
         conn.commit()
         
+        # Remove the bytes of dropped blobs, HLS segments and exports only once no row points at them
+        for blob in dropped_blobs:
+            get_blob_store(conn, blob['storage_backend']).delete(blob['storage_key'])
+        conn.commit()
+        
         result = {
             'success': True,
             'message': f'User {user["name"]} ({user["email"]}) deleted successfully',
@@ -3,8 +3,80 @@ import os
 import jwt
 import psycopg2
 import base64
+import hashlib
+import hmac
+import io
+import csv
+import re
+import struct
+import tempfile
+import time
+import zlib
+import uuid
 from datetime import datetime
-from typing import Dict, Any, Optional
+from urllib.parse import urlencode, unquote
+from typing import Dict, Any, Optional, List, Iterable, Iterator, Tuple, IO
+
+# Where new video bytes are stored: 'postgres' (large objects) or 'local' (files under VIDEO_STORAGE_DIR)
+VIDEO_STORAGE_BACKEND = os.environ.get('VIDEO_STORAGE_BACKEND', 'postgres')
+VIDEO_STORAGE_DIR = os.environ.get('VIDEO_STORAGE_DIR', '/var/lib/video-leads')
+# Block size for hashing and copying videos without loading them whole
+STORAGE_BLOCK_SIZE = 1024 * 1024
+
+# Signed poster/thumbnail URLs stay the same for a whole window so browsers keep the images cached
+ASSET_URL_TTL_SECONDS = int(os.environ.get('ASSET_URL_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Enqueue an HLS segmentation job for every new lead
+HLS_SEGMENTATION = os.environ.get('HLS_SEGMENTATION') == '1'
+
+# GET /leads page size: default when ?limit is absent, and the most one page may hold
+LEADS_PAGE_SIZE = 50
+LEADS_MAX_PAGE_SIZE = 200
+
+# Bulk delete: leads per DELETE ... ANY() batch (one short transaction each), and the most one request removes
+BULK_DELETE_BATCH_SIZE = 200
+BULK_DELETE_MAX_LEADS = 10000
+
+# Full-text search: the query matches both the Russian and the English half of search_vector
+LEADS_SEARCH_QUERY = "websearch_to_tsquery('russian', %s) || websearch_to_tsquery('english', %s)"
+SEARCH_HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2, FragmentDelimiter=" … "'
+
+# Export archives: most leads and video bytes per archive (built within one request), how long an archive (and its signed download URL) is kept, largest slice per download request
+EXPORT_MAX_LEADS = int(os.environ.get('EXPORT_MAX_LEADS', '1000'))
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(1024 * 1024 * 1024)))
+EXPORT_TTL_SECONDS = int(os.environ.get('EXPORT_TTL_SECONDS', str(24 * 3600)))
+MAX_RANGE_BYTES = int(os.environ.get('MAX_RANGE_BYTES', str(2 * 1024 * 1024)))
+
+# Store-only ZIP records; sizes, offsets and counts at or past the classic limits move to ZIP64 fields
+ZIP_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+ZIP_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+ZIP_DATA_DESCRIPTOR = struct.Struct('<IIII')
+ZIP64_DATA_DESCRIPTOR = struct.Struct('<IIQQ')
+ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+ZIP64_END_LOCATOR = struct.Struct('<IIQI')
+ZIP_END_RECORD = struct.Struct('<IHHHHIIH')
+ZIP64_LIMIT = 0xFFFFFFFF
+# Data descriptor follows each entry (CRC is known only after streaming it); names are UTF-8
+ZIP_FLAGS = 0x0808
+VIDEO_EXTENSIONS = {'video/mp4': 'mp4', 'video/webm': 'webm', 'video/quicktime': 'mov', 'video/x-matroska': 'mkv'}
+
+# Idempotency-Key: how long a finished request's response is replayed, and after how long a claim whose request never finished may be taken over
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+IDEMPOTENCY_PENDING_SECONDS = 600
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# MP4 faststart: boxes on the path to the chunk offset tables, and a sanity cap on moov size
+MP4_BOX_HEADER = struct.Struct('>I4s')
+MP4_CONTAINER_BOXES = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+MP4_MOOV_MAX_BYTES = 64 * 1024 * 1024
+
+# Container probe: how much of the head and tail of a WebM file is read, and the EBML elements it walks
+PROBE_WINDOW_BYTES = 64 * 1024
+WEBM_CLUSTER_ID = b'\x1f\x43\xb6\x75'
+# EBML header, Segment, Info, Tracks, TrackEntry, Video, Cluster, BlockGroup
+EBML_MASTER_ELEMENTS = (0x1A45DFA3, 0x18538067, 0x1549A966, 0x1654AE6B, 0xAE, 0xE0, 0x1F43B675, 0xA0)
+# TrackType, CodecID, PixelWidth, PixelHeight
+WEBM_TRACK_FIELDS = {0x83: 'type', 0x86: 'codec', 0xB0: 'width', 0xBA: 'height'}
 
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
     '''Verify JWT token and return user data'''
@@ -15,53 +87,977 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
     except:
         return None
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+class PostgresBlobStore:
+    '''Video bytes in Postgres large objects, outside the video_leads rows; the key is the object OID'''
+    name = 'postgres'
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        video_object = self.conn.lobject(0, 'wb')
+        try:
+            for block in blocks:
+                video_object.write(bytes(block))
+            return str(video_object.oid)
+        finally:
+            video_object.close()
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            video_object.seek(offset)
+            return video_object.read(length)
+        finally:
+            video_object.close()
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            while True:
+                block = video_object.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+        finally:
+            video_object.close()
+    
+    def delete(self, key: str) -> None:
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT lo_unlink(%s)", (int(key),))
+
+class LocalBlobStore:
+    '''Video bytes as files under a local directory; the key is the path relative to it'''
+    name = 'local'
+    
+    def __init__(self, root: str):
+        self.root = root
+    
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        # Every write gets its own file, like a new large object OID, so deleting the key of one
+        # dropped row never removes bytes that a concurrent upload of the same content just wrote
+        key = f'{content_hash[:2]}/{content_hash}-{uuid.uuid4().hex}'
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so readers never see a partial file
+        partial_path = f'{path}.partial'
+        with open(partial_path, 'wb') as video_file:
+            for block in blocks:
+                video_file.write(block)
+        os.replace(partial_path, path)
+        return key
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        with open(self.path(key), 'rb') as video_file:
+            video_file.seek(offset)
+            return video_file.read(length)
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        with open(self.path(key), 'rb') as video_file:
+            while True:
+                block = video_file.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+    
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+def get_blob_store(conn, backend: Optional[str] = None):
+    '''Blob store for a backend name, VIDEO_STORAGE_BACKEND by default'''
+    backend = backend or VIDEO_STORAGE_BACKEND
+    if backend == 'postgres':
+        return PostgresBlobStore(conn)
+    if backend == 'local':
+        return LocalBlobStore(VIDEO_STORAGE_DIR)
+    raise ValueError(f"Unknown video storage backend: {backend}")
+
+def read_mp4_boxes(source, start: int, end: int) -> List[Tuple[bytes, int, int, int]]:
+    '''List (type, offset, header size, size) of the MP4 boxes between two offsets of a seekable stream'''
+    boxes = []
+    offset = start
+    while offset + 8 <= end:
+        source.seek(offset)
+        size, box_type = MP4_BOX_HEADER.unpack(source.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', source.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise ValueError(f"Malformed MP4 box {box_type!r} at offset {offset}")
+        boxes.append((box_type, offset, header_size, size))
+        offset += size
+    return boxes
+
+def shift_chunk_offsets(moov: bytearray, start: int, end: int, shift) -> None:
+    '''Rewrite every stco/co64 entry inside moov in place; stco entries that no longer fit raise OverflowError'''
+    for box_type, offset, header_size, size in read_mp4_boxes(io.BytesIO(moov), start, end):
+        if box_type in MP4_CONTAINER_BOXES:
+            shift_chunk_offsets(moov, offset + header_size, offset + size, shift)
+        elif box_type in (b'stco', b'co64'):
+            # Full box: version and flags, entry count, then the offsets
+            entries_at = offset + header_size + 8
+            (entry_count,) = struct.unpack_from('>I', moov, offset + header_size + 4)
+            entry_format, entry_width = ('>I', 4) if box_type == b'stco' else ('>Q', 8)
+            for entry in range(entry_count):
+                position = entries_at + entry * entry_width
+                (chunk_offset,) = struct.unpack_from(entry_format, moov, position)
+                chunk_offset = shift(chunk_offset)
+                if box_type == b'stco' and chunk_offset > 0xFFFFFFFF:
+                    raise OverflowError("Chunk offset does not fit in stco")
+                struct.pack_into(entry_format, moov, position, chunk_offset)
+
+def copy_stream_range(source, start: int, end: int) -> Iterator[bytes]:
+    '''Yield the bytes between two offsets of a seekable stream block by block'''
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = source.read(min(STORAGE_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        yield block
+
+def mp4_faststart(source, total_size: int) -> Optional[Iterator[bytes]]:
+    '''Stream an MP4 with moov moved ahead of mdat and chunk offsets fixed up; None when there is nothing to move'''
+    try:
+        boxes = read_mp4_boxes(source, 0, total_size)
+    except (ValueError, struct.error):
+        return None
+    
+    box_types = [box[0] for box in boxes]
+    # Fragmented files address samples relative to moof boxes and need no rewrite
+    if not boxes or box_types[0] != b'ftyp' or b'moov' not in box_types or b'mdat' not in box_types or b'moof' in box_types:
+        return None
+    moov_index = box_types.index(b'moov')
+    mdat_index = box_types.index(b'mdat')
+    if moov_index < mdat_index:
+        return None
+    
+    _, moov_offset, moov_header_size, moov_size = boxes[moov_index]
+    if moov_size > MP4_MOOV_MAX_BYTES:
+        return None
+    insert_at = boxes[mdat_index][1]
+    
+    source.seek(moov_offset)
+    moov = bytearray(source.read(moov_size))
+    try:
+        # Everything between the insertion point and the old moov moves down by the size of moov
+        shift_chunk_offsets(moov, moov_header_size, moov_size,
+                            lambda chunk_offset: chunk_offset + moov_size if insert_at <= chunk_offset < moov_offset else chunk_offset)
+    except (OverflowError, ValueError, struct.error):
+        return None
+    
+    def rewritten() -> Iterator[bytes]:
+        yield from copy_stream_range(source, 0, insert_at)
+        yield bytes(moov)
+        yield from copy_stream_range(source, insert_at, moov_offset)
+        yield from copy_stream_range(source, moov_offset + moov_size, total_size)
+    
+    return rewritten()
+
+def read_box_payload(source, box: Tuple[bytes, int, int, int], limit: int = 256) -> bytes:
+    '''Read the start of an MP4 box payload'''
+    _, offset, header_size, size = box
+    source.seek(offset + header_size)
+    return source.read(min(size - header_size, limit))
+
+def find_mp4_box(source, parent: Tuple[bytes, int, int, int], box_type: bytes) -> Optional[Tuple[bytes, int, int, int]]:
+    '''First child box of a given type'''
+    _, offset, header_size, size = parent
+    for box in read_mp4_boxes(source, offset + header_size, offset + size):
+        if box[0] == box_type:
+            return box
+    return None
+
+def probe_mp4(source, total_size: int) -> Dict[str, Any]:
+    '''Duration, resolution and codecs of an MP4 from its moov box headers; sample tables are never read'''
+    metadata: Dict[str, Any] = {'content_type': 'video/mp4'}
+    boxes = read_mp4_boxes(source, 0, total_size)
+    if boxes and boxes[0][0] == b'ftyp' and read_box_payload(source, boxes[0], 4) == b'qt  ':
+        metadata['content_type'] = 'video/quicktime'
+    
+    moov = next((box for box in boxes if box[0] == b'moov'), None)
+    if not moov:
+        return metadata
+    
+    for box in read_mp4_boxes(source, moov[1] + moov[2], moov[1] + moov[3]):
+        if box[0] == b'mvhd':
+            mvhd = read_box_payload(source, box, 32)
+            if mvhd[0] == 1:
+                timescale, duration = struct.unpack_from('>IQ', mvhd, 20)
+            else:
+                timescale, duration = struct.unpack_from('>II', mvhd, 12)
+            if timescale:
+                metadata['duration_ms'] = duration * 1000 // timescale
+        elif box[0] == b'trak':
+            mdia = find_mp4_box(source, box, b'mdia')
+            hdlr = mdia and find_mp4_box(source, mdia, b'hdlr')
+            minf = mdia and find_mp4_box(source, mdia, b'minf')
+            stbl = minf and find_mp4_box(source, minf, b'stbl')
+            stsd = stbl and find_mp4_box(source, stbl, b'stsd')
+            if not hdlr or not stsd:
+                continue
+            handler_type = read_box_payload(source, hdlr, 12)[8:12]
+            # stsd: version/flags, entry count, then the first sample entry (size, format)
+            codec = read_box_payload(source, stsd, 16)[12:16].decode('ascii', 'replace').strip()
+            if handler_type == b'vide' and 'video_codec' not in metadata:
+                metadata['video_codec'] = codec
+                tkhd = find_mp4_box(source, box, b'tkhd')
+                if tkhd:
+                    # Width and height close tkhd as 16.16 fixed point
+                    source.seek(tkhd[1] + tkhd[3] - 8)
+                    width, height = struct.unpack('>II', source.read(8))
+                    metadata['width'], metadata['height'] = width >> 16, height >> 16
+            elif handler_type == b'soun' and 'audio_codec' not in metadata:
+                metadata['audio_codec'] = codec
+    return metadata
+
+def read_ebml_vint(data: bytes, pos: int, keep_marker: bool = False) -> Tuple[Optional[int], int]:
+    '''Decode an EBML variable-length integer; returns (value, next position), value None for an unknown size'''
+    first = data[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise ValueError("Invalid EBML variable-length integer")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, pos + length
+    return value, pos + length
+
+def walk_ebml(data: bytes, pos: int, end: int) -> Iterator[Tuple[int, int, Optional[int]]]:
+    '''Yield (element id, data position, data size) depth-first, descending into master elements'''
+    while pos < end:
+        element_id, pos = read_ebml_vint(data, pos, keep_marker=True)
+        size, pos = read_ebml_vint(data, pos)
+        yield element_id, pos, size
+        if size is not None and element_id not in EBML_MASTER_ELEMENTS:
+            pos += size
+
+def last_webm_block_timestamp(tail: bytes) -> Optional[int]:
+    '''Timestamp of the last block of the last Cluster that starts within a buffer'''
+    cluster_at = tail.rfind(WEBM_CLUSTER_ID)
+    while cluster_at >= 0:
+        cluster_timestamp = last_timestamp = None
+        try:
+            for element_id, pos, size in walk_ebml(tail, cluster_at, len(tail)):
+                if element_id == 0xE7:
+                    cluster_timestamp = int.from_bytes(tail[pos:pos + size], 'big')
+                elif element_id in (0xA3, 0xA1) and cluster_timestamp is not None:
+                    # SimpleBlock / Block: track number, then a signed 16-bit timestamp relative to the cluster
+                    _, timestamp_at = read_ebml_vint(tail, pos)
+                    relative_timestamp = struct.unpack_from('>h', tail, timestamp_at)[0]
+                    last_timestamp = max(last_timestamp or 0, cluster_timestamp + relative_timestamp)
+                elif element_id != 0x1F43B675 and cluster_timestamp is None:
+                    # Cluster ID bytes inside frame data: Timestamp must come first in a real cluster
+                    break
+        except (ValueError, IndexError, struct.error):
+            pass
+        if last_timestamp is not None:
+            return last_timestamp
+        cluster_at = tail.rfind(WEBM_CLUSTER_ID, 0, cluster_at)
+    return None
+
+def probe_webm(source, total_size: int) -> Dict[str, Any]:
+    '''Duration, resolution and codecs of a WebM/Matroska file from its first and last PROBE_WINDOW_BYTES'''
+    source.seek(0)
+    head = source.read(min(PROBE_WINDOW_BYTES, total_size))
+    metadata: Dict[str, Any] = {'content_type': 'video/webm'}
+    timestamp_scale = 1000000
+    duration = None
+    tracks: List[Dict[str, bytes]] = []
+    
+    try:
+        for element_id, pos, size in walk_ebml(head, 0, len(head)):
+            if element_id == 0x1F43B675:
+                break
+            if element_id == 0xAE:
+                tracks.append({})
+            if size is None or element_id in EBML_MASTER_ELEMENTS or pos + size > len(head):
+                continue
+            value = head[pos:pos + size]
+            if element_id == 0x4282 and value != b'webm':
+                metadata['content_type'] = 'video/x-matroska'
+            elif element_id == 0x2AD7B1:
+                timestamp_scale = int.from_bytes(value, 'big')
+            elif element_id == 0x4489:
+                duration = struct.unpack('>f' if size == 4 else '>d', value)[0]
+            elif tracks and element_id in WEBM_TRACK_FIELDS:
+                tracks[-1][WEBM_TRACK_FIELDS[element_id]] = value
+    except (ValueError, IndexError):
+        pass
+    
+    for track in tracks:
+        track_type = int.from_bytes(track.get('type', b''), 'big')
+        codec = track.get('codec', b'').decode('ascii', 'replace')
+        if track_type == 1 and 'video_codec' not in metadata:
+            metadata['video_codec'] = codec
+            metadata['width'] = int.from_bytes(track.get('width', b''), 'big') or None
+            metadata['height'] = int.from_bytes(track.get('height', b''), 'big') or None
+        elif track_type == 2 and 'audio_codec' not in metadata:
+            metadata['audio_codec'] = codec
+    
+    if duration is None:
+        # Recorders that stream WebM never go back to write Duration: use the last block's timestamp instead
+        tail_start = max(0, total_size - PROBE_WINDOW_BYTES)
+        source.seek(tail_start)
+        duration = last_webm_block_timestamp(source.read(total_size - tail_start))
+    if duration is not None:
+        metadata['duration_ms'] = int(duration * timestamp_scale / 1000000)
+    return metadata
+
+def probe_video(source, total_size: int) -> Dict[str, Any]:
+    '''Container metadata read from headers only: content_type, duration_ms, width, height, video_codec, audio_codec'''
+    source.seek(0)
+    magic = source.read(8)
+    try:
+        if magic[:4] == b'\x1a\x45\xdf\xa3':
+            return probe_webm(source, total_size)
+        if magic[4:8] == b'ftyp':
+            return probe_mp4(source, total_size)
+    except (ValueError, IndexError, struct.error) as e:
+        print(f"Video probe failed: {str(e)}")
+    return {}
+
+def sign_asset(lead_id: int, kind: str, version: int, expires: int) -> str:
+    '''HMAC-SHA256 signature binding a poster/thumbnail URL to one lead asset version and an expiry time'''
+    secret = os.environ.get('PLAYBACK_URL_SECRET') or os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+    message = f'asset:{lead_id}:{kind}:{version}:{expires}'.encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def asset_query(lead_id: int, kind: str, created_at: datetime) -> str:
+    '''Signed query string for a lead's poster or thumbnail, identical within one ASSET_URL_TTL_SECONDS window'''
+    version = int(created_at.timestamp())
+    expires = (int(time.time()) // ASSET_URL_TTL_SECONDS + 2) * ASSET_URL_TTL_SECONDS
+    params = {'id': lead_id, 'asset': kind, 'v': version, 'expires': expires}
+    params['sig'] = sign_asset(lead_id, kind, version, expires)
+    return urlencode(params)
+
+def spool_base64_video(encoded: str) -> Tuple[IO[bytes], int]:
+    '''Decode a base64 video into a temporary file one block at a time, so the decoded bytes never sit in memory whole'''
+    spool = tempfile.TemporaryFile()
+    step = STORAGE_BLOCK_SIZE // 3 * 4
+    pending = ''
+    try:
+        for start in range(0, len(encoded), step):
+            # MIME-style line breaks and other whitespace are dropped; only whole 4-character quanta decode on their own
+            pending += ''.join(encoded[start:start + step].split())
+            aligned = len(pending) // 4 * 4
+            spool.write(base64.b64decode(pending[:aligned], validate=True))
+            pending = pending[aligned:]
+        if pending:
+            raise ValueError("Truncated base64 video")
+    except Exception:
+        spool.close()
+        raise
+    return spool, spool.tell()
+
+def spool_raw_video(body: Any) -> Tuple[IO[bytes], int]:
+    '''Copy a raw video body the gateway passed through undecoded into a temporary file'''
+    spool = tempfile.TemporaryFile()
+    try:
+        if isinstance(body, str):
+            # Text pass-through: latin-1 maps code points back to bytes one-to-one
+            for start in range(0, len(body), STORAGE_BLOCK_SIZE):
+                spool.write(body[start:start + STORAGE_BLOCK_SIZE].encode('latin-1'))
+        else:
+            spool.write(body)
+    except Exception:
+        spool.close()
+        raise
+    return spool, spool.tell()
+
+def store_video_blob(cursor, conn, content_hash: str, source: IO[bytes], video_size: int) -> List[Tuple[str, str]]:
+    '''Store a video from a seekable stream once per content hash in the configured blob store and take a reference;
+    returns the (backend, key) of bytes written outside the transaction, for delete_stored_blobs if it rolls back'''
+    cursor.execute("UPDATE video_blobs SET ref_count = ref_count + 1 WHERE sha256 = %s", (content_hash,))
+    if cursor.rowcount:
+        return []
+    
+    store = get_blob_store(conn)
+    storage_key = store.write(content_hash, copy_stream_range(source, 0, video_size))
+    # Large objects roll back with the transaction, files do not
+    written = [] if store.name == 'postgres' else [(store.name, storage_key)]
+    
+    try:
+        # A concurrent request may have stored the same content in the meantime
+        cursor.execute("""
+            INSERT INTO video_blobs (sha256, storage_backend, storage_key, video_size, ref_count)
+            VALUES (%s, %s, %s, %s, 1)
+            ON CONFLICT (sha256) DO UPDATE SET ref_count = video_blobs.ref_count + 1
+            RETURNING storage_backend, storage_key
+        """, (content_hash, store.name, storage_key, video_size))
+        stored = cursor.fetchone()
+    except Exception:
+        if written:
+            store.delete(storage_key)
+        raise
+    
+    if stored != (store.name, storage_key):
+        store.delete(storage_key)
+        return []
+    return written
+
+def release_video_blobs(cursor, content_hashes: List[str]) -> List[Tuple[str, str]]:
+    '''Drop one reference per hash and delete blobs nobody references any more; returns their (backend, key) for delete_stored_blobs'''
+    cursor.execute("""
+        UPDATE video_blobs vb SET ref_count = vb.ref_count - released.refs
+        FROM (SELECT sha256, COUNT(*) AS refs FROM unnest(%s::varchar[]) AS sha256 GROUP BY sha256) released
+        WHERE vb.sha256 = released.sha256
+    """, (content_hashes,))
+    cursor.execute("""
+        DELETE FROM video_blobs WHERE sha256 = ANY(%s::varchar[]) AND ref_count <= 0 
+        RETURNING storage_backend, storage_key
+    """, (content_hashes,))
+    return cursor.fetchall()
+
+def delete_stored_blobs(conn, dropped: List[Tuple[str, str]]) -> None:
+    '''Delete bytes of dropped blobs or HLS segments from their stores; called after the rows are gone so files never dangle'''
+    for storage_backend, storage_key in dropped:
+        get_blob_store(conn, storage_backend).delete(storage_key)
+    conn.commit()
+
+def dos_datetime(moment: datetime) -> Tuple[int, int]:
+    '''MS-DOS (date, time) fields of a ZIP header; dates before 1980 are clamped'''
+    if moment.year < 1980:
+        moment = datetime(1980, 1, 1)
+    return ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day, (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2)
+
+def zip_stream(entries: Iterable[Tuple[str, int, datetime, Iterable[bytes]]]) -> Iterator[bytes]:
     '''
-    Business: Manage video leads (create, retrieve) with user authentication
-    Args: event with httpMethod, headers (X-Auth-Token), body with video/comments data
-    Returns: Lead data or list of user leads
+    Yield a store-only ZIP archive of (name, expected size, modified, blocks) entries without buffering any entry;
+    CRCs go into data descriptors, ZIP64 fields are written only where a size, offset or count needs them
     '''
-    print(f"Handler called with method: {event.get('httpMethod', 'UNKNOWN')}")
-    method: str = event.get('httpMethod', 'GET')
+    central = []
+    offset = 0
+    for name, expected_size, modified, blocks in entries:
+        encoded_name = name.encode('utf-8')
+        dos_date, dos_time = dos_datetime(modified)
+        zip64 = expected_size >= ZIP64_LIMIT
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if zip64 else b''
+        local_header = ZIP_LOCAL_HEADER.pack(0x04034b50, 45 if zip64 else 20, ZIP_FLAGS, 0, dos_time, dos_date, 0,
+                                             ZIP64_LIMIT if zip64 else 0, ZIP64_LIMIT if zip64 else 0,
+                                             len(encoded_name), len(extra)) + encoded_name + extra
+        yield local_header
+        
+        crc = 0
+        size = 0
+        for block in blocks:
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            yield block
+        if size >= ZIP64_LIMIT and not zip64:
+            raise Exception(f"Entry {name} outgrew its expected size of {expected_size} bytes")
+        
+        descriptor = (ZIP64_DATA_DESCRIPTOR if zip64 else ZIP_DATA_DESCRIPTOR).pack(0x08074b50, crc, size, size)
+        yield descriptor
+        central.append((encoded_name, dos_date, dos_time, crc, size, offset))
+        offset += len(local_header) + size + len(descriptor)
     
-    # Handle CORS OPTIONS request
-    if method == 'OPTIONS':
+    central_offset = offset
+    central_size = 0
+    for encoded_name, dos_date, dos_time, crc, size, entry_offset in central:
+        zip64_fields = ([size, size] if size >= ZIP64_LIMIT else []) + ([entry_offset] if entry_offset >= ZIP64_LIMIT else [])
+        extra = struct.pack(f'<HH{len(zip64_fields)}Q', 0x0001, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b''
+        version = 45 if zip64_fields else 20
+        record = ZIP_CENTRAL_HEADER.pack(0x02014b50, version, version, ZIP_FLAGS, 0, dos_time, dos_date, crc,
+                                         min(size, ZIP64_LIMIT), min(size, ZIP64_LIMIT), len(encoded_name), len(extra),
+                                         0, 0, 0, 0, min(entry_offset, ZIP64_LIMIT)) + encoded_name + extra
+        central_size += len(record)
+        yield record
+    
+    entry_count = len(central)
+    if entry_count >= 0xFFFF or central_size >= ZIP64_LIMIT or central_offset >= ZIP64_LIMIT:
+        yield ZIP64_END_RECORD.pack(0x06064b50, 44, 45, 45, 0, 0, entry_count, entry_count, central_size, central_offset)
+        yield ZIP64_END_LOCATOR.pack(0x07064b50, 0, central_offset + central_size, 1)
+    yield ZIP_END_RECORD.pack(0x06054b50, 0, 0, min(entry_count, 0xFFFF), min(entry_count, 0xFFFF),
+                              min(central_size, ZIP64_LIMIT), min(central_offset, ZIP64_LIMIT), 0)
+
+def iter_video_blocks(conn, lead_id: int, storage_backend: Optional[str], storage_key: Optional[str], video_size: int) -> Iterator[bytes]:
+    '''Blocks of a lead's video from its blob store, or from the legacy video_data column one slice at a time'''
+    if storage_key:
+        yield from get_blob_store(conn, storage_backend).iter_blocks(storage_key)
+        return
+    with conn.cursor() as cursor:
+        for offset in range(0, video_size, STORAGE_BLOCK_SIZE):
+            cursor.execute("SELECT substring(video_data from %s for %s) FROM video_leads WHERE id = %s", 
+                           (offset + 1, STORAGE_BLOCK_SIZE, lead_id))
+            yield bytes(cursor.fetchone()[0])
+
+def archive_video_name(lead_id: int, title: str, filename: Optional[str], content_type: Optional[str]) -> str:
+    '''Path of a lead's video inside the archive; the lead id keeps names unique'''
+    extension = os.path.splitext(filename or '')[1].lstrip('.').lower() or VIDEO_EXTENSIONS.get((content_type or '').split(';')[0], 'mp4')
+    clean_title = re.sub(r'[^\w\-]+', '_', title or '').strip('_')[:60] or 'lead'
+    return f'videos/{lead_id}_{clean_title}.{extension}'
+
+def build_manifests(leads: List[Dict[str, Any]]) -> Tuple[bytes, bytes]:
+    '''CSV (with a BOM so spreadsheet apps detect UTF-8) and JSON manifests of the exported leads'''
+    fields = ['lead_id', 'title', 'comments', 'created_at', 'user_name', 'user_email', 'video_file', 'video_size', 'video_content_type']
+    csv_buffer = io.StringIO()
+    writer = csv.DictWriter(csv_buffer, fieldnames=fields)
+    writer.writeheader()
+    for lead in leads:
+        writer.writerow({field: lead[field] if lead[field] is not None else '' for field in fields})
+    manifest_json = json.dumps({'exported_at': datetime.utcnow().isoformat() + 'Z', 'leads': leads}, ensure_ascii=False, indent=2)
+    return csv_buffer.getvalue().encode('utf-8-sig'), manifest_json.encode('utf-8')
+
+def sign_export(export_id: int, storage_backend: str, storage_key: str, archive_size: int, expires: int) -> str:
+    '''HMAC-SHA256 signature binding a download URL to one export archive and an expiry time'''
+    secret = os.environ.get('PLAYBACK_URL_SECRET') or os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+    message = f'export:{export_id}:{storage_backend}:{storage_key}:{archive_size}:{expires}'.encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def purge_expired_exports(conn) -> None:
+    '''Delete expired export archives; rows go first so a failed byte delete never leaves a URL to missing bytes'''
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM video_exports WHERE expires_at < CURRENT_TIMESTAMP RETURNING storage_backend, storage_key")
+        expired = cursor.fetchall()
+    conn.commit()
+    for storage_backend, storage_key in expired:
+        get_blob_store(conn, storage_backend).delete(storage_key)
+    conn.commit()
+
+def select_export_leads(conn, user_id: int, is_admin: bool, lead_ids: List[int]) -> List[Tuple[Any, ...]]:
+    '''Rows of the leads an export may include, oldest first; the video size is the ninth column'''
+    with conn.cursor() as cursor:
+        # Admins may export any lead, users only their own; ids that do not match are left out of the archive
+        cursor.execute("""
+            SELECT l.id, l.title, l.comments, l.created_at, u.name, u.email, l.video_filename, l.video_content_type,
+                COALESCE(l.video_size, octet_length(l.video_data)),
+                COALESCE(b.storage_backend, CASE WHEN l.video_oid IS NOT NULL THEN 'postgres' END), COALESCE(b.storage_key, l.video_oid::text)
+            FROM video_leads l 
+            JOIN users u ON u.id = l.user_id
+            LEFT JOIN video_blobs b ON b.sha256 = l.blob_sha256
+            WHERE l.id = ANY(%s) AND (%s OR l.user_id = %s)
+            ORDER BY l.created_at, l.id
+        """, (lead_ids, is_admin, user_id))
+        return cursor.fetchall()
+
+def create_export(conn, user_id: int, rows: List[Tuple[Any, ...]]) -> Dict[str, Any]:
+    '''Write a ZIP of the selected leads' videos plus manifests into the blob store; memory stays at about one block'''
+    leads = []
+    videos = []
+    for lead_id, title, comments, created_at, user_name, user_email, filename, content_type, video_size, storage_backend, storage_key in rows:
+        has_video = bool(video_size)
+        video_file = archive_video_name(lead_id, title, filename, content_type) if has_video else None
+        leads.append({
+            'lead_id': lead_id,
+            'title': title,
+            'comments': comments,
+            'created_at': created_at.isoformat() if created_at else None,
+            'user_name': user_name,
+            'user_email': user_email,
+            'video_file': video_file,
+            'video_size': video_size if has_video else None,
+            'video_content_type': content_type if has_video else None
+        })
+        if has_video:
+            videos.append((video_file, video_size, created_at or datetime.utcnow(),
+                           iter_video_blocks(conn, lead_id, storage_backend, storage_key, video_size)))
+    
+    manifest_csv, manifest_json = build_manifests(leads)
+    now = datetime.utcnow()
+    entries = [('manifest.csv', len(manifest_csv), now, [manifest_csv]), ('manifest.json', len(manifest_json), now, [manifest_json])] + videos
+    
+    archive_size = 0
+    def counted(blocks: Iterator[bytes]) -> Iterator[bytes]:
+        nonlocal archive_size
+        for block in blocks:
+            archive_size += len(block)
+            yield block
+    
+    # Block generators open their source only when zip_stream reaches them, so one video is read at a time
+    store = get_blob_store(conn)
+    archive_hash = hashlib.sha256(f'export:{user_id}:{time.time_ns()}:{os.getpid()}'.encode('utf-8')).hexdigest()
+    storage_key = store.write(archive_hash, counted(zip_stream(entries)))
+    
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO video_exports (user_id, storage_backend, storage_key, archive_size, lead_count, expires_at)
+            VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+            RETURNING id
+        """, (user_id, store.name, storage_key, archive_size, len(leads), EXPORT_TTL_SECONDS))
+        export_id = cursor.fetchone()[0]
+    conn.commit()
+    
+    expires = int(time.time()) + EXPORT_TTL_SECONDS
+    params = {'export': export_id, 'store': store.name, 'key': storage_key, 'size': archive_size, 'expires': expires}
+    params['sig'] = sign_export(export_id, store.name, storage_key, archive_size, expires)
+    return {
+        'export_id': export_id,
+        'download_query': urlencode(params),
+        'archive_size': archive_size,
+        'lead_count': len(leads),
+        'video_count': len(videos),
+        'expires_at': expires,
+        'file_name': f'leads_export_{now.strftime("%Y%m%d_%H%M%S")}.zip'
+    }
+
+def parse_range(range_header: str, total_size: int) -> Optional[Tuple[int, int]]:
+    '''Parse the first range of a "bytes=" Range header into inclusive (start, end), capped at MAX_RANGE_BYTES'''
+    units, _, spec = range_header.partition('=')
+    if units.strip().lower() != 'bytes' or total_size <= 0:
+        return None
+    first, _, last = spec.split(',')[0].strip().partition('-')
+    try:
+        if first == '':
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix <= 0:
+                return None
+            start, end = max(total_size - suffix, 0), total_size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else total_size - 1
+    except ValueError:
+        return None
+    if start >= total_size or end < start:
+        return None
+    return start, min(end, total_size - 1, start + MAX_RANGE_BYTES - 1)
+
+def serve_signed_export(event: Dict[str, Any], query_params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Serve byte ranges of an export archive from a signed URL; archives are too big for one response, so Range is required past MAX_RANGE_BYTES'''
+    try:
+        export_id = int(query_params['export'])
+        archive_size = int(query_params['size'])
+        expires = int(query_params['expires'])
+    except (KeyError, ValueError):
         return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Invalid download URL'})
+        }
+    
+    storage_backend = query_params.get('store', '')
+    storage_key = query_params.get('key', '')
+    expected_sig = sign_export(export_id, storage_backend, storage_key, archive_size, expires)
+    if not hmac.compare_digest(expected_sig, query_params.get('sig', '')) or expires <= int(time.time()):
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Invalid or expired download URL'})
+        }
+    
+    headers = event.get('headers', {}) or {}
+    range_header = headers.get('Range') or headers.get('range')
+    if range_header:
+        byte_range = parse_range(range_header, archive_size)
+    elif archive_size <= MAX_RANGE_BYTES:
+        byte_range = (0, archive_size - 1) if archive_size else None
+    else:
+        byte_range = None
+    if not byte_range:
+        return {
+            'statusCode': 416,
+            'headers': {'Content-Range': f'bytes */{archive_size}', 'Accept-Ranges': 'bytes', 'Access-Control-Allow-Origin': '*'},
             'isBase64Encoded': False,
             'body': ''
         }
     
-    # Verify authentication
-    headers = event.get('headers', {})
-    auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    start, end = byte_range
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        # Purged archives lose their row before their bytes
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM video_exports WHERE id = %s AND expires_at > CURRENT_TIMESTAMP", (export_id,))
+            if not cursor.fetchone():
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'Export not found or expired'})
+                }
+        archive_slice = get_blob_store(conn, storage_backend).read(storage_key, start, end - start + 1)
+    finally:
+        conn.close()
+    
+    # Content-Range names the bytes actually read, should the archive be shorter than its signed size
+    if not archive_slice:
+        return {
+            'statusCode': 416,
+            'headers': {'Content-Range': f'bytes */{archive_size}', 'Accept-Ranges': 'bytes', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': ''
+        }
+    end = start + len(archive_slice) - 1
+    
+    response_headers = {
+        'Content-Type': 'application/zip',
+        'Content-Length': str(len(archive_slice)),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, no-store',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'Content-Range, Content-Length, Accept-Ranges'
+    }
+    if range_header:
+        response_headers['Content-Range'] = f'bytes {start}-{end}/{archive_size}'
+    return {
+        'statusCode': 206 if range_header else 200,
+        'headers': response_headers,
+        'isBase64Encoded': True,
+        'body': base64.b64encode(archive_slice).decode('ascii')
+    }
+
+def delete_lead_batch(conn, lead_ids: List[int]) -> List[int]:
+    '''Delete up to one batch of leads in a single short transaction and free their bytes; returns the ids that existed'''
+    with conn.cursor() as cursor:
+        # Lock first: a store job moving one of these videos into the blob store finishes before we look at it
+        cursor.execute("SELECT id FROM video_leads WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (lead_ids,))
+        # Leads predating deduplication, or not yet stored, own their video object outright
+        cursor.execute("SELECT lo_unlink(video_oid) FROM video_leads WHERE id = ANY(%s) AND video_oid IS NOT NULL AND blob_sha256 IS NULL", (lead_ids,))
+        cursor.execute("SELECT storage_backend, storage_key FROM video_hls_segments WHERE lead_id = ANY(%s)", (lead_ids,))
+        hls_segments = cursor.fetchall()
+        cursor.execute("DELETE FROM video_leads WHERE id = ANY(%s) RETURNING id, blob_sha256", (lead_ids,))
+        deleted = cursor.fetchall()
+        blob_hashes = [blob_sha256 for _, blob_sha256 in deleted if blob_sha256]
+        dropped = (release_video_blobs(cursor, blob_hashes) if blob_hashes else []) + hls_segments
+    conn.commit()
+    delete_stored_blobs(conn, dropped)
+    return [lead_id for lead_id, _ in deleted]
+
+def delete_leads(conn, lead_ids: List[int]) -> Dict[int, str]:
+    '''Delete the given leads in BULK_DELETE_BATCH_SIZE batches; returns the result (deleted or not_found) per id'''
+    results = {}
+    unique_ids = list(dict.fromkeys(lead_ids))
+    for start in range(0, len(unique_ids), BULK_DELETE_BATCH_SIZE):
+        batch = unique_ids[start:start + BULK_DELETE_BATCH_SIZE]
+        deleted = set(delete_lead_batch(conn, batch))
+        results.update({lead_id: 'deleted' if lead_id in deleted else 'not_found' for lead_id in batch})
+    return results
+
+def delete_leads_matching(conn, owner_id: Optional[int], created_from: Optional[str], created_to: Optional[str]) -> Tuple[List[int], bool]:
+    '''Delete leads of a user and/or created in [created_from, created_to) batch by batch; returns deleted ids and whether more remain'''
+    deleted_ids = []
+    with conn.cursor() as cursor:
+        while len(deleted_ids) < BULK_DELETE_MAX_LEADS:
+            cursor.execute("""
+                SELECT id FROM video_leads 
+                WHERE (%s::integer IS NULL OR user_id = %s) 
+                  AND (%s::timestamp IS NULL OR created_at >= %s) 
+                  AND (%s::timestamp IS NULL OR created_at < %s)
+                ORDER BY id
+                LIMIT %s
+            """, (owner_id, owner_id, created_from, created_from, created_to, created_to,
+                  min(BULK_DELETE_BATCH_SIZE, BULK_DELETE_MAX_LEADS - len(deleted_ids))))
+            batch = [lead_id for (lead_id,) in cursor.fetchall()]
+            conn.commit()
+            if not batch:
+                return deleted_ids, False
+            deleted_ids.extend(delete_lead_batch(conn, batch))
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM video_leads 
+                WHERE (%s::integer IS NULL OR user_id = %s) 
+                  AND (%s::timestamp IS NULL OR created_at >= %s) 
+                  AND (%s::timestamp IS NULL OR created_at < %s)
+            )
+        """, (owner_id, owner_id, created_from, created_from, created_to, created_to))
+        has_more = cursor.fetchone()[0]
+        conn.commit()
+    return deleted_ids, has_more
+
+def search_fingerprint(search: str) -> str:
+    '''Short hash of a search query, binding search cursors to the query whose ranks they hold'''
+    return hashlib.sha256(search.encode('utf-8')).hexdigest()[:16]
+
+def encode_leads_cursor(created_at: datetime, lead_id: int, rank: Optional[float] = None, search: str = '') -> str:
+    '''Opaque keyset cursor for the position right after (created_at, id), or after (rank, created_at, id) in the results of one search'''
+    position = [created_at.isoformat(), lead_id] + ([rank, search_fingerprint(search)] if rank is not None else [])
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+def decode_leads_cursor(cursor_value: str, search: str = '') -> Tuple[datetime, int, Optional[float]]:
+    '''Position encoded by encode_leads_cursor for the same search, or for the plain listing; raises ValueError for anything else'''
+    try:
+        created_at, lead_id, *ranked = json.loads(base64.urlsafe_b64decode(cursor_value.encode('ascii')))
+        position = datetime.fromisoformat(created_at), int(lead_id), float(ranked[0]) if ranked else None
+        fingerprint = ranked[1] if ranked else None
+    except (TypeError, ValueError, UnicodeError, IndexError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+    # A rank from another query (or a date position used for ranked results) would skip or repeat leads
+    if fingerprint != (search_fingerprint(search) if search else None):
+        raise ValueError("Cursor belongs to a different search or sort order")
+    return position
+
+def idempotency_fingerprint(event: Dict[str, Any]) -> str:
+    '''Hash of what makes two requests the same: method, query string and body'''
+    digest = hashlib.sha256()
+    digest.update((event.get('httpMethod') or '').encode())
+    digest.update(json.dumps(event.get('queryStringParameters') or {}, sort_keys=True).encode())
+    body = event.get('body') or ''
+    digest.update(body.encode() if isinstance(body, str) else body)
+    return digest.hexdigest()
+
+def claim_idempotency_key(conn, user_id: int, scope: str, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    '''
+    Reserve an Idempotency-Key before the request runs. Returns None when the request should run,
+    otherwise the response to send instead: the stored one for a finished key, 409 while the first
+    request with the key is still running, 422 when the key was sent with a different request
+    '''
+    cursor = conn.cursor()
+    # A new key, an expired one, or one whose request died without finishing is (re)claimed
+    cursor.execute("""
+        INSERT INTO idempotency_keys (user_id, scope, idempotency_key, request_hash, expires_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+        ON CONFLICT (user_id, scope, idempotency_key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status = 'pending', response_status = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at < CURRENT_TIMESTAMP
+           OR (idempotency_keys.status = 'pending' AND idempotency_keys.request_hash = EXCLUDED.request_hash
+               AND idempotency_keys.created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+        RETURNING 1
+    """, (user_id, scope, key, fingerprint, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_PENDING_SECONDS))
+    if cursor.fetchone():
+        conn.commit()
+        return None
     
-    if not auth_token:
+    cursor.execute("""
+        SELECT request_hash, status, response_body FROM idempotency_keys
+        WHERE user_id = %s AND scope = %s AND idempotency_key = %s
+    """, (user_id, scope, key))
+    row = cursor.fetchone()
+    conn.commit()
+    
+    if row and row[0] != fingerprint:
         return {
-            'statusCode': 401,
+            'statusCode': 422,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Authentication required'})
+            'body': json.dumps({'error': 'Idempotency-Key was already used for a different request'})
+        }
+    if not row or row[1] != 'done':
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '5'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'A request with this Idempotency-Key is still in progress'})
         }
     
-    user_data = verify_token(auth_token)
-    if not user_data:
+    response = json.loads(row[2])
+    response['headers'] = {**response.get('headers', {}), 'Idempotent-Replayed': 'true'}
+    return response
+
+def finish_idempotency_key(conn, user_id: int, scope: str, key: str, response: Optional[Dict[str, Any]]) -> None:
+    '''Store a successful response for replay; any other outcome frees the key so a retry runs again'''
+    cursor = conn.cursor()
+    if response is not None and response.get('statusCode', 500) < 400:
+        cursor.execute("""
+            UPDATE idempotency_keys SET status = 'done', response_status = %s, response_body = %s
+            WHERE user_id = %s AND scope = %s AND idempotency_key = %s
+        """, (response['statusCode'], json.dumps(response), user_id, scope, key))
+    else:
+        cursor.execute("""
+            DELETE FROM idempotency_keys
+            WHERE user_id = %s AND scope = %s AND idempotency_key = %s AND status = 'pending'
+        """, (user_id, scope, key))
+    conn.commit()
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Entry point; a POST with an Idempotency-Key runs once per key and repeats get the stored response
+    Args: event with httpMethod, headers (X-Auth-Token, optional Idempotency-Key)
+    Returns: Response of handle_request, or the stored response when the key was already used
+    '''
+    headers = event.get('headers') or {}
+    idempotency_key = headers.get('Idempotency-Key') or headers.get('idempotency-key')
+    if event.get('httpMethod') != 'POST' or not idempotency_key:
+        return handle_request(event, context)
+    
+    # Unauthenticated requests fall through so handle_request answers them as usual
+    user_data = verify_token(headers.get('X-Auth-Token') or headers.get('x-auth-token') or '')
+    db_url = os.environ.get('DATABASE_URL')
+    if not user_data or not db_url:
+        return handle_request(event, context)
+    
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
         return {
-            'statusCode': 401,
+            'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'isBase64Encoded': False,
-            'body': json.dumps({'error': 'Invalid token'})
+            'body': json.dumps({'error': f'Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters'})
         }
     
-    user_id = user_data['user_id']
+    conn = psycopg2.connect(db_url)
+    try:
+        # Checked before the body is decoded, so a repeated upload is never stored again
+        replay = claim_idempotency_key(conn, user_data['user_id'], 'leads', idempotency_key, idempotency_fingerprint(event))
+        if replay is not None:
+            return replay
+        
+        response = None
+        try:
+            response = handle_request(event, context)
+        finally:
+            finish_idempotency_key(conn, user_data['user_id'], 'leads', idempotency_key, response)
+        return response
+    finally:
+        conn.close()
+
+def handle_request(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Manage video leads (create, retrieve, delete, export as ZIP) with user authentication
+    Args: event with httpMethod, headers (X-Auth-Token), body with video/comments data or lead_ids for ?action=export
+    Returns: Lead data, list of user leads, or a signed export download query
+    '''
+    print(f"Handler called with method: {event.get('httpMethod', 'UNKNOWN')}")
+    method: str = event.get('httpMethod', 'GET')
+    
+    # Handle CORS OPTIONS request
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, Range, X-Lead-Title, X-Lead-Comments, X-Video-Filename, Idempotency-Key',
+                'Access-Control-Max-Age': '86400'
+            },
+            'isBase64Encoded': False,
+            'body': ''
+        }
+    
+    query_params = event.get('queryStringParameters') or {}
     
     try:
+        # Signed export download URLs carry no auth header, so the signature is the only check
+        if method == 'GET' and query_params.get('export') and query_params.get('sig'):
+            return serve_signed_export(event, query_params)
+        
+        # Verify authentication
+        headers = event.get('headers', {})
+        auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+        
+        if not auth_token:
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Authentication required'})
+            }
+        
+        user_data = verify_token(auth_token)
+        if not user_data:
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Invalid token'})
+            }
+        
+        user_id = user_data['user_id']
+        
         # Connect to database
         db_url = os.environ.get('DATABASE_URL')
         if not db_url:
@@ -76,46 +1072,156 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cursor = conn.cursor()
         
         if method == 'GET':
-            # Get user's leads
-            cursor.execute("""
-                SELECT id, title, comments, video_filename, video_content_type, created_at 
-                FROM video_leads 
-                WHERE user_id = %s 
-                ORDER BY created_at DESC
-            """, (user_id,))
+            # Get one page of the user's leads, newest first; the cursor continues after the last lead of the previous page
+            search = (query_params.get('search') or '').strip()
+            try:
+                page_size = min(max(int(query_params.get('limit', LEADS_PAGE_SIZE)), 1), LEADS_MAX_PAGE_SIZE)
+                after = decode_leads_cursor(query_params['cursor'], search) if query_params.get('cursor') else None
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': str(e)})
+                }
+            
+            if search:
+                # Full-text match on the GIN-indexed search_vector, best first; snippets only for the page that is returned
+                cursor.execute(f"""
+                    WITH matches AS (
+                        SELECT vl.id, ts_rank_cd(vl.search_vector, q.query) AS rank, q.query
+                        FROM video_leads vl, (SELECT {LEADS_SEARCH_QUERY} AS query) q
+                        WHERE vl.user_id = %s AND vl.search_vector @@ q.query
+                          AND (%s OR (ts_rank_cd(vl.search_vector, q.query), vl.created_at, vl.id) < (%s::real, %s, %s))
+                        ORDER BY rank DESC, vl.created_at DESC, vl.id DESC
+                        LIMIT %s
+                    )
+                    SELECT vl.id, vl.title, vl.comments, vl.video_filename, vl.video_content_type, vl.created_at, 
+                           thumbnail.created_at, poster.created_at, m.rank,
+                           ts_headline('russian', vl.title, m.query, %s), ts_headline('russian', vl.comments, m.query, %s)
+                    FROM matches m
+                    JOIN video_leads vl ON vl.id = m.id
+                    LEFT JOIN video_lead_assets thumbnail ON thumbnail.lead_id = vl.id AND thumbnail.kind = 'thumbnail'
+                    LEFT JOIN video_lead_assets poster ON poster.lead_id = vl.id AND poster.kind = 'poster'
+                    ORDER BY m.rank DESC, vl.created_at DESC, vl.id DESC
+                """, (search, search, user_id, after is None or after[2] is None, after[2] if after else None, after[0] if after else None,
+                      after[1] if after else None, page_size + 1, SEARCH_HEADLINE_OPTIONS, SEARCH_HEADLINE_OPTIONS))
+            else:
+                # Row comparison on (created_at, id) walks idx_video_leads_user_created_id instead of sorting every lead
+                cursor.execute("""
+                    SELECT vl.id, vl.title, vl.comments, vl.video_filename, vl.video_content_type, vl.created_at, 
+                           thumbnail.created_at, poster.created_at, NULL, NULL, NULL
+                    FROM video_leads vl
+                    LEFT JOIN video_lead_assets thumbnail ON thumbnail.lead_id = vl.id AND thumbnail.kind = 'thumbnail'
+                    LEFT JOIN video_lead_assets poster ON poster.lead_id = vl.id AND poster.kind = 'poster'
+                    WHERE vl.user_id = %s AND (%s OR (vl.created_at, vl.id) < (%s, %s))
+                    ORDER BY vl.created_at DESC, vl.id DESC
+                    LIMIT %s
+                """, (user_id, after is None, after[0] if after else None, after[1] if after else None, page_size + 1))
+            
+            rows = cursor.fetchall()
+            next_cursor = encode_leads_cursor(rows[page_size - 1][5], rows[page_size - 1][0], rows[page_size - 1][8], search) if len(rows) > page_size else None
             
             leads = []
-            for row in cursor.fetchall():
-                lead_id, title, comments, filename, content_type, created_at = row
-                leads.append({
+            for row in rows[:page_size]:
+                lead_id, title, comments, filename, content_type, created_at, thumbnail_at, poster_at, rank, title_snippet, comments_snippet = row
+                lead = {
                     'id': lead_id,
                     'title': title,
                     'comments': comments,
                     'video_filename': filename,
                     'video_content_type': content_type,
                     'created_at': created_at.strftime('%d.%m.%Y %H:%M') if created_at else '',
-                    'video_url': f'/backend/leads/video/{lead_id}'  # URL to get video data
-                })
+                    'video_url': f'/backend/leads/video/{lead_id}',  # URL to get video data
+                    # Signed query strings for the video function; absent until the asset worker has run
+                    'thumbnail_query': asset_query(lead_id, 'thumbnail', thumbnail_at) if thumbnail_at else None,
+                    'poster_query': asset_query(lead_id, 'poster', poster_at) if poster_at else None
+                }
+                if search:
+                    # Snippets mark matches with <mark>…</mark>; the rest is plain text
+                    lead.update({'search_rank': rank, 'title_snippet': title_snippet, 'comments_snippet': comments_snippet})
+                leads.append(lead)
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'isBase64Encoded': False,
-                'body': json.dumps({'leads': leads})
+                'body': json.dumps({'leads': leads, 'next_cursor': next_cursor})
+            }
+        
+        elif method == 'POST' and query_params.get('action') == 'export':
+            # ZIP export of selected leads; admins may export any lead, users only their own
+            body_data = json.loads(event.get('body') or '{}')
+            try:
+                lead_ids = [int(lead_id) for lead_id in body_data.get('lead_ids', [])]
+            except (ValueError, TypeError):
+                lead_ids = []
+            
+            if not lead_ids:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'lead_ids must list at least one lead'})
+                }
+            
+            # The archive is built within this request, so its size is capped up front
+            if len(lead_ids) > EXPORT_MAX_LEADS:
+                return {
+                    'statusCode': 413,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': f'An export holds at most {EXPORT_MAX_LEADS} leads'})
+                }
+            
+            rows = select_export_leads(conn, user_id, user_data.get('role') == 'admin', lead_ids)
+            export_bytes = sum(row[8] or 0 for row in rows)
+            if export_bytes > EXPORT_MAX_BYTES:
+                return {
+                    'statusCode': 413,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': f'Selected videos total {export_bytes} bytes; an export holds at most {EXPORT_MAX_BYTES}'})
+                }
+            
+            purge_expired_exports(conn)
+            result = create_export(conn, user_id, rows)
+            print(f"Export {result['export_id']}: {result['lead_count']} leads, {result['archive_size']} bytes")
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'success': True, **result})
             }
         
         elif method == 'POST':
             # Create new lead
-            print(f"POST request received, body length: {len(event.get('body', ''))}")
-            body_data = json.loads(event.get('body', '{}'))
-            print(f"Parsed body data keys: {list(body_data.keys())}")
-            title = body_data.get('title', '').strip()
-            comments = body_data.get('comments', '').strip()
-            video_base64 = body_data.get('video_data', '')  # Base64 encoded video
-            video_filename = body_data.get('video_filename', 'recording.mp4')
-            video_content_type = body_data.get('video_content_type', 'video/mp4')
-            
-            if not title or not comments or not video_base64:
+            print(f"POST request received, body length: {len(event.get('body') or '')}")
+            request_type = (headers.get('Content-Type') or headers.get('content-type') or '').split(';')[0].strip().lower()
+            raw_video = None
+            if request_type.startswith('video/') or request_type == 'application/octet-stream':
+                # Raw binary body (base64-encoded by the gateway); metadata comes in percent-encoded headers, so no JSON copy exists
+                title = unquote(headers.get('X-Lead-Title') or headers.get('x-lead-title') or '').strip()
+                comments = unquote(headers.get('X-Lead-Comments') or headers.get('x-lead-comments') or '').strip()
+                video_filename = unquote(headers.get('X-Video-Filename') or headers.get('x-video-filename') or 'recording.mp4')
+                video_content_type = request_type if request_type.startswith('video/') else 'video/mp4'
+                if event.get('isBase64Encoded'):
+                    video_base64 = event.get('body') or ''
+                else:
+                    # Passed through undecoded, as upload-chunked's binary mode also accepts
+                    video_base64 = ''
+                    raw_video = event.get('body') or ''
+            else:
+                body_data = json.loads(event.get('body', '{}'))
+                print(f"Parsed body data keys: {list(body_data.keys())}")
+                title = body_data.get('title', '').strip()
+                comments = body_data.get('comments', '').strip()
+                video_base64 = body_data.get('video_data', '')  # Base64 encoded video
+                video_filename = body_data.get('video_filename', 'recording.mp4')
+                video_content_type = body_data.get('video_content_type', 'video/mp4')
+            
+            if not title or not comments or not (video_base64 or raw_video):
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -123,9 +1229,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Missing required fields'})
                 }
             
-            # Decode base64 video data
+            # Decode base64 video data (or copy the raw body) into a temporary file
             try:
-                video_data = base64.b64decode(video_base64)
+                if raw_video:
+                    source, video_size = spool_raw_video(raw_video)
+                else:
+                    source, video_size = spool_base64_video(video_base64)
             except Exception as e:
                 return {
                     'statusCode': 400,
@@ -134,16 +1243,51 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Invalid video data'})
                 }
             
-            # Save to database
-            cursor.execute("""
-                INSERT INTO video_leads 
-                (user_id, title, comments, video_data, video_filename, video_content_type)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING id, created_at
-            """, (user_id, title, comments, video_data, video_filename, video_content_type))
+            try:
+                # Players can start before the whole file arrives when moov precedes mdat
+                rewritten = mp4_faststart(source, video_size)
+                if rewritten is not None:
+                    faststart_source = tempfile.TemporaryFile()
+                    for block in rewritten:
+                        faststart_source.write(block)
+                    source.close()
+                    source = faststart_source
+                
+                # The client's content type is a guess; duration, resolution and codecs come from the container headers
+                metadata = probe_video(source, video_size)
+                
+                # Identical payloads (e.g. retries after a timeout) are stored once
+                digest = hashlib.sha256()
+                for block in copy_stream_range(source, 0, video_size):
+                    digest.update(block)
+                content_hash = digest.hexdigest()
+                written = store_video_blob(cursor, conn, content_hash, source, video_size)
+            finally:
+                source.close()
             
-            lead_id, created_at = cursor.fetchone()
-            conn.commit()
+            try:
+                # Save to database; the row keeps only the blob key (its checksum) and size
+                cursor.execute("""
+                    INSERT INTO video_leads 
+                    (user_id, title, comments, video_size, blob_sha256, video_filename, video_content_type,
+                     video_duration_ms, video_width, video_height, video_codec, audio_codec)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, created_at
+                """, (user_id, title, comments, video_size, content_hash, video_filename, metadata.get('content_type', video_content_type),
+                      metadata.get('duration_ms'), metadata.get('width'), metadata.get('height'), metadata.get('video_codec'), metadata.get('audio_codec')))
+                
+                lead_id, created_at = cursor.fetchone()
+                
+                # Poster, thumbnail and optional HLS rendition are produced later by the video-assets worker
+                cursor.execute("INSERT INTO video_asset_jobs (lead_id) VALUES (%s)", (lead_id,))
+                if HLS_SEGMENTATION:
+                    cursor.execute("INSERT INTO video_asset_jobs (lead_id, kind) VALUES (%s, 'hls')", (lead_id,))
+                conn.commit()
+            except Exception:
+                # No row names a file written for a rolled-back lead, so nothing else would remove it
+                conn.rollback()
+                delete_stored_blobs(conn, written)
+                raise
             
             return {
                 'statusCode': 200,
@@ -166,33 +1310,79 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Admin access required'})
                 }
             
-            # Get lead_id from query parameters
-            query_params = event.get('queryStringParameters') or {}
+            # Single lead by ?lead_id, or a bulk request body: {"lead_ids": [...]} or a filter {"user_id", "created_from", "created_to"}
             lead_id = query_params.get('lead_id')
             
-            if not lead_id:
+            try:
+                body_data = json.loads(event.get('body') or '{}') if not lead_id else {}
+                if not isinstance(body_data, dict):
+                    raise ValueError("Request body must be a JSON object")
+                lead_ids = [int(lead_id)] if lead_id else [int(value) for value in body_data.get('lead_ids') or []]
+                owner_id = int(body_data['user_id']) if body_data.get('user_id') is not None else None
+                created_from = datetime.fromisoformat(body_data['created_from']).isoformat() if body_data.get('created_from') else None
+                created_to = datetime.fromisoformat(body_data['created_to']).isoformat() if body_data.get('created_to') else None
+            except (ValueError, TypeError):
+                # json.JSONDecodeError is a ValueError too
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'lead_id parameter required'})
+                    'body': json.dumps({'error': 'Invalid lead ids or filter'})
                 }
             
-            # Check if lead exists
-            cursor.execute("SELECT id, user_id FROM video_leads WHERE id = %s", (lead_id,))
-            lead_info = cursor.fetchone()
+            if lead_ids:
+                if len(lead_ids) > BULK_DELETE_MAX_LEADS:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': f'At most {BULK_DELETE_MAX_LEADS} lead ids per request'})
+                    }
+                
+                results = delete_leads(conn, lead_ids)
+                deleted_count = sum(1 for result in results.values() if result == 'deleted')
+                
+                if lead_id:
+                    # Single-lead form keeps its original response
+                    if not deleted_count:
+                        return {
+                            'statusCode': 404,
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'isBase64Encoded': False,
+                            'body': json.dumps({'error': 'Lead not found'})
+                        }
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({
+                            'success': True,
+                            'message': 'Lead deleted successfully',
+                            'deleted_lead_id': int(lead_id)
+                        })
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({
+                        'success': True,
+                        'deleted_count': deleted_count,
+                        'results': {str(result_id): result for result_id, result in results.items()}
+                    })
+                }
             
-            if not lead_info:
+            # A filter must narrow the delete down; an empty body never means "delete everything"
+            if owner_id is None and not created_from and not created_to:
                 return {
-                    'statusCode': 404,
+                    'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Lead not found'})
+                    'body': json.dumps({'error': 'lead_id parameter, lead_ids or a filter (user_id, created_from, created_to) required'})
                 }
             
-            # Delete the lead
-            cursor.execute("DELETE FROM video_leads WHERE id = %s", (lead_id,))
-            conn.commit()
+            deleted_ids, has_more = delete_leads_matching(conn, owner_id, created_from, created_to)
             
             return {
                 'statusCode': 200,
@@ -200,8 +1390,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False,
                 'body': json.dumps({
                     'success': True,
-                    'message': 'Lead deleted successfully',
-                    'deleted_lead_id': int(lead_id)
+                    'deleted_count': len(deleted_ids),
+                    'results': {str(deleted_id): 'deleted' for deleted_id in deleted_ids},
+                    # More matching leads than one request removes: repeat the same request
+                    'has_more': has_more
                 })
             }
         
@@ -0,0 +1,133 @@
+'''
+Integration tests for the cloud functions against a real PostgreSQL database.
+
+TEST_DATABASE_URL must point at a throwaway database: its t_p72874800_user_registration_vi schema
+and all of its large objects are dropped and re-created from db_migrations. Run from the repo root:
+    TEST_DATABASE_URL=postgresql://... python -m pytest backend/tests
+LARGE_UPLOAD_MB (default 256) sets the size of the synthetic upload in the finalize memory test.
+'''
+import base64
+import glob
+import json
+import importlib.util
+import os
+import jwt
+import psycopg2
+import pytest
+from typing import Any, Dict, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'db_migrations')
+SCHEMA = 't_p72874800_user_registration_vi'
+JWT_SECRET = 'test-secret-for-the-function-tests-only'
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+
+def load_function(name: str):
+    '''Import backend/<name>/index.py as a module of its own (every function's module is called index)'''
+    module_name = f"{name.replace('-', '_')}_index"
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(BACKEND_DIR, name, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def auth_token(user_id: Any, role: str = 'user') -> str:
+    '''Token as issued by the auth function'''
+    return jwt.encode({'user_id': user_id, 'email': f'{user_id}@example.com', 'name': 'Test', 'role': role}, JWT_SECRET, algorithm='HS256')
+
+
+def http_event(method: str, token: Optional[str] = None, query: Optional[Dict[str, str]] = None,
+               body: Any = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    '''Gateway event; bytes bodies arrive base64-encoded, dicts as JSON'''
+    event_headers = dict(headers or {})
+    if token:
+        event_headers['X-Auth-Token'] = token
+    event = {'httpMethod': method, 'headers': event_headers, 'queryStringParameters': query or {}, 'isBase64Encoded': False, 'body': ''}
+    if isinstance(body, (bytes, bytearray)):
+        event.update(body=base64.b64encode(body).decode('ascii'), isBase64Encoded=True)
+    elif body is not None:
+        event['body'] = body if isinstance(body, str) else json.dumps(body)
+    return event
+
+
+def lead_video_bytes(conn, lead_id: int) -> bytes:
+    '''Stored video of a lead, whether it is still the assembled large object or already a blob'''
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT COALESCE(b.storage_backend, 'postgres'), COALESCE(b.storage_key, l.video_oid::text)
+            FROM video_leads l LEFT JOIN video_blobs b ON b.sha256 = l.blob_sha256
+            WHERE l.id = %s
+        """, (lead_id,))
+        storage_backend, storage_key = cursor.fetchone()
+    assert storage_backend == 'postgres'
+    video_object = conn.lobject(int(storage_key), 'rb')
+    try:
+        return video_object.read()
+    finally:
+        video_object.close()
+
+
+def insert_video_lead(conn, user_id: int, video: bytes, title: str = 'Lead', comments: str = '') -> int:
+    '''Lead whose video is a large object of its own, as saved by the chunked upload before the store job'''
+    video_object = conn.lobject(0, 'wb')
+    try:
+        video_object.write(video)
+        video_oid = video_object.oid
+    finally:
+        video_object.close()
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO video_leads (user_id, title, comments, video_size, video_oid, video_filename, video_content_type)
+            VALUES (%s, %s, %s, %s, %s, 'lead.mp4', 'video/mp4') RETURNING id
+        """, (user_id, title, comments, len(video), video_oid))
+        lead_id = cursor.fetchone()[0]
+    conn.commit()
+    return lead_id
+
+
+@pytest.fixture(scope='session')
+def database_url() -> str:
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+            cursor.execute(f'CREATE SCHEMA {SCHEMA}')
+            cursor.execute(f'SET search_path TO {SCHEMA}')
+            for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, 'V*.sql'))):
+                with open(path, encoding='utf-8') as migration:
+                    cursor.execute(migration.read())
+    finally:
+        conn.close()
+    separator = '&' if '?' in TEST_DATABASE_URL else '?'
+    return f'{TEST_DATABASE_URL}{separator}options=-csearch_path%3D{SCHEMA}'
+
+
+@pytest.fixture
+def db(database_url, monkeypatch):
+    '''Connection to the emptied test schema; the functions are pointed at the same database'''
+    monkeypatch.setenv('DATABASE_URL', database_url)
+    monkeypatch.setenv('JWT_SECRET', JWT_SECRET)
+    conn = psycopg2.connect(database_url)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname = %s", (SCHEMA,))
+        tables = ', '.join(row[0] for row in cursor.fetchall())
+        cursor.execute(f'TRUNCATE {tables} RESTART IDENTITY CASCADE')
+        cursor.execute('SELECT lo_unlink(oid) FROM pg_largeobject_metadata')
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def user(db) -> Dict[str, Any]:
+    with db.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO users (email, name, password_hash) VALUES ('user@example.com', 'Test User', 'x') RETURNING id
+        """)
+        user_id = cursor.fetchone()[0]
+    db.commit()
+    return {'id': user_id, 'token': auth_token(user_id)}
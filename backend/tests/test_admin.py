@@ -0,0 +1,36 @@
+import json
+import os
+from conftest import auth_token, http_event, insert_video_lead, load_function
+
+admin = load_function('admin')
+
+
+def first_page_statistics():
+    response = admin.handler(http_event('GET', auth_token('admin', 'admin')), None)
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'])['statistics']
+
+
+def add_leads(conn, user_id):
+    for _ in range(3):
+        insert_video_lead(conn, user_id, os.urandom(100))
+    with conn.cursor() as cursor:
+        cursor.execute("UPDATE video_leads SET video_filename = NULL WHERE id = (SELECT MIN(id) FROM video_leads)")
+    conn.commit()
+
+
+def test_small_tables_are_counted_exactly(db, user):
+    add_leads(db, user['id'])
+    assert first_page_statistics() == {'total_users': 1, 'total_leads': 3, 'total_videos': 2, 'estimated': False}
+
+
+def test_large_tables_are_estimated_from_statistics(db, user, monkeypatch):
+    add_leads(db, user['id'])
+    db.autocommit = True
+    with db.cursor() as cursor:
+        cursor.execute("ANALYZE users")
+        cursor.execute("ANALYZE video_leads")
+    monkeypatch.setattr(admin, 'EXACT_COUNT_MAX_ROWS', 0)
+    
+    # A freshly analyzed small table has exact statistics, so the estimate matches the real figures
+    assert first_page_statistics() == {'total_users': 1, 'total_leads': 3, 'total_videos': 2, 'estimated': True}
@@ -0,0 +1,161 @@
+import base64
+import io
+import json
+import os
+import tracemalloc
+import zipfile
+from urllib.parse import parse_qsl
+from conftest import auth_token, http_event, insert_video_lead, lead_video_bytes, load_function
+
+leads = load_function('leads')
+
+RAW_HEADERS = {'Content-Type': 'video/mp4', 'X-Lead-Title': 'Raw%20lead', 'X-Lead-Comments': 'Sent%20as%20bytes'}
+
+
+def create_lead(event):
+    response = leads.handler(event, None)
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'])['lead_id']
+
+
+def test_json_video_with_line_breaks_is_decoded(db, user):
+    video = os.urandom(3 * 1024 * 1024 + 5)
+    wrapped = '\r\n'.join(base64.encodebytes(video).decode('ascii').split('\n'))
+    lead_id = create_lead(http_event('POST', user['token'], body={
+        'title': 'Wrapped', 'comments': 'MIME base64', 'video_data': wrapped
+    }))
+    assert lead_video_bytes(db, lead_id) == video
+
+
+def test_truncated_base64_video_is_rejected(db, user):
+    response = leads.handler(http_event('POST', user['token'], body={
+        'title': 'Broken', 'comments': 'Truncated', 'video_data': base64.b64encode(os.urandom(1000)).decode('ascii')[:-3]
+    }), None)
+    assert response['statusCode'] == 400
+
+
+def test_raw_body_passed_through_undecoded_is_stored(db, user):
+    video = os.urandom(100000)
+    event = http_event('POST', user['token'], headers=RAW_HEADERS)
+    event['body'] = video.decode('latin-1')
+    lead_id = create_lead(event)
+    assert lead_video_bytes(db, lead_id) == video
+
+
+def test_raw_post_memory_does_not_grow_with_video_size(db, user):
+    video = os.urandom(32 * 1024 * 1024)
+    event = http_event('POST', user['token'], body=video, headers=RAW_HEADERS)
+    tracemalloc.start()
+    try:
+        lead_id = create_lead(event)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Decoding, hashing and storing go a block at a time; the body string itself was allocated before tracing
+    assert peak < 6 * leads.STORAGE_BLOCK_SIZE, f'POST peaked at {peak / 1024 / 1024:.1f} MB'
+    assert lead_video_bytes(db, lead_id) == video
+
+
+def export_leads(token, lead_ids):
+    return leads.handler(http_event('POST', token, query={'action': 'export'}, body={'lead_ids': lead_ids}), None)
+
+
+def test_export_download_and_purged_archive(db, user):
+    video = os.urandom(5000)
+    lead_id = insert_video_lead(db, user['id'], video, 'Exported', 'Lead')
+    response = export_leads(user['token'], [lead_id])
+    assert response['statusCode'] == 200, response['body']
+    query = dict(parse_qsl(json.loads(response['body'])['download_query']))
+    
+    download = leads.handler(http_event('GET', query=query), None)
+    assert download['statusCode'] == 200
+    archive = zipfile.ZipFile(io.BytesIO(base64.b64decode(download['body'])))
+    assert archive.read(f'videos/{lead_id}_Exported.mp4') == video
+    
+    # Once the row is purged the URL answers 404, still with CORS headers
+    with db.cursor() as cursor:
+        cursor.execute("DELETE FROM video_exports")
+    db.commit()
+    gone = leads.handler(http_event('GET', query=query), None)
+    assert gone['statusCode'] == 404
+    assert gone['headers']['Access-Control-Allow-Origin'] == '*'
+
+
+def test_signed_export_database_error_keeps_cors(db, user, monkeypatch):
+    lead_id = insert_video_lead(db, user['id'], os.urandom(100))
+    query = dict(parse_qsl(json.loads(export_leads(user['token'], [lead_id])['body'])['download_query']))
+    monkeypatch.setenv('DATABASE_URL', 'postgresql://nobody@/missing?host=/nonexistent')
+    response = leads.handler(http_event('GET', query=query), None)
+    assert response['statusCode'] == 500
+    assert response['headers']['Access-Control-Allow-Origin'] == '*'
+
+
+def test_oversized_export_is_refused_before_building(db, user, monkeypatch):
+    lead_ids = [insert_video_lead(db, user['id'], os.urandom(3000)) for _ in range(2)]
+    monkeypatch.setattr(leads, 'EXPORT_MAX_BYTES', 5000)
+    response = export_leads(user['token'], lead_ids)
+    assert response['statusCode'] == 413
+    
+    monkeypatch.setattr(leads, 'EXPORT_MAX_LEADS', 1)
+    assert export_leads(user['token'], lead_ids)['statusCode'] == 413
+    with db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM video_exports")
+        assert cursor.fetchone()[0] == 0
+
+
+def test_bulk_delete_with_invalid_body_is_rejected(db, user):
+    lead_id = insert_video_lead(db, user['id'], os.urandom(100))
+    for body in ('{"lead_ids": [', '[1, 2]'):
+        response = leads.handler(http_event('DELETE', auth_token('admin', 'admin'), body=body), None)
+        assert response['statusCode'] == 400, body
+    with db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM video_leads WHERE id = %s", (lead_id,))
+        assert cursor.fetchone()[0] == 1
+
+
+def leads_page(token, **query):
+    response = leads.handler(http_event('GET', token, query=query), None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_search_cursor_only_continues_its_own_query(db, user):
+    for title in ('alpha one', 'alpha two', 'beta three', 'beta four'):
+        insert_video_lead(db, user['id'], os.urandom(100), title, 'comment')
+    
+    status, first = leads_page(user['token'], search='alpha', limit='1')
+    assert status == 200 and first['next_cursor']
+    status, second = leads_page(user['token'], search='alpha', limit='1', cursor=first['next_cursor'])
+    assert status == 200
+    assert {lead['title'] for lead in first['leads'] + second['leads']} == {'alpha one', 'alpha two'}
+    
+    assert leads_page(user['token'], search='beta', limit='1', cursor=first['next_cursor'])[0] == 400
+    assert leads_page(user['token'], limit='1', cursor=first['next_cursor'])[0] == 400
+    _, listing = leads_page(user['token'], limit='1')
+    assert leads_page(user['token'], search='alpha', limit='1', cursor=listing['next_cursor'])[0] == 400
+
+
+def test_local_blob_files_are_per_write_and_never_orphaned(db, user, monkeypatch, tmp_path):
+    monkeypatch.setattr(leads, 'VIDEO_STORAGE_BACKEND', 'local')
+    monkeypatch.setattr(leads, 'VIDEO_STORAGE_DIR', str(tmp_path))
+    stored_files = lambda: [path for path in tmp_path.rglob('*') if path.is_file()]
+    video = os.urandom(5000)
+    body = {'title': 'Local', 'comments': 'On disk', 'video_data': base64.b64encode(video).decode('ascii')}
+    
+    # A lead that fails to insert (codec name longer than its column) leaves no file behind
+    with monkeypatch.context() as patch:
+        patch.setattr(leads, 'probe_video', lambda source, size: {'video_codec': 'x' * 100})
+        response = leads.handler(http_event('POST', user['token'], body=body), None)
+    assert response['statusCode'] == 500
+    assert stored_files() == []
+    
+    first = create_lead(http_event('POST', user['token'], body=body))
+    [first_file] = stored_files()
+    response = leads.handler(http_event('DELETE', auth_token('admin', 'admin'), query={'lead_id': str(first)}), None)
+    assert response['statusCode'] == 200, response['body']
+    assert stored_files() == []
+    
+    # The same content stored again gets a file of its own, not the key the deleted row named
+    second = create_lead(http_event('POST', user['token'], body=body))
+    [second_file] = stored_files()
+    assert second_file != first_file
+    assert second_file.read_bytes() == video
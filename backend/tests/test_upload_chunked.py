@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import random
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from conftest import auth_token, http_event, lead_video_bytes, load_function
+
+upload_chunked = load_function('upload-chunked')
+upload_reaper = load_function('upload-reaper')
+
+CHUNK_SIZE = upload_chunked.MIN_CHUNK_SIZE
+# Size of the synthetic upload in the finalize memory test
+LARGE_UPLOAD_MB = int(os.environ.get('LARGE_UPLOAD_MB', '256'))
+
+
+def start_upload(token, upload_id, video):
+    response = upload_chunked.handler(http_event('POST', token, body={
+        'action': 'start_upload', 'upload_id': upload_id, 'total_size': len(video), 'chunk_size': CHUNK_SIZE
+    }), None)
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'])
+
+
+def send_chunk(token, upload_id, video, index):
+    chunk = video[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+    response = upload_chunked.handler(http_event(
+        'POST', token, query={'action': 'upload_chunk', 'upload_id': upload_id, 'chunk_index': str(index)},
+        body=chunk, headers={'Content-Type': 'application/octet-stream'}), None)
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'])
+
+
+def test_expired_session_resumes_from_scratch(db, user):
+    video = os.urandom(CHUNK_SIZE * 3 + 1000)
+    start_upload(user['token'], 'resume-1', video)
+    send_chunk(user['token'], 'resume-1', video, 0)
+    send_chunk(user['token'], 'resume-1', video, 2)
+    
+    result = upload_reaper.reap_uploads(db, 0, 50)
+    assert result['sessions_expired'] == 1
+    assert result['chunks_deleted'] == 1
+    
+    # The assembled prefix and the buffered chunk are gone, so every chunk is asked for again
+    session = start_upload(user['token'], 'resume-1', video)
+    assert session['missing_ranges'] == [[0, 3]]
+    
+    for index in range(4):
+        result = send_chunk(user['token'], 'resume-1', video, index)
+    assert result['upload_complete']
+    assert lead_video_bytes(db, result['lead_id']) == video
+
+
+
+def test_reaper_rejects_invalid_ttl_and_batch_settings(db, monkeypatch):
+    admin = auth_token('admin', 'admin')
+    for ttl_hours in ('soon', '0', '-1', 'nan', 'inf'):
+        response = upload_reaper.handler(http_event('POST', admin, query={'ttl_hours': ttl_hours}), None)
+        assert response['statusCode'] == 400, ttl_hours
+    
+    monkeypatch.setenv('REAPER_BATCH_SIZE', '0')
+    assert upload_reaper.handler({}, None)['statusCode'] == 500
+    monkeypatch.setenv('REAPER_BATCH_SIZE', '50')
+    monkeypatch.setenv('UPLOAD_SESSION_TTL_HOURS', 'nan')
+    assert upload_reaper.handler({}, None)['statusCode'] == 500
+
+def test_completed_session_is_not_reopened(db, user):
+    video = os.urandom(CHUNK_SIZE + 10)
+    start_upload(user['token'], 'done-1', video)
+    for index in range(2):
+        result = send_chunk(user['token'], 'done-1', video, index)
+    
+    again = start_upload(user['token'], 'done-1', video)
+    assert again['lead_id'] == result['lead_id']
+    assert again['upload_complete']
+
+
+def test_parallel_chunks_finalize_exactly_once(db, user):
+    for round_number in range(5):
+        upload_id = f'parallel-{round_number}'
+        video = os.urandom(CHUNK_SIZE * 15 + 777)
+        start_upload(user['token'], upload_id, video)
+        
+        # Eight writers, chunks in shuffled order, so several "last" chunks race to finalize
+        indexes = list(range(16))
+        random.Random(round_number).shuffle(indexes)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda index: send_chunk(user['token'], upload_id, video, index), indexes))
+        
+        lead_ids = {result['lead_id'] for result in results if result.get('upload_complete')}
+        assert len(lead_ids) == 1
+        lead_id = lead_ids.pop()
+        with db.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM video_leads WHERE id >= %s", (lead_id,))
+            assert cursor.fetchone()[0] == 1
+            cursor.execute("SELECT status FROM chunked_uploads WHERE upload_id = %s", (upload_id,))
+            assert cursor.fetchone()[0] == 'completed'
+            cursor.execute("SELECT COUNT(*) FROM upload_chunks WHERE upload_id = %s", (upload_id,))
+            assert cursor.fetchone()[0] == 0
+        assert lead_video_bytes(db, lead_id) == video
+
+
+def test_finalize_memory_stays_near_one_chunk(db, user):
+    # Synthetic multi-hundred-MB upload; chunks are generated on the fly so the test itself stays small too
+    chunk_size = 4 * 1024 * 1024
+    total_chunks = LARGE_UPLOAD_MB * 1024 * 1024 // chunk_size
+    chunk = lambda index: random.Random(index).randbytes(chunk_size)
+    response = upload_chunked.handler(http_event('POST', user['token'], body={
+        'action': 'start_upload', 'upload_id': 'large-1', 'total_size': total_chunks * chunk_size, 'chunk_size': chunk_size
+    }), None)
+    assert response['statusCode'] == 200, response['body']
+    
+    def chunk_event(index):
+        return http_event(
+            'POST', user['token'], query={'action': 'upload_chunk', 'upload_id': 'large-1', 'chunk_index': str(index)},
+            body=chunk(index), headers={'Content-Type': 'application/octet-stream'})
+    
+    # Chunk 0 goes last, so the final request assembles every buffered chunk
+    for index in range(1, total_chunks):
+        assert upload_chunked.handler(chunk_event(index), None)['statusCode'] == 200
+    
+    last_event = chunk_event(0)
+    tracemalloc.start()
+    try:
+        response = upload_chunked.handler(last_event, None)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result = json.loads(response['body'])
+    assert result['upload_complete']
+    assert peak < 3 * chunk_size, f'finalize peaked at {peak / 1024 / 1024:.1f} MB'
+    
+    expected = hashlib.sha256()
+    for index in range(total_chunks):
+        expected.update(chunk(index))
+    with db.cursor() as cursor:
+        cursor.execute("SELECT video_oid FROM video_leads WHERE id = %s", (result['lead_id'],))
+        video_object = db.lobject(cursor.fetchone()[0], 'rb')
+    stored = hashlib.sha256()
+    for block in iter(lambda: video_object.read(chunk_size), b''):
+        stored.update(block)
+    video_object.close()
+    assert stored.hexdigest() == expected.hexdigest()
+
+
+def test_non_numeric_chunk_index_is_rejected(db, user):
+    video = os.urandom(CHUNK_SIZE)
+    start_upload(user['token'], 'bad-index', video)
+    response = upload_chunked.handler(http_event(
+        'POST', user['token'], query={'action': 'upload_chunk', 'upload_id': 'bad-index', 'chunk_index': 'first'},
+        body=video, headers={'Content-Type': 'application/octet-stream'}), None)
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error'] == 'Invalid chunk index'
+    
+    # A missing index is not chunk 0
+    response = upload_chunked.handler(http_event(
+        'POST', user['token'], query={'action': 'upload_chunk', 'upload_id': 'bad-index'},
+        body=video, headers={'Content-Type': 'application/octet-stream'}), None)
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error'] == 'Invalid chunk index'
+
+
+def test_text_body_outside_latin1_is_rejected(db, user):
+    video = os.urandom(CHUNK_SIZE)
+    start_upload(user['token'], 'bad-body', video)
+    event = http_event('POST', user['token'], query={'action': 'upload_chunk', 'upload_id': 'bad-body', 'chunk_index': '0'},
+                       headers={'Content-Type': 'application/octet-stream'})
+    event['body'] = 'not bytes \u2603'
+    response = upload_chunked.handler(event, None)
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error'] == 'Invalid chunk data'
+
+
+
+def test_chunk_length_is_checked_against_the_split_under_the_lock(db, user, monkeypatch):
+    video = os.urandom(CHUNK_SIZE * 4)
+    start_upload(user['token'], 'resized', video)
+    send_chunk(user['token'], 'resized', video, 0)
+    
+    # A resize commits after the chunk request read the session, but before it takes the lock
+    append_chunks = upload_chunked.append_chunks
+    def resize_then_append(*args):
+        response = upload_chunked.handler(http_event('POST', user['token'], body={
+            'action': 'resize_chunks', 'upload_id': 'resized', 'chunk_size': 2 * CHUNK_SIZE
+        }), None)
+        assert response['statusCode'] == 200, response['body']
+        return append_chunks(*args)
+    monkeypatch.setattr(upload_chunked, 'append_chunks', resize_then_append)
+    
+    response = upload_chunked.handler(http_event(
+        'POST', user['token'], query={'action': 'upload_chunk', 'upload_id': 'resized', 'chunk_index': '1'},
+        body=video[CHUNK_SIZE:2 * CHUNK_SIZE], headers={'Content-Type': 'application/octet-stream'}), None)
+    assert response['statusCode'] == 400, response['body']
+    with db.cursor() as cursor:
+        cursor.execute("SELECT assembled_bytes, received_bytes FROM chunked_uploads WHERE upload_id = 'resized'")
+        assert cursor.fetchone() == (CHUNK_SIZE, CHUNK_SIZE)
+
+def test_finished_upload_of_deleted_lead_is_gone(db, user):
+    video = os.urandom(CHUNK_SIZE + 10)
+    start_upload(user['token'], 'deleted-1', video)
+    for index in range(2):
+        result = send_chunk(user['token'], 'deleted-1', video, index)
+    with db.cursor() as cursor:
+        cursor.execute("DELETE FROM video_asset_jobs")
+        cursor.execute("DELETE FROM video_leads WHERE id = %s", (result['lead_id'],))
+    db.commit()
+    
+    # Retries of the start or of a chunk get a definite answer instead of a server error
+    restart = upload_chunked.handler(http_event('POST', user['token'], body={
+        'action': 'start_upload', 'upload_id': 'deleted-1', 'total_size': len(video), 'chunk_size': CHUNK_SIZE
+    }), None)
+    assert restart['statusCode'] == 410
+    retry = upload_chunked.handler(http_event(
+        'POST', user['token'], query={'action': 'upload_chunk', 'upload_id': 'deleted-1', 'chunk_index': '1'},
+        body=video[CHUNK_SIZE:], headers={'Content-Type': 'application/octet-stream'}), None)
+    assert retry['statusCode'] == 410
+
+
+def test_recommended_chunk_size_ignores_idle_pauses(db, user):
+    video = os.urandom(CHUNK_SIZE * 4)
+    start_upload(user['token'], 'paused', video)
+    send_chunk(user['token'], 'paused', video, 0)
+    
+    # The tab was in the background for an hour before the next chunk
+    with db.cursor() as cursor:
+        cursor.execute("""
+            UPDATE chunked_uploads SET created_at = created_at - INTERVAL '1 hour', last_chunk_at = last_chunk_at - INTERVAL '1 hour' 
+            WHERE upload_id = 'paused'
+        """)
+    db.commit()
+    send_chunk(user['token'], 'paused', video, 1)
+    
+    with db.cursor() as cursor:
+        cursor.execute("SELECT transfer_bytes, transfer_seconds FROM chunked_uploads WHERE upload_id = 'paused'")
+        transfer_bytes, transfer_seconds = cursor.fetchone()
+        assert transfer_bytes == CHUNK_SIZE
+        assert transfer_seconds < upload_chunked.TRANSFER_IDLE_SECONDS
+        
+        # Measured over the first chunk only, this local upload is far faster than the hour it took
+        assert upload_chunked.recommend_chunk_size(cursor, user['id'], 'paused') == upload_chunked.MAX_CHUNK_SIZE - upload_chunked.MAX_CHUNK_SIZE % CHUNK_SIZE
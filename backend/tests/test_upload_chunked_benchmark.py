@@ -0,0 +1,110 @@
+'''
+Chunk ingestion benchmarks; run with -s to see the figures. Assertions cover only what does not depend on the machine.
+'''
+import base64
+import json
+import random
+import time
+import tracemalloc
+from conftest import http_event, lead_video_bytes, load_function
+
+upload_chunked = load_function('upload-chunked')
+
+CHUNK_SIZE = 4 * 1024 * 1024
+TOTAL_CHUNKS = 8
+
+
+def chunk(index):
+    return random.Random(index).randbytes(CHUNK_SIZE)
+
+
+def chunk_event(token, upload_id, index, mode):
+    '''Chunk request as JSON with base64 chunk_data, or as a raw application/octet-stream body'''
+    if mode == 'json':
+        return http_event('POST', token, body={
+            'action': 'upload_chunk', 'upload_id': upload_id, 'chunk_index': index,
+            'chunk_data': base64.b64encode(chunk(index)).decode('ascii')
+        })
+    return http_event('POST', token, query={'action': 'upload_chunk', 'upload_id': upload_id, 'chunk_index': str(index)},
+                      body=chunk(index), headers={'Content-Type': 'application/octet-stream'})
+
+
+def wire_bytes(event):
+    '''Request body size as sent by the client, before the gateway base64-encodes binary bodies'''
+    if event['isBase64Encoded']:
+        return len(base64.b64decode(event['body']))
+    return len(event['body'].encode('utf-8'))
+
+
+def upload(token, upload_id, mode):
+    '''Send every chunk in order; returns the lead, wire bytes, handler seconds and the largest per-request allocation peak'''
+    response = upload_chunked.handler(http_event('POST', token, body={
+        'action': 'start_upload', 'upload_id': upload_id, 'total_size': TOTAL_CHUNKS * CHUNK_SIZE, 'chunk_size': CHUNK_SIZE
+    }), None)
+    assert response['statusCode'] == 200, response['body']
+    
+    sent, elapsed, peak = 0, 0.0, 0
+    for index in range(TOTAL_CHUNKS):
+        event = chunk_event(token, upload_id, index, mode)
+        sent += wire_bytes(event)
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            response = upload_chunked.handler(event, None)
+            elapsed += time.perf_counter() - started
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+        assert response['statusCode'] == 200, response['body']
+    
+    result = json.loads(response['body'])
+    assert result['upload_complete']
+    return result['lead_id'], sent, elapsed, peak
+
+
+def test_binary_and_json_chunks_store_the_same_video(db, user):
+    json_lead, json_sent, json_seconds, _ = upload(user['token'], 'bench-json', 'json')
+    binary_lead, binary_sent, binary_seconds, _ = upload(user['token'], 'bench-binary', 'binary')
+    
+    megabytes = TOTAL_CHUNKS * CHUNK_SIZE / 1024 / 1024
+    print(f"\njson:   {megabytes / json_seconds:7.1f} MB/s, {json_sent / 1024 / 1024:.1f} MB on the wire")
+    print(f"binary: {megabytes / binary_seconds:7.1f} MB/s, {binary_sent / 1024 / 1024:.1f} MB on the wire")
+    
+    assert lead_video_bytes(db, json_lead) == lead_video_bytes(db, binary_lead)
+    # Binary mode sends the chunk bytes alone; JSON pays the base64 third on top
+    assert binary_sent == TOTAL_CHUNKS * CHUNK_SIZE
+    assert json_sent > TOTAL_CHUNKS * CHUNK_SIZE * 4 // 3
+
+
+def decode_cost(decode, encoded, rounds=5):
+    '''Allocation peak and CPU milliseconds per MB of one base64 decode'''
+    tracemalloc.start()
+    try:
+        decoded = decode(encoded)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    started = time.process_time()
+    for _ in range(rounds):
+        decode(encoded)
+    cpu_ms_per_mb = (time.process_time() - started) * 1000 / rounds / (len(decoded) / 1024 / 1024)
+    return decoded, peak, cpu_ms_per_mb
+
+
+def test_chunk_decode_allocates_only_the_decoded_bytes(db, user):
+    encoded = base64.b64encode(chunk(0)).decode('ascii')
+    before, before_peak, before_cpu = decode_cost(base64.b64decode, encoded)
+    after, after_peak, after_cpu = decode_cost(upload_chunked.binascii.a2b_base64, encoded)
+    print(f"\nb64decode:  {before_peak / CHUNK_SIZE:.2f} x chunk allocated, {before_cpu:.2f} ms CPU/MB")
+    print(f"a2b_base64: {after_peak / CHUNK_SIZE:.2f} x chunk allocated, {after_cpu:.2f} ms CPU/MB")
+    assert after == before == chunk(0)
+    # b64decode first copies the str into ASCII bytes; a2b_base64 reads it in place
+    assert after_peak < CHUNK_SIZE * 1.05 < before_peak
+    
+    # In-order chunks go to the large object as decoded, with no further copy in the function
+    _, _, _, binary_peak = upload(user['token'], 'alloc-binary', 'binary')
+    _, _, _, json_peak = upload(user['token'], 'alloc-json', 'json')
+    print(f"request peak: binary {binary_peak / CHUNK_SIZE:.2f} x chunk, json {json_peak / CHUNK_SIZE:.2f} x chunk")
+    assert binary_peak < CHUNK_SIZE * 1.25
+    # JSON mode adds only the parsed chunk_data string (4/3 of a chunk)
+    assert json_peak < CHUNK_SIZE * 2.5
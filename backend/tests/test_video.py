@@ -0,0 +1,142 @@
+import base64
+import json
+import os
+import time
+import pytest
+from urllib.parse import parse_qsl
+from conftest import http_event, insert_video_lead, load_function
+
+video = load_function('video')
+
+BLOCK = video.STORAGE_BLOCK_SIZE
+
+
+@pytest.fixture
+def block_cache(monkeypatch):
+    '''Empty block cache that holds two blocks, smaller than the test videos'''
+    monkeypatch.setattr(video, 'VIDEO_CACHE_MAX_BYTES', 2 * BLOCK)
+    video.video_cache.clear()
+    video.video_cache_stats.update(hits=0, misses=0, evictions=0, bytes=0)
+    return video.video_cache
+
+
+def playback_query(token, lead_id):
+    response = video.handler(http_event('GET', token, query={'id': str(lead_id), 'action': 'playback_url'}), None)
+    assert response['statusCode'] == 200, response['body']
+    return dict(parse_qsl(json.loads(response['body'])['playback_query']))
+
+
+def signed_get(query, headers=None):
+    return video.handler(http_event('GET', query=query, headers=headers), None)
+
+
+def test_signed_range_is_served_from_block_cache(db, user, block_cache):
+    content = os.urandom(3 * BLOCK + 1000)
+    lead_id = insert_video_lead(db, user['id'], content)
+    query = playback_query(user['token'], lead_id)
+    
+    range_header = {'Range': f'bytes={BLOCK - 10}-{BLOCK + 9}'}
+    first = signed_get(query, range_header)
+    assert first['statusCode'] == 206
+    assert first['headers']['X-Cache'] == 'MISS'
+    assert base64.b64decode(first['body']) == content[BLOCK - 10:BLOCK + 10]
+    
+    # Only the two touched blocks are cached, although the video is larger than the cache
+    assert len(block_cache) == 2
+    second = signed_get(query, range_header)
+    assert second['headers']['X-Cache'] == 'HIT'
+    assert second['body'] == first['body']
+    
+    # A range past the cached blocks evicts the least recently used one
+    tail = signed_get(query, {'Range': f'bytes={3 * BLOCK}-'})
+    assert base64.b64decode(tail['body']) == content[3 * BLOCK:]
+    assert video.video_cache_stats['evictions'] == 1
+
+
+def test_signed_playback_revalidates_with_etag(db, user, block_cache):
+    lead_id = insert_video_lead(db, user['id'], os.urandom(5000))
+    query = playback_query(user['token'], lead_id)
+    
+    response = signed_get(query, {'Range': 'bytes=0-99'})
+    etag = response['headers']['ETag']
+    
+    not_modified = signed_get(query, {'Range': 'bytes=0-99', 'If-None-Match': etag})
+    assert not_modified['statusCode'] == 304
+    assert not_modified['headers']['ETag'] == etag
+    assert not_modified['body'] == ''
+    
+    # A fresh URL for the same video keeps the ETag
+    assert signed_get(playback_query(user['token'], lead_id), {'If-None-Match': etag})['statusCode'] == 304
+
+
+def add_hls_rendition(conn, lead_id, segments):
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO video_hls_renditions (lead_id, target_duration, segment_count, total_bytes) VALUES (%s, 6, %s, %s)",
+                       (lead_id, len(segments), sum(len(segment) for segment in segments)))
+        for index, segment in enumerate(segments):
+            segment_object = conn.lobject(0, 'wb')
+            segment_object.write(segment)
+            segment_object.close()
+            cursor.execute("""
+                INSERT INTO video_hls_segments (lead_id, segment_index, duration, storage_backend, storage_key, segment_size)
+                VALUES (%s, %s, 6.0, 'postgres', %s, %s)
+            """, (lead_id, index, str(segment_object.oid), len(segment)))
+    conn.commit()
+
+
+def test_hls_segments_outlive_the_playlist_url(db, user, monkeypatch):
+    lead_id = insert_video_lead(db, user['id'], os.urandom(1000))
+    segments = [os.urandom(300), os.urandom(200)]
+    add_hls_rendition(db, lead_id, segments)
+    
+    response = video.handler(http_event('GET', user['token'], query={'id': str(lead_id), 'action': 'playback_url'}), None)
+    playlist_query = dict(parse_qsl(json.loads(response['body'])['hls_query']))
+    playlist = signed_get(playlist_query)
+    assert playlist['statusCode'] == 200
+    segment_uris = [line for line in playlist['body'].splitlines() if line.startswith('?')]
+    assert len(segment_uris) == 2
+    
+    # Long after the playlist URL expired, a player still loads the segments it listed
+    later = time.time() + video.PLAYBACK_URL_TTL_SECONDS + 3600
+    monkeypatch.setattr(video.time, 'time', lambda: later)
+    assert signed_get(playlist_query)['statusCode'] == 403
+    segment = signed_get(dict(parse_qsl(segment_uris[1][1:])))
+    assert segment['statusCode'] == 200
+    assert base64.b64decode(segment['body']) == segments[1]
+
+
+def test_range_headers_describe_the_bytes_sent(db, user, block_cache, monkeypatch):
+    content = os.urandom(5000)
+    lead_id = insert_video_lead(db, user['id'], content)
+    monkeypatch.setattr(video, 'MAX_RANGE_BYTES', 1000)
+    
+    # Clamped to MAX_RANGE_BYTES
+    response = video.handler(http_event('GET', user['token'], query={'id': str(lead_id)}, headers={'Range': 'bytes=100-'}), None)
+    body = base64.b64decode(response['body'])
+    assert body == content[100:1100]
+    assert response['headers']['Content-Length'] == str(len(body))
+    assert response['headers']['Content-Range'] == 'bytes 100-1099/5000'
+    
+    # A stored video shorter than its recorded size ends the range where the bytes end
+    with db.cursor() as cursor:
+        cursor.execute("UPDATE video_leads SET video_size = 6000 WHERE id = %s", (lead_id,))
+    db.commit()
+    response = video.handler(http_event('GET', user['token'], query={'id': str(lead_id)}, headers={'Range': 'bytes=4500-5499'}), None)
+    body = base64.b64decode(response['body'])
+    assert body == content[4500:]
+    assert response['headers']['Content-Length'] == '500'
+    assert response['headers']['Content-Range'] == 'bytes 4500-4999/6000'
+
+
+def test_plain_signed_get_is_one_capped_range_past_the_cache(db, user, block_cache, monkeypatch):
+    content = os.urandom(3 * BLOCK)
+    lead_id = insert_video_lead(db, user['id'], content)
+    query = playback_query(user['token'], lead_id)
+    monkeypatch.setattr(video, 'MAX_RANGE_BYTES', BLOCK)
+    
+    response = signed_get(query)
+    assert response['statusCode'] == 206
+    assert base64.b64decode(response['body']) == content[:BLOCK]
+    assert response['headers']['Content-Range'] == f'bytes 0-{BLOCK - 1}/{3 * BLOCK}'
+    assert 'ETag' in response['headers']
+    assert len(block_cache) == 0
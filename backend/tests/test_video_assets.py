@@ -0,0 +1,90 @@
+import hashlib
+import os
+import struct
+from conftest import lead_video_bytes, load_function
+from test_upload_chunked import CHUNK_SIZE, send_chunk, start_upload
+
+video_assets = load_function('video-assets')
+
+
+def upload_video(user, upload_id, video):
+    start_upload(user['token'], upload_id, video)
+    for index in range((len(video) + CHUNK_SIZE - 1) // CHUNK_SIZE):
+        result = send_chunk(user['token'], upload_id, video, index)
+    assert result['upload_complete']
+    return result['lead_id']
+
+
+def lead_storage(conn, lead_id):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT blob_sha256, video_oid FROM video_leads WHERE id = %s", (lead_id,))
+        return cursor.fetchone()
+
+
+def test_store_job_moves_finalized_upload_into_blob_store(db, user):
+    video = os.urandom(CHUNK_SIZE + 500)
+    lead_id = upload_video(user, 'store-1', video)
+    
+    # Finalizing leaves hashing to the worker
+    blob_sha256, video_oid = lead_storage(db, lead_id)
+    assert blob_sha256 is None and video_oid is not None
+    assert lead_video_bytes(db, lead_id) == video
+    
+    result = video_assets.process_asset_jobs(db, 5, render=False)
+    assert result['jobs_done'] == 1
+    
+    blob_sha256, video_oid = lead_storage(db, lead_id)
+    assert blob_sha256 == hashlib.sha256(video).hexdigest()
+    assert video_oid is None
+    assert lead_video_bytes(db, lead_id) == video
+    with db.cursor() as cursor:
+        cursor.execute("SELECT kind, status FROM video_asset_jobs WHERE lead_id = %s ORDER BY id", (lead_id,))
+        assert cursor.fetchall() == [('store', 'done'), ('images', 'pending')]
+
+
+def test_identical_uploads_share_one_blob(db, user):
+    video = os.urandom(CHUNK_SIZE + 500)
+    first = upload_video(user, 'dup-1', video)
+    second = upload_video(user, 'dup-2', video)
+    video_assets.process_asset_jobs(db, 5, render=False)
+    
+    with db.cursor() as cursor:
+        cursor.execute("SELECT ref_count FROM video_blobs")
+        assert cursor.fetchall() == [(2,)]
+        cursor.execute("SELECT COUNT(*) FROM pg_largeobject_metadata")
+        assert cursor.fetchone()[0] == 1
+    assert lead_video_bytes(db, first) == lead_video_bytes(db, second) == video
+
+
+def mp4_box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def moov_last_mp4(media):
+    '''ftyp, mdat, then a moov whose single chunk offset points at the media'''
+    ftyp = mp4_box(b'ftyp', b'isom\x00\x00\x02\x00isom')
+    mdat = mp4_box(b'mdat', media)
+    stco = mp4_box(b'stco', struct.pack('>III', 0, 1, len(ftyp) + 8))
+    moov = mp4_box(b'moov', mp4_box(b'trak', mp4_box(b'mdia', mp4_box(b'minf', mp4_box(b'stbl', stco)))))
+    return ftyp + mdat + moov, len(ftyp), len(moov)
+
+
+def test_store_job_moves_moov_ahead_of_mdat(db, user):
+    media = os.urandom(CHUNK_SIZE + 500)
+    video, ftyp_size, moov_size = moov_last_mp4(media)
+    lead_id = upload_video(user, 'faststart-1', video)
+    
+    # The request that sends the last chunk only saves the assembled bytes
+    assert lead_video_bytes(db, lead_id) == video
+    
+    video_assets.process_asset_jobs(db, 5, render=False)
+    
+    stored = lead_video_bytes(db, lead_id)
+    assert len(stored) == len(video)
+    assert stored[ftyp_size + 4:ftyp_size + 8] == b'moov'
+    (chunk_offset,) = struct.unpack('>I', stored[ftyp_size + moov_size - 4:ftyp_size + moov_size])
+    assert stored[chunk_offset:chunk_offset + len(media)] == media
+    assert lead_storage(db, lead_id)[0] == hashlib.sha256(stored).hexdigest()
+    with db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM pg_largeobject_metadata")
+        assert cursor.fetchone()[0] == 1
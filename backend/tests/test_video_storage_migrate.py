@@ -0,0 +1,10 @@
+from conftest import auth_token, http_event, load_function
+
+video_storage_migrate = load_function('video-storage-migrate')
+
+
+def test_invalid_batch_size_is_rejected(db):
+    admin = auth_token('admin', 'admin')
+    for batch_size in ('many', '0', '-5', '2.5'):
+        response = video_storage_migrate.handler(http_event('POST', admin, query={'batch_size': batch_size}), None)
+        assert response['statusCode'] == 400, batch_size
@@ -3,10 +3,43 @@ import os
 import jwt
 import psycopg2
 import base64
+import binascii
 import hashlib
+import math
+import struct
 import tempfile
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple, Iterator
+from psycopg2.extras import execute_values
+
+# Negotiated chunk sizes; the ceiling leaves room for the gateway's base64 encoding of binary bodies
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = int(os.environ.get('MAX_REQUEST_BYTES', str(7 * 1024 * 1024))) * 3 // 4
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+
+# Recommended chunks should take about this long to send at the measured throughput
+TARGET_CHUNK_SECONDS = 4
+# A longer pause between two chunk arrivals is idle time (paused tab, lost network), not transfer time
+TRANSFER_IDLE_SECONDS = float(os.environ.get('TRANSFER_IDLE_SECONDS', '60'))
+
+# Batch frame record header: chunk_index, payload length, MD5 digest (all zeros = not verified)
+CHUNK_FRAME_HEADER = struct.Struct('>II16s')
+
+# MP4 box header, read when probing container metadata
+MP4_BOX_HEADER = struct.Struct('>I4s')
+
+# Container probe: how much of the head and tail of a WebM file is read, and the EBML elements it walks
+PROBE_WINDOW_BYTES = 64 * 1024
+WEBM_CLUSTER_ID = b'\x1f\x43\xb6\x75'
+# EBML header, Segment, Info, Tracks, TrackEntry, Video, Cluster, BlockGroup
+EBML_MASTER_ELEMENTS = (0x1A45DFA3, 0x18538067, 0x1549A966, 0x1654AE6B, 0xAE, 0xE0, 0x1F43B675, 0xA0)
+# TrackType, CodecID, PixelWidth, PixelHeight
+WEBM_TRACK_FIELDS = {0x83: 'type', 0x86: 'codec', 0xB0: 'width', 0xBA: 'height'}
+
+# Idempotency-Key: how long a finished request's response is replayed, and after how long a claim whose request never finished may be taken over
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+IDEMPOTENCY_PENDING_SECONDS = 600
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
 
 def verify_token(token: str) -> Optional[Dict[str, Any]]:
     '''Verify JWT token and return user data'''
@@ -17,7 +50,153 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
     except:
         return None
 
+def get_header(headers: Dict[str, Any], name: str) -> Optional[str]:
+    '''Case-insensitive header lookup'''
+    lowered = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+def read_binary_chunk(event: Dict[str, Any]):
+    '''Read chunk parameters from query string/headers and raw bytes from an application/octet-stream body;
+    raises ValueError when the body cannot be turned back into bytes'''
+    headers = event.get('headers', {}) or {}
+    query_params = event.get('queryStringParameters') or {}
+    body_data = {
+        'action': query_params.get('action', 'upload_chunk'),
+        'upload_id': query_params.get('upload_id') or get_header(headers, 'X-Upload-Id'),
+        'chunk_index': query_params.get('chunk_index') or get_header(headers, 'X-Chunk-Index'),
+        'chunk_hash': query_params.get('chunk_hash') or get_header(headers, 'X-Chunk-Hash') or ''
+    }
+    
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        chunk_bytes = binascii.a2b_base64(body)
+    elif isinstance(body, str):
+        # Body was passed through as text: latin-1 maps code points back to bytes one-to-one;
+        # text outside it (UnicodeEncodeError) was never a byte string
+        chunk_bytes = body.encode('latin-1')
+    else:
+        chunk_bytes = bytes(body)
+    
+    return body_data, chunk_bytes
+
+def idempotency_fingerprint(event: Dict[str, Any]) -> str:
+    '''Hash of what makes two requests the same: method, query string and body'''
+    digest = hashlib.sha256()
+    digest.update((event.get('httpMethod') or '').encode())
+    digest.update(json.dumps(event.get('queryStringParameters') or {}, sort_keys=True).encode())
+    body = event.get('body') or ''
+    digest.update(body.encode() if isinstance(body, str) else body)
+    return digest.hexdigest()
+
+def claim_idempotency_key(conn, user_id: int, scope: str, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    '''
+    Reserve an Idempotency-Key before the request runs. Returns None when the request should run,
+    otherwise the response to send instead: the stored one for a finished key, 409 while the first
+    request with the key is still running, 422 when the key was sent with a different request
+    '''
+    cursor = conn.cursor()
+    # A new key, an expired one, or one whose request died without finishing is (re)claimed
+    cursor.execute("""
+        INSERT INTO idempotency_keys (user_id, scope, idempotency_key, request_hash, expires_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+        ON CONFLICT (user_id, scope, idempotency_key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status = 'pending', response_status = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE idempotency_keys.expires_at < CURRENT_TIMESTAMP
+           OR (idempotency_keys.status = 'pending' AND idempotency_keys.request_hash = EXCLUDED.request_hash
+               AND idempotency_keys.created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+        RETURNING 1
+    """, (user_id, scope, key, fingerprint, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_PENDING_SECONDS))
+    if cursor.fetchone():
+        conn.commit()
+        return None
+    
+    cursor.execute("""
+        SELECT request_hash, status, response_body FROM idempotency_keys
+        WHERE user_id = %s AND scope = %s AND idempotency_key = %s
+    """, (user_id, scope, key))
+    row = cursor.fetchone()
+    conn.commit()
+    
+    if row and row[0] != fingerprint:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Idempotency-Key was already used for a different request'})
+        }
+    if not row or row[1] != 'done':
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': '5'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'A request with this Idempotency-Key is still in progress'})
+        }
+    
+    response = json.loads(row[2])
+    response['headers'] = {**response.get('headers', {}), 'Idempotent-Replayed': 'true'}
+    return response
+
+def finish_idempotency_key(conn, user_id: int, scope: str, key: str, response: Optional[Dict[str, Any]]) -> None:
+    '''Store a successful response for replay; any other outcome frees the key so a retry runs again'''
+    cursor = conn.cursor()
+    if response is not None and response.get('statusCode', 500) < 400:
+        cursor.execute("""
+            UPDATE idempotency_keys SET status = 'done', response_status = %s, response_body = %s
+            WHERE user_id = %s AND scope = %s AND idempotency_key = %s
+        """, (response['statusCode'], json.dumps(response), user_id, scope, key))
+    else:
+        cursor.execute("""
+            DELETE FROM idempotency_keys
+            WHERE user_id = %s AND scope = %s AND idempotency_key = %s AND status = 'pending'
+        """, (user_id, scope, key))
+    conn.commit()
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Entry point; a POST with an Idempotency-Key runs once per key and repeats get the stored response
+    Args: event with httpMethod, headers (X-Auth-Token, optional Idempotency-Key)
+    Returns: Response of handle_request, or the stored response when the key was already used
+    '''
+    headers = event.get('headers') or {}
+    idempotency_key = get_header(headers, 'Idempotency-Key')
+    if event.get('httpMethod') != 'POST' or not idempotency_key:
+        return handle_request(event, context)
+    
+    # Unauthenticated requests fall through so handle_request answers them as usual
+    user_data = verify_token(get_header(headers, 'X-Auth-Token') or '')
+    db_url = os.environ.get('DATABASE_URL')
+    if not user_data or not db_url:
+        return handle_request(event, context)
+    
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': f'Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters'})
+        }
+    
+    conn = psycopg2.connect(db_url)
+    try:
+        # Checked before the body is decoded, so a repeated upload is never stored again
+        replay = claim_idempotency_key(conn, user_data['user_id'], 'upload-chunked', idempotency_key, idempotency_fingerprint(event))
+        if replay is not None:
+            return replay
+        
+        response = None
+        try:
+            response = handle_request(event, context)
+        finally:
+            finish_idempotency_key(conn, user_data['user_id'], 'upload-chunked', idempotency_key, response)
+        return response
+    finally:
+        conn.close()
+
+def handle_request(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Handle chunked video upload for large files (>100MB)
     Args: event with httpMethod, headers (X-Auth-Token), body with chunk data
@@ -33,7 +212,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Upload-Id, X-Chunk-Index, X-Chunk-Hash, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'isBase64Encoded': False,
@@ -78,7 +257,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         cursor = conn.cursor()
         
         if method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
+            content_type = get_header(headers, 'Content-Type') or ''
+            if content_type.startswith('application/octet-stream'):
+                # Binary mode: raw chunk bytes in the body, no base64-in-JSON
+                try:
+                    body_data, chunk_bytes = read_binary_chunk(event)
+                except ValueError:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Invalid chunk data'})
+                    }
+            else:
+                body_data = json.loads(event.get('body', '{}'))
+                chunk_bytes = None
             action = body_data.get('action', 'upload_chunk')
             
             if action == 'start_upload':
@@ -86,11 +279,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 upload_id = body_data.get('upload_id')
                 total_size = body_data.get('total_size', 0)
                 total_chunks = body_data.get('total_chunks', 0)
+                chunk_size = body_data.get('chunk_size')
                 filename = body_data.get('filename', 'video.mp4')
                 title = body_data.get('title', '')
                 comments = body_data.get('comments', '')
                 
-                if not upload_id or not total_size or not total_chunks:
+                if not upload_id or not total_size:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -98,17 +292,59 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'body': json.dumps({'error': 'Missing upload parameters'})
                     }
                 
+                recommended_chunk_size = recommend_chunk_size(cursor, user_id)
+                if not total_chunks:
+                    # Server-driven split: reuse the split of a restarted session, otherwise negotiate one
+                    cursor.execute("""
+                        SELECT total_chunks, chunk_size FROM chunked_uploads 
+                        WHERE upload_id = %s AND user_id = %s AND chunk_size IS NOT NULL
+                    """, (upload_id, user_id))
+                    existing = cursor.fetchone()
+                    if existing:
+                        total_chunks, chunk_size = existing
+                    else:
+                        chunk_size = clamp_chunk_size(chunk_size) if chunk_size else recommended_chunk_size
+                        total_chunks = math.ceil(total_size / chunk_size)
+                
                 # Create upload session record
                 cursor.execute("""
                     INSERT INTO chunked_uploads 
-                    (upload_id, user_id, filename, title, comments, total_size, total_chunks, status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, 'active')
+                    (upload_id, user_id, filename, title, comments, total_size, total_chunks, chunk_size, status, received_bitmap)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'active', %s)
                     ON CONFLICT (upload_id) DO UPDATE SET
                         total_size = EXCLUDED.total_size,
                         total_chunks = EXCLUDED.total_chunks,
-                        status = 'active'
-                """, (upload_id, user_id, filename, title, comments, total_size, total_chunks))
+                        chunk_size = EXCLUDED.chunk_size,
+                        status = 'active',
+                        updated_at = CURRENT_TIMESTAMP,
+                        received_bitmap = CASE 
+                            WHEN chunked_uploads.total_chunks = EXCLUDED.total_chunks 
+                            THEN COALESCE(chunked_uploads.received_bitmap, EXCLUDED.received_bitmap) 
+                            ELSE EXCLUDED.received_bitmap 
+                        END
+                    WHERE chunked_uploads.user_id = EXCLUDED.user_id 
+                      AND chunked_uploads.status IN ('active', 'expired')
+                    RETURNING received_bitmap
+                """, (upload_id, user_id, filename, title, comments, total_size, total_chunks, chunk_size,
+                      bytes((total_chunks + 7) // 8)))
                 
+                session = cursor.fetchone()
+                if not session:
+                    # The id belongs to a finished (or finishing) upload, or to another user: never reopen it
+                    conn.rollback()
+                    cursor.execute("SELECT status FROM chunked_uploads WHERE upload_id = %s AND user_id = %s", (upload_id, user_id))
+                    existing = cursor.fetchone()
+                    if existing and existing[0] == 'completed':
+                        return completed_upload_response(cursor, upload_id)
+                    return {
+                        'statusCode': 409,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Upload session cannot be restarted'})
+                    }
+                
+                # A restarted session resumes from the first chunk not yet received; an expired one starts over
+                missing = missing_ranges(session[0], total_chunks)
                 conn.commit()
                 
                 return {
@@ -118,7 +354,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({
                         'success': True,
                         'upload_id': upload_id,
-                        'next_chunk': 0,
+                        'chunk_size': chunk_size,
+                        'total_chunks': total_chunks,
+                        'recommended_chunk_size': recommended_chunk_size,
+                        'next_chunk': missing[0][0] if missing else total_chunks,
+                        'missing_ranges': missing,
                         'message': 'Upload session initialized'
                     })
                 }
@@ -126,11 +366,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             elif action == 'upload_chunk':
                 # Upload individual chunk
                 upload_id = body_data.get('upload_id')
-                chunk_index = body_data.get('chunk_index', 0)
-                chunk_data = body_data.get('chunk_data', '')  # base64 encoded chunk
+                chunk_index = body_data.get('chunk_index')
+                chunk_data = body_data.get('chunk_data', '')  # base64 encoded chunk (JSON mode)
                 chunk_hash = body_data.get('chunk_hash', '')
                 
-                if not upload_id or not chunk_data:
+                if not upload_id or not (chunk_bytes or chunk_data):
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -138,6 +378,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'body': json.dumps({'error': 'Missing chunk data'})
                     }
                 
+                # Query string and header values arrive as text; JSON clients may send anything
+                try:
+                    chunk_index = int(chunk_index)
+                except (TypeError, ValueError):
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Invalid chunk index'})
+                    }
+                
                 # Verify upload session exists
                 cursor.execute("""
                     SELECT total_chunks, status FROM chunked_uploads 
@@ -154,6 +405,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     }
                 
                 total_chunks, status = upload_info
+                if status == 'completed':
+                    # Duplicate chunk from a parallel or retrying client: report the existing lead
+                    return completed_upload_response(cursor, upload_id)
                 if status != 'active':
                     return {
                         'statusCode': 400,
@@ -162,9 +416,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'body': json.dumps({'error': 'Upload session not active'})
                     }
                 
+                if chunk_index < 0 or chunk_index >= total_chunks:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Invalid chunk index'})
+                    }
+                
                 # Decode and verify chunk
                 try:
-                    chunk_bytes = base64.b64decode(chunk_data)
+                    if chunk_bytes is None:
+                        # a2b_base64 reads the ASCII str in place, without an intermediate bytes copy
+                        chunk_bytes = binascii.a2b_base64(chunk_data)
                     if chunk_hash:
                         actual_hash = hashlib.md5(chunk_bytes).hexdigest()
                         if actual_hash != chunk_hash:
@@ -182,25 +446,38 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'body': json.dumps({'error': 'Invalid chunk data'})
                     }
                 
-                # Store chunk
-                cursor.execute("""
-                    INSERT INTO upload_chunks (upload_id, chunk_index, chunk_data)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (upload_id, chunk_index) DO UPDATE SET chunk_data = EXCLUDED.chunk_data
-                """, (upload_id, chunk_index, chunk_bytes))
-                
-                conn.commit()
-                
-                # Check if all chunks uploaded
-                cursor.execute("""
-                    SELECT COUNT(*) FROM upload_chunks WHERE upload_id = %s
-                """, (upload_id,))
-                uploaded_chunks = cursor.fetchone()[0]
+                # Append chunk to the assembled video (or buffer it until the gap is filled); its length
+                # is checked there against the split read under the session lock
+                assembled_through, received_bitmap, status, total_chunks, accepted, rejected = append_chunks(cursor, conn, upload_id, [(chunk_index, chunk_bytes)])
+                if status == 'completed':
+                    # Finalized by a concurrent request while this one waited for the session lock
+                    conn.rollback()
+                    return completed_upload_response(cursor, upload_id)
+                if status != 'active':
+                    conn.rollback()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Upload session not active'})
+                    }
+                if chunk_index in rejected:
+                    conn.rollback()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Invalid chunk index' if rejected[chunk_index] == 'invalid_index'
+                                            else f'Chunk {chunk_index} does not match the chunk size of this upload'})
+                    }
+                missing = missing_ranges(received_bitmap, total_chunks)
+                uploaded_chunks = total_chunks - sum(end - start + 1 for start, end in missing)
                 
-                if uploaded_chunks >= total_chunks:
-                    # All chunks uploaded, assemble final video
+                if assembled_through + 1 >= total_chunks:
+                    # All chunks assembled, only metadata is left to flip
                     return assemble_video(cursor, conn, upload_id, user_id)
                 else:
+                    conn.commit()
                     return {
                         'statusCode': 200,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -210,11 +487,246 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                             'upload_id': upload_id,
                             'chunks_uploaded': uploaded_chunks,
                             'chunks_total': total_chunks,
-                            'next_chunk': uploaded_chunks,
+                            'next_chunk': missing[0][0] if missing else total_chunks,
+                            'missing_ranges': missing,
                             'progress': (uploaded_chunks / total_chunks) * 100
                         })
                     }
             
+            elif action == 'upload_chunks':
+                # Several chunks in one length-prefixed binary frame, one lock, one commit
+                upload_id = body_data.get('upload_id')
+                
+                if not upload_id or not chunk_bytes:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Missing chunk data'})
+                    }
+                
+                try:
+                    records = parse_chunk_batch(chunk_bytes)
+                except ValueError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': f'Invalid chunk batch: {str(e)}'})
+                    }
+                
+                cursor.execute("""
+                    SELECT total_chunks, status FROM chunked_uploads 
+                    WHERE upload_id = %s AND user_id = %s
+                """, (upload_id, user_id))
+                
+                upload_info = cursor.fetchone()
+                if not upload_info:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Upload session not found'})
+                    }
+                
+                total_chunks, status = upload_info
+                if status == 'completed':
+                    return completed_upload_response(cursor, upload_id)
+                if status != 'active':
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Upload session not active'})
+                    }
+                
+                # Verify each chunk's checksum; index and length are checked by append_chunks under the
+                # session lock, and rejected chunks are reported and skipped
+                results = {}
+                valid_chunks = []
+                for index, digest, payload in records:
+                    if any(digest) and hashlib.md5(payload).digest() != digest:
+                        results[index] = 'verification_failed'
+                    else:
+                        valid_chunks.append((index, payload))
+                
+                assembled_through, received_bitmap, status, total_chunks, accepted, rejected = append_chunks(cursor, conn, upload_id, valid_chunks)
+                if status == 'completed':
+                    conn.rollback()
+                    return completed_upload_response(cursor, upload_id)
+                if status != 'active':
+                    conn.rollback()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Upload session not active'})
+                    }
+                for index, payload in valid_chunks:
+                    results[index] = rejected.get(index) or ('stored' if index in accepted else 'duplicate')
+                
+                if assembled_through + 1 >= total_chunks:
+                    return assemble_video(cursor, conn, upload_id, user_id)
+                
+                conn.commit()
+                missing = missing_ranges(received_bitmap, total_chunks)
+                uploaded_chunks = total_chunks - sum(end - start + 1 for start, end in missing)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({
+                        'success': True,
+                        'upload_id': upload_id,
+                        'results': [{'chunk_index': index, 'status': results[index]} for index in sorted(results)],
+                        'chunks_uploaded': uploaded_chunks,
+                        'chunks_total': total_chunks,
+                        'next_chunk': missing[0][0] if missing else total_chunks,
+                        'missing_ranges': missing,
+                        'progress': (uploaded_chunks / total_chunks) * 100
+                    })
+                }
+            
+            elif action == 'resize_chunks':
+                # Re-negotiate the chunk size for the rest of the file
+                upload_id = body_data.get('upload_id')
+                requested_chunk_size = body_data.get('chunk_size')
+                
+                if not upload_id:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Missing upload parameters'})
+                    }
+                
+                cursor.execute("""
+                    SELECT total_size, status, assembled_through, assembled_bytes FROM chunked_uploads 
+                    WHERE upload_id = %s AND user_id = %s FOR UPDATE
+                """, (upload_id, user_id))
+                
+                upload_info = cursor.fetchone()
+                if not upload_info:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Upload session not found'})
+                    }
+                
+                total_size, status, assembled_through, assembled_bytes = upload_info
+                if status != 'active':
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Upload session not active'})
+                    }
+                
+                # Byte offsets of buffered chunks depend on the old size, so resize only at a gap-free point
+                cursor.execute("SELECT 1 FROM upload_chunks WHERE upload_id = %s LIMIT 1", (upload_id,))
+                if cursor.fetchone():
+                    return {
+                        'statusCode': 409,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Out-of-order chunks pending; resize after earlier chunks arrive'})
+                    }
+                
+                if requested_chunk_size:
+                    chunk_size = clamp_chunk_size(requested_chunk_size)
+                else:
+                    chunk_size = recommend_chunk_size(cursor, user_id, upload_id)
+                
+                # Chunks after the watermark are re-numbered from the assembled byte offset
+                chunk_base_index = assembled_through + 1
+                total_chunks = chunk_base_index + math.ceil((total_size - assembled_bytes) / chunk_size)
+                received_bitmap = bytearray((total_chunks + 7) // 8)
+                for index in range(chunk_base_index):
+                    received_bitmap[index >> 3] |= 1 << (index & 7)
+                
+                cursor.execute("""
+                    UPDATE chunked_uploads SET 
+                        chunk_size = %s, 
+                        chunk_base_index = %s, 
+                        chunk_base_offset = %s, 
+                        total_chunks = %s,
+                        received_bitmap = %s, 
+                        received_chunks = %s, 
+                        received_bytes = %s, 
+                        updated_at = CURRENT_TIMESTAMP 
+                    WHERE upload_id = %s
+                """, (chunk_size, chunk_base_index, assembled_bytes, total_chunks, bytes(received_bitmap),
+                      chunk_base_index, assembled_bytes, upload_id))
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({
+                        'success': True,
+                        'upload_id': upload_id,
+                        'chunk_size': chunk_size,
+                        'total_chunks': total_chunks,
+                        'next_chunk': chunk_base_index,
+                        'next_offset': assembled_bytes
+                    })
+                }
+            
+        elif method == 'GET':
+            query_params = event.get('queryStringParameters') or {}
+            action = query_params.get('action', 'status')
+            upload_id = query_params.get('upload_id')
+            
+            if action == 'status':
+                if not upload_id:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'upload_id parameter required'})
+                    }
+                
+                cursor.execute("""
+                    SELECT total_chunks, total_size, status, received_bitmap, received_chunks, received_bytes, assembled_through, chunk_size 
+                    FROM chunked_uploads 
+                    WHERE upload_id = %s AND user_id = %s
+                """, (upload_id, user_id))
+                
+                upload_info = cursor.fetchone()
+                if not upload_info:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Upload session not found'})
+                    }
+                
+                total_chunks, total_size, status, received_bitmap, received_chunks, received_bytes, assembled_through, chunk_size = upload_info
+                missing = missing_ranges(received_bitmap, total_chunks)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({
+                        'success': True,
+                        'upload_id': upload_id,
+                        'status': status,
+                        'chunks_uploaded': received_chunks,
+                        'chunks_total': total_chunks,
+                        'bytes_uploaded': received_bytes,
+                        'bytes_total': total_size,
+                        'assembled_through': assembled_through,
+                        'chunk_size': chunk_size,
+                        'next_chunk': missing[0][0] if missing else total_chunks,
+                        'missing_ranges': missing,
+                        'progress': (received_chunks / total_chunks) * 100 if total_chunks else 0
+                    })
+                }
+            
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -238,69 +750,486 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             conn.close()
 
 
+def clamp_chunk_size(chunk_size: int) -> int:
+    '''Keep a chunk size within the platform payload limit, rounded down to a MIN_CHUNK_SIZE multiple'''
+    chunk_size = min(max(int(chunk_size), MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+    return chunk_size - chunk_size % MIN_CHUNK_SIZE
+
+
+def recommend_chunk_size(cursor, user_id: str, upload_id: Optional[str] = None) -> int:
+    '''Suggest a chunk size from recent measured throughput (of this session if given, else the user's last uploads)'''
+    # Timed from chunk arrivals, so pauses longer than TRANSFER_IDLE_SECONDS do not count as slow transfer
+    cursor.execute("""
+        SELECT SUM(transfer_bytes), SUM(transfer_seconds)
+        FROM (
+            SELECT transfer_bytes, transfer_seconds FROM chunked_uploads 
+            WHERE user_id = %(user_id)s AND transfer_bytes > 0 
+              AND (%(upload_id)s::varchar IS NULL OR upload_id = %(upload_id)s)
+            ORDER BY updated_at DESC 
+            LIMIT 5
+        ) recent
+    """, {'user_id': user_id, 'upload_id': upload_id})
+    
+    transfer_bytes, transfer_seconds = cursor.fetchone()
+    if not transfer_bytes or not transfer_seconds:
+        return clamp_chunk_size(DEFAULT_CHUNK_SIZE)
+    
+    throughput = float(transfer_bytes) / float(transfer_seconds)
+    return clamp_chunk_size(throughput * TARGET_CHUNK_SECONDS)
+
+
+def expected_chunk_length(total_size: int, chunk_size: Optional[int], chunk_base_index: int, chunk_base_offset: int, chunk_index: int) -> Optional[int]:
+    '''Byte length a chunk must have under the negotiated split, or None when the client chose its own split'''
+    if not chunk_size or chunk_index < chunk_base_index:
+        return None
+    chunk_offset = chunk_base_offset + (chunk_index - chunk_base_index) * chunk_size
+    return min(chunk_size, total_size - chunk_offset)
+
+
+def missing_ranges(received_bitmap, total_chunks: int):
+    '''Turn the received-chunk bitmap (bit i = chunk i, LSB first) into inclusive [start, end] ranges of missing chunks'''
+    bitmap = bytes(received_bitmap or b'')
+    ranges = []
+    start = None
+    for index in range(total_chunks):
+        byte_index = index >> 3
+        received = byte_index < len(bitmap) and (bitmap[byte_index] >> (index & 7)) & 1
+        if not received and start is None:
+            start = index
+        elif received and start is not None:
+            ranges.append([start, index - 1])
+            start = None
+    if start is not None:
+        ranges.append([start, total_chunks - 1])
+    return ranges
+
+
+def parse_chunk_batch(frame: bytes) -> List[Tuple[int, bytes, memoryview]]:
+    '''Split a batch body of [chunk_index u32][length u32][md5 16 bytes][payload] records into (chunk_index, md5, payload)'''
+    view = memoryview(frame)
+    records = []
+    offset = 0
+    while offset < len(view):
+        if offset + CHUNK_FRAME_HEADER.size > len(view):
+            raise ValueError("Truncated chunk header")
+        chunk_index, length, digest = CHUNK_FRAME_HEADER.unpack_from(view, offset)
+        offset += CHUNK_FRAME_HEADER.size
+        if offset + length > len(view):
+            raise ValueError("Truncated chunk payload")
+        records.append((chunk_index, digest, view[offset:offset + length]))
+        offset += length
+    return records
+
+
+def append_chunks(cursor, conn, upload_id: str, chunks: List[Tuple[int, Any]]):
+    '''
+    Append chunks to the session's video where contiguous, buffer the rest; returns
+    (assembled_through, received_bitmap, status, total_chunks, accepted, rejected) where rejected maps
+    chunk indexes to 'invalid_index' or 'invalid_length' under the split read with the session lock
+    '''
+    # Lock the session row so parallel chunk requests append and finalize one at a time, and so
+    # the split a chunk is checked against cannot be changed by resize_chunks until this commits
+    cursor.execute("""
+        SELECT video_oid, assembled_through, assembled_bytes, received_bitmap, received_chunks, received_bytes, status,
+            total_chunks, total_size, chunk_size, chunk_base_index, chunk_base_offset 
+        FROM chunked_uploads 
+        WHERE upload_id = %s FOR UPDATE
+    """, (upload_id,))
+    (video_oid, assembled_through, assembled_bytes, received_bitmap, received_chunks, received_bytes, status,
+     total_chunks, total_size, chunk_size, chunk_base_index, chunk_base_offset) = cursor.fetchone()
+    if status != 'active':
+        return assembled_through, received_bitmap, status, total_chunks, [], {}
+    
+    rejected = {}
+    pending = {}
+    for index, data in chunks:
+        expected_length = expected_chunk_length(total_size, chunk_size, chunk_base_index, chunk_base_offset, index)
+        if index < 0 or index >= total_chunks:
+            rejected[index] = 'invalid_index'
+        elif expected_length is not None and len(data) != expected_length:
+            rejected[index] = 'invalid_length'
+        elif index > assembled_through:
+            pending[index] = data
+    
+    # Nothing left but retries of chunks that are already part of the assembled video
+    if not pending:
+        return assembled_through, received_bitmap, status, total_chunks, [], rejected
+    
+    # Mark chunks as received; counters only move the first time a chunk's bit is set
+    bitmap = bytearray(received_bitmap)
+    accepted = []
+    accepted_bytes = 0
+    for index in sorted(pending):
+        if not (bitmap[index >> 3] >> (index & 7)) & 1:
+            bitmap[index >> 3] |= 1 << (index & 7)
+            received_chunks += 1
+            accepted_bytes += len(pending[index])
+            accepted.append(index)
+    received_bytes += accepted_bytes
+    
+    video_object = conn.lobject(video_oid or 0, 'wb')
+    video_object.seek(assembled_bytes)
+    buffered = []
+    for index in sorted(pending):
+        if index == assembled_through + 1:
+            # lobject.write needs bytes: a no-op for decoded chunks, one copy for batch frame slices
+            video_object.write(bytes(pending[index]))
+            assembled_bytes += len(pending[index])
+            assembled_through = index
+        else:
+            buffered.append((upload_id, index, pending[index]))
+    
+    if buffered:
+        execute_values(cursor, """
+            INSERT INTO upload_chunks (upload_id, chunk_index, chunk_data)
+            VALUES %s
+            ON CONFLICT (upload_id, chunk_index) DO UPDATE SET chunk_data = EXCLUDED.chunk_data
+        """, buffered)
+    
+    video_oid = video_object.oid
+    video_object.close()
+    
+    # Drain buffered chunks that now continue the contiguous prefix; lo_put copies them
+    # inside Postgres, so their bytes never travel through this function
+    cursor.execute("""
+        SELECT chunk_index, octet_length(chunk_data) FROM upload_chunks 
+        WHERE upload_id = %s AND chunk_index > %s 
+        ORDER BY chunk_index ASC
+    """, (upload_id, assembled_through))
+    for buffered_index, chunk_size in cursor.fetchall():
+        if buffered_index != assembled_through + 1:
+            break
+        cursor.execute("""
+            SELECT lo_put(%s, %s, chunk_data) FROM upload_chunks 
+            WHERE upload_id = %s AND chunk_index = %s
+        """, (video_oid, assembled_bytes, upload_id, buffered_index))
+        assembled_bytes += chunk_size
+        assembled_through = buffered_index
+    
+    cursor.execute("""
+        DELETE FROM upload_chunks WHERE upload_id = %s AND chunk_index <= %s
+    """, (upload_id, assembled_through))
+    
+    # Received bitmap, counters and watermark move together in one statement. The time since the
+    # previous chunk arrived (or the session started) is transfer time for the new bytes, unless it was idle
+    cursor.execute("""
+        UPDATE chunked_uploads SET 
+            received_bitmap = %(bitmap)s,
+            received_chunks = %(received_chunks)s,
+            received_bytes = %(received_bytes)s,
+            video_oid = %(video_oid)s, 
+            assembled_through = %(assembled_through)s, 
+            assembled_bytes = %(assembled_bytes)s, 
+            transfer_bytes = transfer_bytes + CASE WHEN gap.seconds <= %(idle_seconds)s THEN %(accepted_bytes)s ELSE 0 END,
+            transfer_seconds = transfer_seconds + CASE WHEN gap.seconds <= %(idle_seconds)s THEN gap.seconds ELSE 0 END,
+            last_chunk_at = CURRENT_TIMESTAMP,
+            updated_at = CURRENT_TIMESTAMP 
+        FROM (
+            SELECT EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - COALESCE(last_chunk_at, created_at)))::float AS seconds 
+            FROM chunked_uploads WHERE upload_id = %(upload_id)s
+        ) gap
+        WHERE upload_id = %(upload_id)s
+    """, {'bitmap': bytes(bitmap), 'received_chunks': received_chunks, 'received_bytes': received_bytes, 'video_oid': video_oid,
+          'assembled_through': assembled_through, 'assembled_bytes': assembled_bytes, 'accepted_bytes': accepted_bytes,
+          'idle_seconds': TRANSFER_IDLE_SECONDS, 'upload_id': upload_id})
+    
+    return assembled_through, bitmap, status, total_chunks, accepted, rejected
+
+
+def read_mp4_boxes(source, start: int, end: int) -> List[Tuple[bytes, int, int, int]]:
+    '''List (type, offset, header size, size) of the MP4 boxes between two offsets of a seekable stream'''
+    boxes = []
+    offset = start
+    while offset + 8 <= end:
+        source.seek(offset)
+        size, box_type = MP4_BOX_HEADER.unpack(source.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', source.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise ValueError(f"Malformed MP4 box {box_type!r} at offset {offset}")
+        boxes.append((box_type, offset, header_size, size))
+        offset += size
+    return boxes
+
+
+def read_box_payload(source, box: Tuple[bytes, int, int, int], limit: int = 256) -> bytes:
+    '''Read the start of an MP4 box payload'''
+    _, offset, header_size, size = box
+    source.seek(offset + header_size)
+    return source.read(min(size - header_size, limit))
+
+
+def find_mp4_box(source, parent: Tuple[bytes, int, int, int], box_type: bytes) -> Optional[Tuple[bytes, int, int, int]]:
+    '''First child box of a given type'''
+    _, offset, header_size, size = parent
+    for box in read_mp4_boxes(source, offset + header_size, offset + size):
+        if box[0] == box_type:
+            return box
+    return None
+
+
+def probe_mp4(source, total_size: int) -> Dict[str, Any]:
+    '''Duration, resolution and codecs of an MP4 from its moov box headers; sample tables are never read'''
+    metadata: Dict[str, Any] = {'content_type': 'video/mp4'}
+    boxes = read_mp4_boxes(source, 0, total_size)
+    if boxes and boxes[0][0] == b'ftyp' and read_box_payload(source, boxes[0], 4) == b'qt  ':
+        metadata['content_type'] = 'video/quicktime'
+    
+    moov = next((box for box in boxes if box[0] == b'moov'), None)
+    if not moov:
+        return metadata
+    
+    for box in read_mp4_boxes(source, moov[1] + moov[2], moov[1] + moov[3]):
+        if box[0] == b'mvhd':
+            mvhd = read_box_payload(source, box, 32)
+            if mvhd[0] == 1:
+                timescale, duration = struct.unpack_from('>IQ', mvhd, 20)
+            else:
+                timescale, duration = struct.unpack_from('>II', mvhd, 12)
+            if timescale:
+                metadata['duration_ms'] = duration * 1000 // timescale
+        elif box[0] == b'trak':
+            mdia = find_mp4_box(source, box, b'mdia')
+            hdlr = mdia and find_mp4_box(source, mdia, b'hdlr')
+            minf = mdia and find_mp4_box(source, mdia, b'minf')
+            stbl = minf and find_mp4_box(source, minf, b'stbl')
+            stsd = stbl and find_mp4_box(source, stbl, b'stsd')
+            if not hdlr or not stsd:
+                continue
+            handler_type = read_box_payload(source, hdlr, 12)[8:12]
+            # stsd: version/flags, entry count, then the first sample entry (size, format)
+            codec = read_box_payload(source, stsd, 16)[12:16].decode('ascii', 'replace').strip()
+            if handler_type == b'vide' and 'video_codec' not in metadata:
+                metadata['video_codec'] = codec
+                tkhd = find_mp4_box(source, box, b'tkhd')
+                if tkhd:
+                    # Width and height close tkhd as 16.16 fixed point
+                    source.seek(tkhd[1] + tkhd[3] - 8)
+                    width, height = struct.unpack('>II', source.read(8))
+                    metadata['width'], metadata['height'] = width >> 16, height >> 16
+            elif handler_type == b'soun' and 'audio_codec' not in metadata:
+                metadata['audio_codec'] = codec
+    return metadata
+
+
+def read_ebml_vint(data: bytes, pos: int, keep_marker: bool = False) -> Tuple[Optional[int], int]:
+    '''Decode an EBML variable-length integer; returns (value, next position), value None for an unknown size'''
+    first = data[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise ValueError("Invalid EBML variable-length integer")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, pos + length
+    return value, pos + length
+
+
+def walk_ebml(data: bytes, pos: int, end: int) -> Iterator[Tuple[int, int, Optional[int]]]:
+    '''Yield (element id, data position, data size) depth-first, descending into master elements'''
+    while pos < end:
+        element_id, pos = read_ebml_vint(data, pos, keep_marker=True)
+        size, pos = read_ebml_vint(data, pos)
+        yield element_id, pos, size
+        if size is not None and element_id not in EBML_MASTER_ELEMENTS:
+            pos += size
+
+
+def last_webm_block_timestamp(tail: bytes) -> Optional[int]:
+    '''Timestamp of the last block of the last Cluster that starts within a buffer'''
+    cluster_at = tail.rfind(WEBM_CLUSTER_ID)
+    while cluster_at >= 0:
+        cluster_timestamp = last_timestamp = None
+        try:
+            for element_id, pos, size in walk_ebml(tail, cluster_at, len(tail)):
+                if element_id == 0xE7:
+                    cluster_timestamp = int.from_bytes(tail[pos:pos + size], 'big')
+                elif element_id in (0xA3, 0xA1) and cluster_timestamp is not None:
+                    # SimpleBlock / Block: track number, then a signed 16-bit timestamp relative to the cluster
+                    _, timestamp_at = read_ebml_vint(tail, pos)
+                    relative_timestamp = struct.unpack_from('>h', tail, timestamp_at)[0]
+                    last_timestamp = max(last_timestamp or 0, cluster_timestamp + relative_timestamp)
+                elif element_id != 0x1F43B675 and cluster_timestamp is None:
+                    # Cluster ID bytes inside frame data: Timestamp must come first in a real cluster
+                    break
+        except (ValueError, IndexError, struct.error):
+            pass
+        if last_timestamp is not None:
+            return last_timestamp
+        cluster_at = tail.rfind(WEBM_CLUSTER_ID, 0, cluster_at)
+    return None
+
+
+def probe_webm(source, total_size: int) -> Dict[str, Any]:
+    '''Duration, resolution and codecs of a WebM/Matroska file from its first and last PROBE_WINDOW_BYTES'''
+    source.seek(0)
+    head = source.read(min(PROBE_WINDOW_BYTES, total_size))
+    metadata: Dict[str, Any] = {'content_type': 'video/webm'}
+    timestamp_scale = 1000000
+    duration = None
+    tracks: List[Dict[str, bytes]] = []
+    
+    try:
+        for element_id, pos, size in walk_ebml(head, 0, len(head)):
+            if element_id == 0x1F43B675:
+                break
+            if element_id == 0xAE:
+                tracks.append({})
+            if size is None or element_id in EBML_MASTER_ELEMENTS or pos + size > len(head):
+                continue
+            value = head[pos:pos + size]
+            if element_id == 0x4282 and value != b'webm':
+                metadata['content_type'] = 'video/x-matroska'
+            elif element_id == 0x2AD7B1:
+                timestamp_scale = int.from_bytes(value, 'big')
+            elif element_id == 0x4489:
+                duration = struct.unpack('>f' if size == 4 else '>d', value)[0]
+            elif tracks and element_id in WEBM_TRACK_FIELDS:
+                tracks[-1][WEBM_TRACK_FIELDS[element_id]] = value
+    except (ValueError, IndexError):
+        pass
+    
+    for track in tracks:
+        track_type = int.from_bytes(track.get('type', b''), 'big')
+        codec = track.get('codec', b'').decode('ascii', 'replace')
+        if track_type == 1 and 'video_codec' not in metadata:
+            metadata['video_codec'] = codec
+            metadata['width'] = int.from_bytes(track.get('width', b''), 'big') or None
+            metadata['height'] = int.from_bytes(track.get('height', b''), 'big') or None
+        elif track_type == 2 and 'audio_codec' not in metadata:
+            metadata['audio_codec'] = codec
+    
+    if duration is None:
+        # Recorders that stream WebM never go back to write Duration: use the last block's timestamp instead
+        tail_start = max(0, total_size - PROBE_WINDOW_BYTES)
+        source.seek(tail_start)
+        duration = last_webm_block_timestamp(source.read(total_size - tail_start))
+    if duration is not None:
+        metadata['duration_ms'] = int(duration * timestamp_scale / 1000000)
+    return metadata
+
+
+def probe_video(source, total_size: int) -> Dict[str, Any]:
+    '''Container metadata read from headers only: content_type, duration_ms, width, height, video_codec, audio_codec'''
+    source.seek(0)
+    magic = source.read(8)
+    try:
+        if magic[:4] == b'\x1a\x45\xdf\xa3':
+            return probe_webm(source, total_size)
+        if magic[4:8] == b'ftyp':
+            return probe_mp4(source, total_size)
+    except (ValueError, IndexError, struct.error) as e:
+        print(f"Video probe failed: {str(e)}")
+    return {}
+
+
+def probe_large_object(conn, video_oid: int, video_size: int) -> Dict[str, Any]:
+    '''Container metadata of an assembled video, reading only its headers'''
+    source = conn.lobject(video_oid, 'rb')
+    try:
+        return probe_video(source, video_size)
+    finally:
+        source.close()
+
+
+def upload_complete_response(lead_id: int, video_size: int, created_at: datetime) -> Dict[str, Any]:
+    '''Build the response returned once an upload has been saved as a lead'''
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps({
+            'success': True,
+            'lead_id': lead_id,
+            'upload_complete': True,
+            'final_size': video_size,
+            'created_at': created_at.strftime('%d.%m.%Y %H:%M'),
+            'message': 'Video successfully uploaded and saved'
+        })
+    }
+
+
+def completed_upload_response(cursor, upload_id: str) -> Dict[str, Any]:
+    '''Repeat the completion response for an upload that was already finalized'''
+    cursor.execute("""
+        SELECT vl.id, vl.video_size, vl.created_at FROM chunked_uploads cu 
+        JOIN video_leads vl ON vl.id = cu.lead_id 
+        WHERE cu.upload_id = %s
+    """, (upload_id,))
+    
+    lead_info = cursor.fetchone()
+    if not lead_info:
+        # The upload finished, but its lead has been deleted since
+        return {
+            'statusCode': 410,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Upload already completed and its lead was deleted'})
+        }
+    
+    lead_id, video_size, created_at = lead_info
+    return upload_complete_response(lead_id, video_size, created_at)
+
+
 def assemble_video(cursor, conn, upload_id: str, user_id: str) -> Dict[str, Any]:
-    '''Assemble all chunks into final video and save as lead'''
+    '''Save the incrementally assembled video as a lead exactly once (metadata only)'''
     try:
-        # Get upload metadata
+        # Claim the session; only one request can move it out of 'active'
         cursor.execute("""
-            SELECT filename, title, comments, total_size FROM chunked_uploads 
-            WHERE upload_id = %s AND user_id = %s
+            UPDATE chunked_uploads SET status = 'finalizing' 
+            WHERE upload_id = %s AND user_id = %s AND status = 'active'
+            RETURNING filename, title, comments, video_oid, assembled_bytes
         """, (upload_id, user_id))
         
         upload_meta = cursor.fetchone()
         if not upload_meta:
-            raise Exception("Upload metadata not found")
-        
-        filename, title, comments, total_size = upload_meta
+            # Another request already finalized this upload
+            conn.rollback()
+            return completed_upload_response(cursor, upload_id)
         
-        # Get all chunks ordered by index
-        cursor.execute("""
-            SELECT chunk_data FROM upload_chunks 
-            WHERE upload_id = %s 
-            ORDER BY chunk_index ASC
-        """, (upload_id,))
-        
-        chunks = cursor.fetchall()
-        if not chunks:
+        filename, title, comments, video_oid, video_size = upload_meta
+        if not video_oid:
             raise Exception("No chunks found")
         
-        # Assemble video data
-        video_data = b''
-        for chunk_row in chunks:
-            video_data += chunk_row[0]
+        print(f"Assembled video size: {video_size} bytes")
         
-        print(f"Assembled video size: {len(video_data)} bytes")
+        # Recorders produce MP4 or WebM; duration, resolution and codecs come from the container headers
+        metadata = probe_large_object(conn, video_oid, video_size)
         
-        # Save as final lead
+        # Save as final lead on the assembled object; the video-assets worker moves moov ahead of mdat and
+        # hashes it into the deduplicated blob store later, so finalizing never reads the whole video
         cursor.execute("""
             INSERT INTO video_leads 
-            (user_id, title, comments, video_data, video_filename, video_content_type)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            (user_id, title, comments, video_size, video_oid, video_filename, video_content_type,
+             video_duration_ms, video_width, video_height, video_codec, audio_codec)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id, created_at
-        """, (user_id, title, comments, video_data, filename, 'video/mp4'))
+        """, (user_id, title, comments, video_size, video_oid, filename, metadata.get('content_type', 'video/mp4'),
+              metadata.get('duration_ms'), metadata.get('width'), metadata.get('height'), metadata.get('video_codec'), metadata.get('audio_codec')))
         
         lead_id, created_at = cursor.fetchone()
         
-        # Mark upload as completed and cleanup chunks
-        cursor.execute("UPDATE chunked_uploads SET status = 'completed' WHERE upload_id = %s", (upload_id,))
-        cursor.execute("DELETE FROM upload_chunks WHERE upload_id = %s", (upload_id,))
+        # The store job moves the video into the blob store, then queues poster, thumbnail and HLS jobs
+        cursor.execute("INSERT INTO video_asset_jobs (lead_id, kind) VALUES (%s, 'store')", (lead_id,))
+        
+        # Mark upload as completed; the assembled bytes now belong to the lead
+        cursor.execute("""
+            UPDATE chunked_uploads SET status = 'completed', lead_id = %s, video_oid = NULL, updated_at = CURRENT_TIMESTAMP 
+            WHERE upload_id = %s
+        """, (lead_id, upload_id))
         
         conn.commit()
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'isBase64Encoded': False,
-            'body': json.dumps({
-                'success': True,
-                'lead_id': lead_id,
-                'upload_complete': True,
-                'final_size': len(video_data),
-                'created_at': created_at.strftime('%d.%m.%Y %H:%M'),
-                'message': 'Video successfully uploaded and saved'
-            })
-        }
+        return upload_complete_response(lead_id, video_size, created_at)
         
     except Exception as e:
+        conn.rollback()
         print(f"Assembly error: {str(e)}")
         raise e
\ No newline at end of file
@@ -0,0 +1,250 @@
+import json
+import math
+import os
+import sys
+import jwt
+import psycopg2
+from typing import Dict, Any, Optional
+
+def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    '''Verify JWT token and return user data'''
+    try:
+        jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+        decoded = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+        return decoded
+    except:
+        return None
+
+def parse_ttl_hours(value: str) -> float:
+    '''Session TTL in hours; raises ValueError unless it is a finite number above zero'''
+    ttl_hours = float(value)
+    if not math.isfinite(ttl_hours) or ttl_hours <= 0:
+        raise ValueError(f"ttl_hours must be a finite number above zero, got {value!r}")
+    return ttl_hours
+
+def parse_batch_size(value: str) -> int:
+    '''Rows per reaper batch; raises ValueError unless it is a positive integer'''
+    batch_size = int(value)
+    if batch_size <= 0:
+        raise ValueError(f"batch size must be a positive integer, got {value!r}")
+    return batch_size
+
+def reap_uploads(conn, ttl_hours: float, batch_size: int) -> Dict[str, Any]:
+    '''Expire idle upload sessions, delete orphaned chunks and expired idempotency keys in bounded batches, committing after each batch'''
+    cursor = conn.cursor()
+    sessions_expired = 0
+    chunks_deleted = 0
+    bytes_reclaimed = 0
+    idempotency_keys_deleted = 0
+    
+    try:
+        # Expire idle sessions; SKIP LOCKED leaves sessions with a chunk request in flight alone.
+        # Their assembled object and buffered chunks are dropped, so progress is reset with them:
+        # a session resumed by start_upload begins again from the first chunk
+        while True:
+            cursor.execute("""
+                UPDATE chunked_uploads cu SET 
+                    status = 'expired', 
+                    video_oid = NULL, 
+                    assembled_through = -1, 
+                    assembled_bytes = 0, 
+                    total_chunks = CASE WHEN cu.chunk_size IS NOT NULL THEN CEIL(cu.total_size::numeric / cu.chunk_size)::int ELSE cu.total_chunks END,
+                    chunk_base_index = 0, 
+                    chunk_base_offset = 0, 
+                    received_bitmap = NULL, 
+                    received_chunks = 0, 
+                    received_bytes = 0, 
+                    updated_at = CURRENT_TIMESTAMP
+                FROM (
+                    SELECT upload_id, video_oid, assembled_bytes FROM chunked_uploads 
+                    WHERE status = 'active' AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    LIMIT %s 
+                    FOR UPDATE SKIP LOCKED
+                ) idle
+                WHERE cu.upload_id = idle.upload_id
+                RETURNING idle.video_oid, idle.assembled_bytes
+            """, (ttl_hours * 3600, batch_size))
+            
+            expired = cursor.fetchall()
+            for video_oid, assembled_bytes in expired:
+                if video_oid:
+                    cursor.execute("SELECT lo_unlink(%s)", (video_oid,))
+                    bytes_reclaimed += assembled_bytes or 0
+            conn.commit()
+            
+            sessions_expired += len(expired)
+            if len(expired) < batch_size:
+                break
+        
+        # Delete chunks that no active session will ever drain
+        while True:
+            cursor.execute("""
+                DELETE FROM upload_chunks uc 
+                USING (
+                    SELECT c.upload_id, c.chunk_index FROM upload_chunks c 
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM chunked_uploads cu 
+                        WHERE cu.upload_id = c.upload_id AND cu.status = 'active'
+                    )
+                    LIMIT %s 
+                    FOR UPDATE SKIP LOCKED
+                ) orphaned
+                WHERE uc.upload_id = orphaned.upload_id AND uc.chunk_index = orphaned.chunk_index
+                RETURNING octet_length(uc.chunk_data)
+            """, (batch_size,))
+            
+            deleted = cursor.fetchall()
+            conn.commit()
+            
+            chunks_deleted += len(deleted)
+            bytes_reclaimed += sum(size for (size,) in deleted)
+            if len(deleted) < batch_size:
+                break
+        
+        # Drop idempotency keys past their replay window
+        while True:
+            cursor.execute("""
+                DELETE FROM idempotency_keys ik 
+                USING (
+                    SELECT user_id, scope, idempotency_key FROM idempotency_keys 
+                    WHERE expires_at < CURRENT_TIMESTAMP 
+                    LIMIT %s 
+                    FOR UPDATE SKIP LOCKED
+                ) expired
+                WHERE ik.user_id = expired.user_id AND ik.scope = expired.scope AND ik.idempotency_key = expired.idempotency_key
+            """, (batch_size,))
+            
+            keys_deleted = cursor.rowcount
+            conn.commit()
+            
+            idempotency_keys_deleted += keys_deleted
+            if keys_deleted < batch_size:
+                break
+    finally:
+        cursor.close()
+    
+    print(f"Reaper expired {sessions_expired} sessions, deleted {chunks_deleted} chunks, reclaimed {bytes_reclaimed} bytes, dropped {idempotency_keys_deleted} idempotency keys")
+    return {
+        'sessions_expired': sessions_expired,
+        'chunks_deleted': chunks_deleted,
+        'bytes_reclaimed': bytes_reclaimed,
+        'idempotency_keys_deleted': idempotency_keys_deleted
+    }
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Reclaim storage from abandoned chunked upload sessions (scheduled trigger or admin request)
+    Args: event from a timer trigger, or HTTP event with headers (X-Auth-Token) and query params (ttl_hours)
+    Returns: Number of expired sessions, deleted chunks, reclaimed bytes and dropped idempotency keys
+    '''
+    method: Optional[str] = event.get('httpMethod')
+    
+    # Handle CORS OPTIONS request
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'isBase64Encoded': False,
+            'body': ''
+        }
+    
+    try:
+        ttl_hours = parse_ttl_hours(os.environ.get('UPLOAD_SESSION_TTL_HOURS', '24'))
+        batch_size = parse_batch_size(os.environ.get('REAPER_BATCH_SIZE', '50'))
+    except ValueError as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': f'Invalid reaper configuration: {str(e)}'})
+        }
+    
+    # HTTP invocations are admin-only; timer triggers carry no httpMethod
+    if method:
+        if method != 'POST':
+            return {
+                'statusCode': 405,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Method not allowed'})
+            }
+        
+        headers = event.get('headers', {})
+        auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+        
+        if not auth_token:
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Authentication token required'})
+            }
+        
+        user_data = verify_token(auth_token)
+        if not user_data:
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Invalid token'})
+            }
+        
+        if user_data.get('role') != 'admin':
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Access denied. Admin role required'})
+            }
+        
+        query_params = event.get('queryStringParameters') or {}
+        if query_params.get('ttl_hours'):
+            try:
+                ttl_hours = parse_ttl_hours(query_params['ttl_hours'])
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': str(e)})
+                }
+    
+    try:
+        db_url = os.environ.get('DATABASE_URL')
+        conn = psycopg2.connect(db_url)
+        
+        result = reap_uploads(conn, ttl_hours, batch_size)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'success': True, 'ttl_hours': ttl_hours, **result})
+        }
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': f'Server error: {str(e)}'})
+        }
+    
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == '__main__':
+    # CLI: python index.py [ttl_hours] [batch_size]
+    cli_ttl_hours = parse_ttl_hours(sys.argv[1] if len(sys.argv) > 1 else os.environ.get('UPLOAD_SESSION_TTL_HOURS', '24'))
+    cli_batch_size = parse_batch_size(sys.argv[2] if len(sys.argv) > 2 else os.environ.get('REAPER_BATCH_SIZE', '50'))
+    cli_conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        print(json.dumps(reap_uploads(cli_conn, cli_ttl_hours, cli_batch_size)))
+    finally:
+        cli_conn.close()
@@ -0,0 +1,669 @@
+import json
+import os
+import hashlib
+import io
+import struct
+import sys
+import shutil
+import subprocess
+import tempfile
+import jwt
+import psycopg2
+import uuid
+from typing import Dict, Any, Optional, Iterable, Iterator, List, Tuple
+
+# Where new video bytes are stored: 'postgres' (large objects) or 'local' (files under VIDEO_STORAGE_DIR)
+VIDEO_STORAGE_BACKEND = os.environ.get('VIDEO_STORAGE_BACKEND', 'postgres')
+VIDEO_STORAGE_DIR = os.environ.get('VIDEO_STORAGE_DIR', '/var/lib/video-leads')
+# Block size for hashing and copying videos without loading them whole
+STORAGE_BLOCK_SIZE = 1024 * 1024
+
+# MP4 faststart: boxes on the path to the chunk offset tables, and a sanity cap on moov size
+MP4_BOX_HEADER = struct.Struct('>I4s')
+MP4_CONTAINER_BOXES = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+MP4_MOOV_MAX_BYTES = 64 * 1024 * 1024
+
+# ffmpeg binary and limits for rendering posters and thumbnails
+FFMPEG_PATH = os.environ.get('FFMPEG_PATH', 'ffmpeg')
+FFMPEG_TIMEOUT_SECONDS = int(os.environ.get('FFMPEG_TIMEOUT_SECONDS', '60'))
+POSTER_MAX_WIDTH = 1280
+THUMBNAIL_WIDTH = 320
+
+# Optional HLS rendition of finalized videos (jobs are enqueued at ingest, or after storing a chunked upload, when HLS_SEGMENTATION=1)
+HLS_SEGMENTATION = os.environ.get('HLS_SEGMENTATION') == '1'
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', '6'))
+HLS_TIMEOUT_SECONDS = int(os.environ.get('HLS_TIMEOUT_SECONDS', '600'))
+
+# Jobs are retried this many times; 'running' jobs older than the stale timeout belong to a crashed worker
+ASSET_JOB_MAX_ATTEMPTS = 3
+ASSET_JOB_STALE_MINUTES = 15
+
+def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    '''Verify JWT token and return user data'''
+    try:
+        jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+        decoded = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+        return decoded
+    except:
+        return None
+
+class PostgresBlobStore:
+    '''Video bytes in Postgres large objects, outside the video_leads rows; the key is the object OID'''
+    name = 'postgres'
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        video_object = self.conn.lobject(0, 'wb')
+        try:
+            for block in blocks:
+                video_object.write(bytes(block))
+            return str(video_object.oid)
+        finally:
+            video_object.close()
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            video_object.seek(offset)
+            return video_object.read(length)
+        finally:
+            video_object.close()
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            while True:
+                block = video_object.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+        finally:
+            video_object.close()
+    
+    def delete(self, key: str) -> None:
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT lo_unlink(%s)", (int(key),))
+
+class LocalBlobStore:
+    '''Video bytes as files under a local directory; the key is the path relative to it'''
+    name = 'local'
+    
+    def __init__(self, root: str):
+        self.root = root
+    
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        # Every write gets its own file, like a new large object OID, so deleting the key of one
+        # dropped row never removes bytes that a concurrent upload of the same content just wrote
+        key = f'{content_hash[:2]}/{content_hash}-{uuid.uuid4().hex}'
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so readers never see a partial file
+        partial_path = f'{path}.partial'
+        with open(partial_path, 'wb') as video_file:
+            for block in blocks:
+                video_file.write(block)
+        os.replace(partial_path, path)
+        return key
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        with open(self.path(key), 'rb') as video_file:
+            video_file.seek(offset)
+            return video_file.read(length)
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        with open(self.path(key), 'rb') as video_file:
+            while True:
+                block = video_file.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+    
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+def get_blob_store(conn, backend: Optional[str] = None):
+    '''Blob store for a backend name, VIDEO_STORAGE_BACKEND by default'''
+    backend = backend or VIDEO_STORAGE_BACKEND
+    if backend == 'postgres':
+        return PostgresBlobStore(conn)
+    if backend == 'local':
+        return LocalBlobStore(VIDEO_STORAGE_DIR)
+    raise ValueError(f"Unknown video storage backend: {backend}")
+
+def hash_large_object(conn, video_oid: int) -> str:
+    '''Compute the SHA-256 of a large object reading it block by block'''
+    digest = hashlib.sha256()
+    for block in PostgresBlobStore(conn).iter_blocks(str(video_oid)):
+        digest.update(block)
+    return digest.hexdigest()
+
+def read_mp4_boxes(source, start: int, end: int) -> List[Tuple[bytes, int, int, int]]:
+    '''List (type, offset, header size, size) of the MP4 boxes between two offsets of a seekable stream'''
+    boxes = []
+    offset = start
+    while offset + 8 <= end:
+        source.seek(offset)
+        size, box_type = MP4_BOX_HEADER.unpack(source.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', source.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise ValueError(f"Malformed MP4 box {box_type!r} at offset {offset}")
+        boxes.append((box_type, offset, header_size, size))
+        offset += size
+    return boxes
+
+def shift_chunk_offsets(moov: bytearray, start: int, end: int, shift) -> None:
+    '''Rewrite every stco/co64 entry inside moov in place; stco entries that no longer fit raise OverflowError'''
+    for box_type, offset, header_size, size in read_mp4_boxes(io.BytesIO(moov), start, end):
+        if box_type in MP4_CONTAINER_BOXES:
+            shift_chunk_offsets(moov, offset + header_size, offset + size, shift)
+        elif box_type in (b'stco', b'co64'):
+            # Full box: version and flags, entry count, then the offsets
+            entries_at = offset + header_size + 8
+            (entry_count,) = struct.unpack_from('>I', moov, offset + header_size + 4)
+            entry_format, entry_width = ('>I', 4) if box_type == b'stco' else ('>Q', 8)
+            for entry in range(entry_count):
+                position = entries_at + entry * entry_width
+                (chunk_offset,) = struct.unpack_from(entry_format, moov, position)
+                chunk_offset = shift(chunk_offset)
+                if box_type == b'stco' and chunk_offset > 0xFFFFFFFF:
+                    raise OverflowError("Chunk offset does not fit in stco")
+                struct.pack_into(entry_format, moov, position, chunk_offset)
+
+def copy_stream_range(source, start: int, end: int) -> Iterator[bytes]:
+    '''Yield the bytes between two offsets of a seekable stream block by block'''
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = source.read(min(STORAGE_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        yield block
+
+def mp4_faststart(source, total_size: int) -> Optional[Iterator[bytes]]:
+    '''Stream an MP4 with moov moved ahead of mdat and chunk offsets fixed up; None when there is nothing to move'''
+    try:
+        boxes = read_mp4_boxes(source, 0, total_size)
+    except (ValueError, struct.error):
+        return None
+    
+    box_types = [box[0] for box in boxes]
+    # Fragmented files address samples relative to moof boxes and need no rewrite
+    if not boxes or box_types[0] != b'ftyp' or b'moov' not in box_types or b'mdat' not in box_types or b'moof' in box_types:
+        return None
+    moov_index = box_types.index(b'moov')
+    mdat_index = box_types.index(b'mdat')
+    if moov_index < mdat_index:
+        return None
+    
+    _, moov_offset, moov_header_size, moov_size = boxes[moov_index]
+    if moov_size > MP4_MOOV_MAX_BYTES:
+        return None
+    insert_at = boxes[mdat_index][1]
+    
+    source.seek(moov_offset)
+    moov = bytearray(source.read(moov_size))
+    try:
+        # Everything between the insertion point and the old moov moves down by the size of moov
+        shift_chunk_offsets(moov, moov_header_size, moov_size,
+                            lambda chunk_offset: chunk_offset + moov_size if insert_at <= chunk_offset < moov_offset else chunk_offset)
+    except (OverflowError, ValueError, struct.error):
+        return None
+    
+    def rewritten() -> Iterator[bytes]:
+        yield from copy_stream_range(source, 0, insert_at)
+        yield bytes(moov)
+        yield from copy_stream_range(source, insert_at, moov_offset)
+        yield from copy_stream_range(source, moov_offset + moov_size, total_size)
+    
+    return rewritten()
+
+def faststart_large_object(conn, video_oid: int, video_size: int) -> Tuple[int, str]:
+    '''Copy an assembled MP4 into a new large object with moov first, hashing it on the way; returns the object that holds the video now and its SHA-256'''
+    digest = hashlib.sha256()
+    source = conn.lobject(video_oid, 'rb')
+    try:
+        rewritten = mp4_faststart(source, video_size)
+        if rewritten is None:
+            return video_oid, hash_large_object(conn, video_oid)
+        
+        def hashed() -> Iterator[bytes]:
+            for block in rewritten:
+                digest.update(block)
+                yield block
+        
+        faststart_oid = int(PostgresBlobStore(conn).write('', hashed()))
+    finally:
+        source.close()
+    
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT lo_unlink(%s)", (video_oid,))
+    return faststart_oid, digest.hexdigest()
+
+def register_video_blob(cursor, conn, content_hash: str, video_size: int, video_oid: int) -> List[Tuple[str, str]]:
+    '''Move an assembled large object into the configured blob store, or take a reference to identical stored content;
+    returns the (backend, key) of bytes written outside the transaction, to delete if it rolls back'''
+    cursor.execute("UPDATE video_blobs SET ref_count = ref_count + 1 WHERE sha256 = %s", (content_hash,))
+    if cursor.rowcount:
+        # Same content is already stored: drop the freshly assembled copy
+        cursor.execute("SELECT lo_unlink(%s)", (video_oid,))
+        return []
+    
+    store = get_blob_store(conn)
+    if store.name == 'postgres':
+        # The assembled object becomes the blob as is
+        storage_key = str(video_oid)
+        written = []
+    else:
+        storage_key = store.write(content_hash, PostgresBlobStore(conn).iter_blocks(str(video_oid)))
+        written = [(store.name, storage_key)]
+    
+    try:
+        if written:
+            cursor.execute("SELECT lo_unlink(%s)", (video_oid,))
+        cursor.execute("""
+            INSERT INTO video_blobs (sha256, storage_backend, storage_key, video_size, ref_count)
+            VALUES (%s, %s, %s, %s, 1)
+            ON CONFLICT (sha256) DO UPDATE SET ref_count = video_blobs.ref_count + 1
+            RETURNING storage_backend, storage_key
+        """, (content_hash, store.name, storage_key, video_size))
+        stored = cursor.fetchone()
+    except Exception:
+        if written:
+            store.delete(storage_key)
+        raise
+    
+    if stored != (store.name, storage_key):
+        # A concurrent job stored the same content first
+        store.delete(storage_key)
+        return []
+    return written
+
+def store_video(conn, lead_id: int) -> Dict[str, int]:
+    '''Move a finalized upload from its assembled large object into the deduplicated blob store, then queue its renders'''
+    cursor = conn.cursor()
+    try:
+        # The row lock makes a concurrent delete of the lead wait until its bytes have moved
+        cursor.execute("""
+            SELECT video_oid, video_size FROM video_leads 
+            WHERE id = %s AND blob_sha256 IS NULL AND video_oid IS NOT NULL 
+            FOR UPDATE
+        """, (lead_id,))
+        row = cursor.fetchone()
+        if not row:
+            # Deleted meanwhile, or stored by an earlier attempt
+            conn.rollback()
+            return {'bytes': 0}
+        
+        video_oid, video_size = row
+        # Players can start before the whole file arrives when moov precedes mdat; the one pass
+        # that rewrites the file also hashes it, and re-submitted recordings share one stored copy
+        video_oid, content_hash = faststart_large_object(conn, video_oid, video_size)
+        written = register_video_blob(cursor, conn, content_hash, video_size, video_oid)
+        try:
+            cursor.execute("UPDATE video_leads SET blob_sha256 = %s, video_oid = NULL WHERE id = %s", (content_hash, lead_id))
+            
+            # Poster, thumbnail and optional HLS rendition are rendered from the stored blob
+            cursor.execute("INSERT INTO video_asset_jobs (lead_id) VALUES (%s)", (lead_id,))
+            if HLS_SEGMENTATION:
+                cursor.execute("INSERT INTO video_asset_jobs (lead_id, kind) VALUES (%s, 'hls')", (lead_id,))
+            conn.commit()
+        except Exception:
+            # The lead keeps its large object, and no row names the copied file
+            conn.rollback()
+            for storage_backend, storage_key in written:
+                get_blob_store(conn, storage_backend).delete(storage_key)
+            raise
+    finally:
+        cursor.close()
+    
+    return {'bytes': video_size}
+
+def run_ffmpeg(args: List[str], timeout: int = FFMPEG_TIMEOUT_SECONDS) -> None:
+    '''Run ffmpeg quietly, raising with its stderr on failure'''
+    completed = subprocess.run([FFMPEG_PATH, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y', *args],
+                               capture_output=True, timeout=timeout)
+    if completed.returncode != 0:
+        raise Exception(f"ffmpeg failed: {completed.stderr.decode('utf-8', 'replace').strip()[-500:]}")
+
+def video_input_path(conn, lead_id: int, work_dir: str) -> str:
+    '''Path ffmpeg can read the lead's video from; only videos outside the local blob store are copied to disk'''
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT b.storage_backend, b.storage_key, l.video_oid
+            FROM video_leads l LEFT JOIN video_blobs b ON b.sha256 = l.blob_sha256
+            WHERE l.id = %s
+        """, (lead_id,))
+        row = cursor.fetchone()
+    if not row:
+        raise Exception("Lead not found")
+    
+    storage_backend, storage_key, video_oid = row
+    store = get_blob_store(conn, storage_backend) if storage_key else None
+    if isinstance(store, LocalBlobStore):
+        return store.path(storage_key)
+    
+    input_path = os.path.join(work_dir, 'input')
+    with open(input_path, 'wb') as video_file:
+        if store:
+            blocks = store.iter_blocks(storage_key)
+        elif video_oid:
+            blocks = PostgresBlobStore(conn).iter_blocks(str(video_oid))
+        else:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT video_data FROM video_leads WHERE id = %s", (lead_id,))
+                blocks = [bytes(cursor.fetchone()[0] or b'')]
+        for block in blocks:
+            video_file.write(block)
+    return input_path
+
+def render_assets(conn, lead_id: int) -> Dict[str, int]:
+    '''Extract a poster frame and a thumbnail for a lead with ffmpeg and store them next to it'''
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT video_duration_ms FROM video_leads WHERE id = %s", (lead_id,))
+        row = cursor.fetchone()
+    duration_ms = row[0] if row else None
+    # A frame a little into the video avoids black first frames; short clips use their midpoint
+    seek_seconds = min(1.0, duration_ms / 2000) if duration_ms else 0.0
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_path = video_input_path(conn, lead_id, work_dir)
+        poster_path = os.path.join(work_dir, 'poster.jpg')
+        thumbnail_path = os.path.join(work_dir, 'thumbnail.jpg')
+        
+        run_ffmpeg(['-ss', f'{seek_seconds:.3f}', '-i', input_path, '-frames:v', '1',
+                    '-vf', f"scale='min({POSTER_MAX_WIDTH},iw)':-2", '-q:v', '3', poster_path])
+        if not os.path.exists(poster_path) and seek_seconds:
+            run_ffmpeg(['-i', input_path, '-frames:v', '1', '-vf', f"scale='min({POSTER_MAX_WIDTH},iw)':-2", '-q:v', '3', poster_path])
+        if not os.path.exists(poster_path):
+            raise Exception("ffmpeg produced no poster frame")
+        
+        # The thumbnail is scaled from the poster, not decoded from the video again
+        run_ffmpeg(['-i', poster_path, '-vf', f'scale={THUMBNAIL_WIDTH}:-2', '-q:v', '5', thumbnail_path])
+        
+        sizes = {}
+        with conn.cursor() as cursor:
+            for kind, path in (('poster', poster_path), ('thumbnail', thumbnail_path)):
+                with open(path, 'rb') as image_file:
+                    image = image_file.read()
+                cursor.execute("""
+                    INSERT INTO video_lead_assets (lead_id, kind, content_type, data)
+                    VALUES (%s, %s, 'image/jpeg', %s)
+                    ON CONFLICT (lead_id, kind) DO UPDATE SET data = EXCLUDED.data, created_at = CURRENT_TIMESTAMP
+                """, (lead_id, kind, psycopg2.Binary(image)))
+                sizes[kind] = len(image)
+    return sizes
+
+def parse_hls_playlist(playlist: str) -> Tuple[int, List[Tuple[str, float]]]:
+    '''Target duration and (segment file, duration) pairs of an ffmpeg VOD playlist'''
+    target_duration = 0
+    segments = []
+    duration = None
+    for line in playlist.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-TARGETDURATION:'):
+            target_duration = int(line.split(':', 1)[1])
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',', 1)[0])
+        elif line and not line.startswith('#') and duration is not None:
+            segments.append((line, duration))
+            duration = None
+    return target_duration, segments
+
+def render_hls(conn, lead_id: int) -> Dict[str, int]:
+    '''Segment a lead's video into HLS with ffmpeg and store the segments through the blob store'''
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT video_codec, audio_codec FROM video_leads WHERE id = %s", (lead_id,))
+        row = cursor.fetchone()
+    video_codec, audio_codec = row if row else (None, None)
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_path = video_input_path(conn, lead_id, work_dir)
+        playlist_path = os.path.join(work_dir, 'playlist.m3u8')
+        
+        # H.264/AAC fits MPEG-TS as is; anything else (e.g. VP8/Opus WebM) is transcoded
+        if video_codec == 'avc1' and audio_codec in ('mp4a', None):
+            codec_args = ['-c', 'copy']
+        else:
+            codec_args = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-c:a', 'aac', '-b:a', '128k']
+        run_ffmpeg(['-i', input_path, *codec_args, '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS),
+                    '-hls_playlist_type', 'vod', '-hls_segment_filename', os.path.join(work_dir, 'segment_%05d.ts'),
+                    playlist_path], timeout=HLS_TIMEOUT_SECONDS)
+        
+        with open(playlist_path, 'r', encoding='utf-8') as playlist_file:
+            target_duration, segments = parse_hls_playlist(playlist_file.read())
+        if not segments:
+            raise Exception("ffmpeg produced no HLS segments")
+        
+        store = get_blob_store(conn)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT storage_backend, storage_key FROM video_hls_segments WHERE lead_id = %s", (lead_id,))
+            previous = set(cursor.fetchall())
+            cursor.execute("DELETE FROM video_hls_segments WHERE lead_id = %s", (lead_id,))
+            
+            stored = set()
+            total_bytes = 0
+            for segment_index, (segment_file, duration) in enumerate(segments):
+                with open(os.path.join(work_dir, segment_file), 'rb') as segment:
+                    segment_data = segment.read()
+                # Keys are unique per lead and position, so identical segments of two leads never share bytes
+                segment_hash = hashlib.sha256(f'hls:{lead_id}:{segment_index}:'.encode('utf-8') + segment_data).hexdigest()
+                storage_key = store.write(segment_hash, [segment_data])
+                cursor.execute("""
+                    INSERT INTO video_hls_segments (lead_id, segment_index, duration, storage_backend, storage_key, segment_size)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (lead_id, segment_index, duration, store.name, storage_key, len(segment_data)))
+                stored.add((store.name, storage_key))
+                total_bytes += len(segment_data)
+            
+            cursor.execute("""
+                INSERT INTO video_hls_renditions (lead_id, target_duration, segment_count, total_bytes)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (lead_id) DO UPDATE SET target_duration = EXCLUDED.target_duration, segment_count = EXCLUDED.segment_count, 
+                    total_bytes = EXCLUDED.total_bytes, created_at = CURRENT_TIMESTAMP
+            """, (lead_id, target_duration, len(segments), total_bytes))
+            conn.commit()
+            
+            # Segments of an earlier rendition go only after the new playlist is committed
+            for storage_backend, storage_key in previous - stored:
+                get_blob_store(conn, storage_backend).delete(storage_key)
+        finally:
+            cursor.close()
+    
+    return {'segments': len(segments), 'bytes': total_bytes}
+
+def process_asset_jobs(conn, batch_size: int, enqueue_missing: bool = False, render: bool = True) -> Dict[str, Any]:
+    '''Claim pending asset jobs in batches and run them (only store jobs without render); failures are retried up to ASSET_JOB_MAX_ATTEMPTS'''
+    cursor = conn.cursor()
+    jobs_done = 0
+    jobs_failed = 0
+    jobs_enqueued = 0
+    
+    try:
+        if enqueue_missing:
+            # Backfill leads created before the pipeline (or HLS segmentation) existed; pending store jobs queue their own renders
+            cursor.execute("""
+                INSERT INTO video_asset_jobs (lead_id)
+                SELECT l.id FROM video_leads l
+                WHERE (l.blob_sha256 IS NOT NULL OR l.video_oid IS NOT NULL OR l.video_data IS NOT NULL)
+                  AND NOT EXISTS (SELECT 1 FROM video_lead_assets a WHERE a.lead_id = l.id)
+                  AND NOT EXISTS (SELECT 1 FROM video_asset_jobs j WHERE j.lead_id = l.id AND j.kind IN ('images', 'store') AND j.status IN ('pending', 'running'))
+            """)
+            jobs_enqueued = cursor.rowcount
+            if HLS_SEGMENTATION:
+                cursor.execute("""
+                    INSERT INTO video_asset_jobs (lead_id, kind)
+                    SELECT l.id, 'hls' FROM video_leads l
+                    WHERE (l.blob_sha256 IS NOT NULL OR l.video_oid IS NOT NULL OR l.video_data IS NOT NULL)
+                      AND NOT EXISTS (SELECT 1 FROM video_hls_renditions r WHERE r.lead_id = l.id)
+                      AND NOT EXISTS (SELECT 1 FROM video_asset_jobs j WHERE j.lead_id = l.id AND j.kind IN ('hls', 'store') AND j.status IN ('pending', 'running'))
+                """)
+                jobs_enqueued += cursor.rowcount
+            conn.commit()
+        
+        while True:
+            # Claim a batch and commit, so a long ffmpeg run holds no row locks
+            cursor.execute("""
+                UPDATE video_asset_jobs j SET status = 'running', attempts = j.attempts + 1, updated_at = CURRENT_TIMESTAMP
+                FROM (
+                    SELECT id FROM video_asset_jobs 
+                    WHERE (status = 'pending' 
+                       OR (status = 'running' AND updated_at < CURRENT_TIMESTAMP - make_interval(mins => %s)))
+                      AND (%s OR kind = 'store')
+                    ORDER BY id 
+                    LIMIT %s 
+                    FOR UPDATE SKIP LOCKED
+                ) claimed
+                WHERE j.id = claimed.id
+                RETURNING j.id, j.lead_id, j.kind, j.attempts
+            """, (ASSET_JOB_STALE_MINUTES, render, batch_size))
+            claimed = cursor.fetchall()
+            conn.commit()
+            
+            for job_id, lead_id, kind, attempts in claimed:
+                try:
+                    if kind == 'store':
+                        sizes = store_video(conn, lead_id)
+                    elif kind == 'hls':
+                        sizes = render_hls(conn, lead_id)
+                    else:
+                        sizes = render_assets(conn, lead_id)
+                    cursor.execute("UPDATE video_asset_jobs SET status = 'done', last_error = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = %s", (job_id,))
+                    conn.commit()
+                    jobs_done += 1
+                    print(f"Finished {kind} job for lead {lead_id}: {sizes}")
+                except Exception as e:
+                    conn.rollback()
+                    cursor.execute("""
+                        UPDATE video_asset_jobs SET status = %s, last_error = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s
+                    """, ('failed' if attempts >= ASSET_JOB_MAX_ATTEMPTS else 'pending', str(e), job_id))
+                    conn.commit()
+                    jobs_failed += 1
+                    print(f"Asset job {job_id} for lead {lead_id} failed: {str(e)}")
+            
+            if len(claimed) < batch_size:
+                break
+    finally:
+        cursor.close()
+    
+    return {'jobs_done': jobs_done, 'jobs_failed': jobs_failed, 'jobs_enqueued': jobs_enqueued}
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Store finalized uploads in the blob store, then render poster frames, thumbnails and HLS renditions from the asset job queue (scheduled trigger or admin request)
+    Args: event from a timer trigger, or HTTP event with headers (X-Auth-Token) and query params (backfill)
+    Returns: Number of rendered, failed and enqueued jobs
+    '''
+    method: Optional[str] = event.get('httpMethod')
+    
+    # Handle CORS OPTIONS request
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'isBase64Encoded': False,
+            'body': ''
+        }
+    
+    batch_size = int(os.environ.get('ASSET_BATCH_SIZE', '5'))
+    enqueue_missing = False
+    
+    # HTTP invocations are admin-only; timer triggers carry no httpMethod
+    if method:
+        if method != 'POST':
+            return {
+                'statusCode': 405,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Method not allowed'})
+            }
+        
+        headers = event.get('headers', {})
+        auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+        
+        if not auth_token:
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Authentication token required'})
+            }
+        
+        user_data = verify_token(auth_token)
+        if not user_data:
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Invalid token'})
+            }
+        
+        if user_data.get('role') != 'admin':
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'isBase64Encoded': False,
+                'body': json.dumps({'error': 'Access denied. Admin role required'})
+            }
+        
+        query_params = event.get('queryStringParameters') or {}
+        enqueue_missing = query_params.get('backfill') in ('1', 'true')
+    
+    # Storing uploads needs no ffmpeg; render jobs wait until it is available
+    render = shutil.which(FFMPEG_PATH) is not None
+    if not render:
+        print(f"ffmpeg not found at {FFMPEG_PATH}, running store jobs only")
+    
+    try:
+        db_url = os.environ.get('DATABASE_URL')
+        conn = psycopg2.connect(db_url)
+        
+        result = process_asset_jobs(conn, batch_size, enqueue_missing, render)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'success': True, 'rendering': render, **result})
+        }
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': f'Server error: {str(e)}'})
+        }
+    
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == '__main__':
+    # CLI: python index.py [batch_size] [--backfill]
+    cli_args = [arg for arg in sys.argv[1:] if arg != '--backfill']
+    cli_batch_size = int(cli_args[0]) if cli_args else int(os.environ.get('ASSET_BATCH_SIZE', '5'))
+    cli_conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        print(json.dumps(process_asset_jobs(cli_conn, cli_batch_size, '--backfill' in sys.argv, shutil.which(FFMPEG_PATH) is not None)))
+    finally:
+        cli_conn.close()
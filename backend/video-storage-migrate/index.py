@@ -0,0 +1,380 @@
+import json
+import os
+import sys
+import hashlib
+import jwt
+import psycopg2
+import uuid
+from typing import Dict, Any, Optional, Iterable, Iterator
+
+# Where new video bytes are stored: 'postgres' (large objects) or 'local' (files under VIDEO_STORAGE_DIR)
+VIDEO_STORAGE_BACKEND = os.environ.get('VIDEO_STORAGE_BACKEND', 'postgres')
+VIDEO_STORAGE_DIR = os.environ.get('VIDEO_STORAGE_DIR', '/var/lib/video-leads')
+# Block size for hashing and copying videos without loading them whole
+STORAGE_BLOCK_SIZE = 1024 * 1024
+
+def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    '''Verify JWT token and return user data'''
+    try:
+        jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-in-production')
+        decoded = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+        return decoded
+    except:
+        return None
+
+class PostgresBlobStore:
+    '''Video bytes in Postgres large objects, outside the video_leads rows; the key is the object OID'''
+    name = 'postgres'
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        video_object = self.conn.lobject(0, 'wb')
+        try:
+            for block in blocks:
+                video_object.write(bytes(block))
+            return str(video_object.oid)
+        finally:
+            video_object.close()
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            video_object.seek(offset)
+            return video_object.read(length)
+        finally:
+            video_object.close()
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        video_object = self.conn.lobject(int(key), 'rb')
+        try:
+            while True:
+                block = video_object.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+        finally:
+            video_object.close()
+    
+    def delete(self, key: str) -> None:
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT lo_unlink(%s)", (int(key),))
+
+class LocalBlobStore:
+    '''Video bytes as files under a local directory; the key is the path relative to it'''
+    name = 'local'
+    
+    def __init__(self, root: str):
+        self.root = root
+    
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+    
+    def write(self, content_hash: str, blocks: Iterable[bytes]) -> str:
+        # Every write gets its own file, like a new large object OID, so deleting the key of one
+        # dropped row never removes bytes that a concurrent upload of the same content just wrote
+        key = f'{content_hash[:2]}/{content_hash}-{uuid.uuid4().hex}'
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so readers never see a partial file
+        partial_path = f'{path}.partial'
+        with open(partial_path, 'wb') as video_file:
+            for block in blocks:
+                video_file.write(block)
+        os.replace(partial_path, path)
+        return key
+    
+    def read(self, key: str, offset: int = 0, length: int = -1) -> bytes:
+        with open(self.path(key), 'rb') as video_file:
+            video_file.seek(offset)
+            return video_file.read(length)
+    
+    def iter_blocks(self, key: str) -> Iterator[bytes]:
+        with open(self.path(key), 'rb') as video_file:
+            while True:
+                block = video_file.read(STORAGE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+    
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+def get_blob_store(conn, backend: Optional[str] = None):
+    '''Blob store for a backend name, VIDEO_STORAGE_BACKEND by default'''
+    backend = backend or VIDEO_STORAGE_BACKEND
+    if backend == 'postgres':
+        return PostgresBlobStore(conn)
+    if backend == 'local':
+        return LocalBlobStore(VIDEO_STORAGE_DIR)
+    raise ValueError(f"Unknown video storage backend: {backend}")
+
+def iter_legacy_video(conn, lead_id: int, video_oid: Optional[int]) -> Iterator[bytes]:
+    '''Stream a pre-blob video from its own large object or from the video_data column, block by block'''
+    if video_oid:
+        yield from PostgresBlobStore(conn).iter_blocks(str(video_oid))
+        return
+    with conn.cursor() as cursor:
+        offset = 0
+        while True:
+            cursor.execute("SELECT substring(video_data from %s for %s) FROM video_leads WHERE id = %s", (offset + 1, STORAGE_BLOCK_SIZE, lead_id))
+            block = cursor.fetchone()[0]
+            if not block:
+                break
+            yield bytes(block)
+            offset += len(block)
+
+def parse_batch_size(value: str) -> int:
+    '''Rows per migration batch; raises ValueError unless it is a positive integer'''
+    batch_size = int(value)
+    if batch_size <= 0:
+        raise ValueError(f"batch_size must be a positive integer, got {value!r}")
+    return batch_size
+
+def migrate_legacy_leads(conn, store, batch_size: int) -> Dict[str, int]:
+    '''Move videos still kept in video_leads rows (video_data or a per-lead large object) into content-addressed blobs'''
+    cursor = conn.cursor()
+    leads_migrated = 0
+    bytes_moved = 0
+    
+    try:
+        while True:
+            cursor.execute("""
+                SELECT id, video_oid FROM video_leads 
+                WHERE blob_sha256 IS NULL AND (video_oid IS NOT NULL OR video_data IS NOT NULL)
+                ORDER BY id 
+                LIMIT %s 
+                FOR UPDATE SKIP LOCKED
+            """, (batch_size,))
+            
+            batch = cursor.fetchall()
+            written = []
+            try:
+                for lead_id, video_oid in batch:
+                    # Hash first: identical content may already be stored
+                    digest = hashlib.sha256()
+                    video_size = 0
+                    for block in iter_legacy_video(conn, lead_id, video_oid):
+                        digest.update(block)
+                        video_size += len(block)
+                    content_hash = digest.hexdigest()
+                    
+                    cursor.execute("UPDATE video_blobs SET ref_count = ref_count + 1 WHERE sha256 = %s", (content_hash,))
+                    if not cursor.rowcount:
+                        storage_key = store.write(content_hash, iter_legacy_video(conn, lead_id, video_oid))
+                        if store.name != 'postgres':
+                            written.append(storage_key)
+                        cursor.execute("""
+                            INSERT INTO video_blobs (sha256, storage_backend, storage_key, video_size, ref_count)
+                            VALUES (%s, %s, %s, %s, 1)
+                            ON CONFLICT (sha256) DO UPDATE SET ref_count = video_blobs.ref_count + 1
+                            RETURNING storage_backend, storage_key
+                        """, (content_hash, store.name, storage_key, video_size))
+                        if cursor.fetchone() != (store.name, storage_key):
+                            store.delete(storage_key)
+                    
+                    cursor.execute("""
+                        UPDATE video_leads SET blob_sha256 = %s, video_size = %s, video_data = NULL, video_oid = NULL 
+                        WHERE id = %s
+                    """, (content_hash, video_size, lead_id))
+                    if video_oid:
+                        cursor.execute("SELECT lo_unlink(%s)", (video_oid,))
+                    bytes_moved += video_size
+                conn.commit()
+            except Exception:
+                # Files written for a rolled-back batch are named by no row
+                conn.rollback()
+                for storage_key in written:
+                    store.delete(storage_key)
+                raise
+            
+            leads_migrated += len(batch)
+            if len(batch) < batch_size:
+                break
+    finally:
+        cursor.close()
+    
+    return {'leads_migrated': leads_migrated, 'lead_bytes_moved': bytes_moved}
+
+def migrate_blobs(conn, store, batch_size: int) -> Dict[str, int]:
+    '''Copy blobs kept in other backends into the target store, verifying each copy against its SHA-256'''
+    cursor = conn.cursor()
+    blobs_migrated = 0
+    bytes_moved = 0
+    
+    try:
+        while True:
+            cursor.execute("""
+                SELECT sha256, storage_backend, storage_key, video_size FROM video_blobs 
+                WHERE storage_backend <> %s 
+                ORDER BY sha256 
+                LIMIT %s 
+                FOR UPDATE SKIP LOCKED
+            """, (store.name, batch_size))
+            
+            batch = cursor.fetchall()
+            moved_from = []
+            written = []
+            try:
+                for content_hash, storage_backend, storage_key, video_size in batch:
+                    source = get_blob_store(conn, storage_backend)
+                    digest = hashlib.sha256()
+                    
+                    def verified_blocks():
+                        for block in source.iter_blocks(storage_key):
+                            digest.update(block)
+                            yield block
+                    
+                    new_key = store.write(content_hash, verified_blocks())
+                    if store.name != 'postgres':
+                        written.append(new_key)
+                    if digest.hexdigest() != content_hash:
+                        raise Exception(f"Checksum mismatch for blob {content_hash} in {storage_backend}")
+                    
+                    cursor.execute("UPDATE video_blobs SET storage_backend = %s, storage_key = %s WHERE sha256 = %s", (store.name, new_key, content_hash))
+                    moved_from.append((source, storage_key))
+                    bytes_moved += video_size
+                conn.commit()
+            except Exception:
+                # Copies made for a rolled-back batch are named by no row
+                conn.rollback()
+                for new_key in written:
+                    store.delete(new_key)
+                raise
+            
+            # Old copies go only after the rows point at the new ones
+            for source, storage_key in moved_from:
+                source.delete(storage_key)
+            conn.commit()
+            
+            blobs_migrated += len(batch)
+            if len(batch) < batch_size:
+                break
+    finally:
+        cursor.close()
+    
+    return {'blobs_migrated': blobs_migrated, 'blob_bytes_moved': bytes_moved}
+
+def migrate_video_storage(conn, backend: str, batch_size: int) -> Dict[str, Any]:
+    '''Move all video bytes out of video_leads rows and into one blob store backend, in committed batches'''
+    store = get_blob_store(conn, backend)
+    result = {**migrate_legacy_leads(conn, store, batch_size), **migrate_blobs(conn, store, batch_size)}
+    print(f"Storage migration to {store.name}: {json.dumps(result)}")
+    return {'backend': store.name, **result}
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Move stored videos out of video_leads rows and between blob storage backends (admin request)
+    Args: event with httpMethod, headers (X-Auth-Token), query params (backend, batch_size)
+    Returns: Number of migrated leads and blobs and moved bytes
+    '''
+    method: str = event.get('httpMethod', 'POST')
+    
+    # Handle CORS OPTIONS request
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'isBase64Encoded': False,
+            'body': ''
+        }
+    
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Method not allowed'})
+        }
+    
+    headers = event.get('headers', {})
+    auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    
+    if not auth_token:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Authentication token required'})
+        }
+    
+    user_data = verify_token(auth_token)
+    if not user_data:
+        return {
+            'statusCode': 401,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Invalid token'})
+        }
+    
+    if user_data.get('role') != 'admin':
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'Access denied. Admin role required'})
+        }
+    
+    query_params = event.get('queryStringParameters') or {}
+    backend = query_params.get('backend') or VIDEO_STORAGE_BACKEND
+    try:
+        batch_size = parse_batch_size(query_params.get('batch_size') or os.environ.get('STORAGE_MIGRATION_BATCH_SIZE', '20'))
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': str(e)})
+        }
+    
+    if backend not in ('postgres', 'local'):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': 'backend must be postgres or local'})
+        }
+    
+    try:
+        db_url = os.environ.get('DATABASE_URL')
+        conn = psycopg2.connect(db_url)
+        
+        result = migrate_video_storage(conn, backend, batch_size)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'success': True, **result})
+        }
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': json.dumps({'error': f'Server error: {str(e)}'})
+        }
+    
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == '__main__':
+    # CLI: python index.py [backend] [batch_size]
+    cli_backend = sys.argv[1] if len(sys.argv) > 1 else VIDEO_STORAGE_BACKEND
+    cli_batch_size = parse_batch_size(sys.argv[2] if len(sys.argv) > 2 else os.environ.get('STORAGE_MIGRATION_BATCH_SIZE', '20'))
+    cli_conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        print(json.dumps(migrate_video_storage(cli_conn, cli_backend, cli_batch_size)))
+    finally:
+        cli_conn.close()
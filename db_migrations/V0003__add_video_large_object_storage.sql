@@ -0,0 +1,3 @@
+-- Видео из многочастных загрузок собирается потоково в large object
+ALTER TABLE video_leads ADD COLUMN IF NOT EXISTS video_oid OID;
+ALTER TABLE video_leads ADD COLUMN IF NOT EXISTS video_size BIGINT;
@@ -0,0 +1,4 @@
+-- Видео собирается по мере поступления частей: водяная отметка последней непрерывной части
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS video_oid OID;
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS assembled_through INTEGER NOT NULL DEFAULT -1;
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS assembled_bytes BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,8 @@
+-- Битовая карта полученных частей и счетчики вместо COUNT(*) по upload_chunks
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS received_bitmap BYTEA;
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS received_chunks INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS received_bytes BIGINT NOT NULL DEFAULT 0;
+
+UPDATE chunked_uploads 
+SET received_bitmap = decode(repeat('00', (total_chunks + 7) / 8), 'hex') 
+WHERE received_bitmap IS NULL;
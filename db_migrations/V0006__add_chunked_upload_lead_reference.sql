@@ -0,0 +1,2 @@
+-- Ссылка на созданный лид: повторная финализация возвращает тот же лид
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS lead_id INTEGER;
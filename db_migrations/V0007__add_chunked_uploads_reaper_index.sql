@@ -0,0 +1,2 @@
+-- Индекс для поиска простаивающих сессий загрузки
+CREATE INDEX IF NOT EXISTS idx_chunked_uploads_status_updated_at ON chunked_uploads(status, updated_at);
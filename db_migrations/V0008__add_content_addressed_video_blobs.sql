@@ -0,0 +1,12 @@
+-- Дедупликация видео: одинаковое содержимое хранится один раз, лиды ссылаются на него по SHA-256
+CREATE TABLE IF NOT EXISTS video_blobs (
+    sha256 VARCHAR(64) PRIMARY KEY,
+    video_oid OID NOT NULL,
+    video_size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE video_leads ADD COLUMN IF NOT EXISTS blob_sha256 VARCHAR(64) REFERENCES video_blobs(sha256);
+
+CREATE INDEX IF NOT EXISTS idx_video_leads_blob_sha256 ON video_leads(blob_sha256);
@@ -0,0 +1,4 @@
+-- Размер части, согласованный с сервером; после пересогласования части нумеруются от байтового смещения
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS chunk_size INTEGER;
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS chunk_base_index INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS chunk_base_offset BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,2 @@
+-- Видео не сжимается: хранение без сжатия позволяет substring читать только нужные TOAST-чанки
+ALTER TABLE video_leads ALTER COLUMN video_data SET STORAGE EXTERNAL;
@@ -0,0 +1,11 @@
+-- Подключаемое хранилище видео: байты лежат в бэкенде (postgres — large objects, local — файлы), video_blobs хранит бэкенд и ключ
+ALTER TABLE video_blobs ADD COLUMN IF NOT EXISTS storage_backend VARCHAR(20) NOT NULL DEFAULT 'postgres';
+ALTER TABLE video_blobs ADD COLUMN IF NOT EXISTS storage_key VARCHAR(255);
+
+UPDATE video_blobs SET storage_key = video_oid::text WHERE storage_key IS NULL;
+
+ALTER TABLE video_blobs ALTER COLUMN storage_key SET NOT NULL;
+ALTER TABLE video_blobs DROP COLUMN IF EXISTS video_oid;
+
+-- Лиды с блобом хранят только ключ (blob_sha256, он же контрольная сумма) и размер
+UPDATE video_leads SET video_oid = NULL WHERE blob_sha256 IS NOT NULL;
@@ -0,0 +1,6 @@
+-- Метаданные контейнера, прочитанные из заголовков при загрузке: админка показывает их без скачивания видео
+ALTER TABLE video_leads ADD COLUMN IF NOT EXISTS video_duration_ms INTEGER;
+ALTER TABLE video_leads ADD COLUMN IF NOT EXISTS video_width INTEGER;
+ALTER TABLE video_leads ADD COLUMN IF NOT EXISTS video_height INTEGER;
+ALTER TABLE video_leads ADD COLUMN IF NOT EXISTS video_codec VARCHAR(32);
+ALTER TABLE video_leads ADD COLUMN IF NOT EXISTS audio_codec VARCHAR(32);
@@ -0,0 +1,21 @@
+-- Производные ресурсы видео (постер и миниатюра): очередь заданий и готовые изображения рядом с лидом
+CREATE TABLE IF NOT EXISTS video_asset_jobs (
+    id SERIAL PRIMARY KEY,
+    lead_id INTEGER NOT NULL REFERENCES video_leads(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_video_asset_jobs_status ON video_asset_jobs(status, id);
+
+CREATE TABLE IF NOT EXISTS video_lead_assets (
+    lead_id INTEGER NOT NULL REFERENCES video_leads(id) ON DELETE CASCADE,
+    kind VARCHAR(20) NOT NULL,
+    content_type VARCHAR(50) NOT NULL,
+    data BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (lead_id, kind)
+);
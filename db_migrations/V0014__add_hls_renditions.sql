@@ -0,0 +1,20 @@
+-- HLS-нарезка готовых видео: задания в общей очереди ресурсов, сегменты хранятся через хранилище блобов
+ALTER TABLE video_asset_jobs ADD COLUMN IF NOT EXISTS kind VARCHAR(20) NOT NULL DEFAULT 'images';
+
+CREATE TABLE IF NOT EXISTS video_hls_renditions (
+    lead_id INTEGER PRIMARY KEY REFERENCES video_leads(id) ON DELETE CASCADE,
+    target_duration INTEGER NOT NULL,
+    segment_count INTEGER NOT NULL,
+    total_bytes BIGINT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS video_hls_segments (
+    lead_id INTEGER NOT NULL REFERENCES video_leads(id) ON DELETE CASCADE,
+    segment_index INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    storage_backend VARCHAR(20) NOT NULL,
+    storage_key VARCHAR(255) NOT NULL,
+    segment_size INTEGER NOT NULL,
+    PRIMARY KEY (lead_id, segment_index)
+);
@@ -0,0 +1,13 @@
+-- ZIP-экспорт лидов: готовые архивы хранятся через хранилище блобов и удаляются по истечении срока
+CREATE TABLE IF NOT EXISTS video_exports (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    storage_backend VARCHAR(20) NOT NULL,
+    storage_key VARCHAR(255) NOT NULL,
+    archive_size BIGINT NOT NULL,
+    lead_count INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_video_exports_expires_at ON video_exports(expires_at);
@@ -0,0 +1,2 @@
+-- Постраничная выдача лидов по ключу (created_at, id) в пределах пользователя
+CREATE INDEX IF NOT EXISTS idx_video_leads_user_created_id ON video_leads(user_id, created_at DESC, id DESC);
@@ -0,0 +1,9 @@
+-- Полнотекстовый поиск по заголовку и комментариям лида (русская и английская конфигурации)
+ALTER TABLE video_leads ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(comments, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(comments, '')), 'B')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_video_leads_search_vector ON video_leads USING GIN (search_vector);
@@ -0,0 +1,2 @@
+-- Постраничная выдача пользователей в админ-панели по ключу (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_users_created_id ON users(created_at DESC, id DESC);
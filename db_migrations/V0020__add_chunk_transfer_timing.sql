@@ -0,0 +1,4 @@
+-- Время передачи частей без простоев: байты и секунды между соседними приёмами частей, паузы дольше порога не учитываются
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS last_chunk_at TIMESTAMP;
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS transfer_bytes BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE chunked_uploads ADD COLUMN IF NOT EXISTS transfer_seconds DOUBLE PRECISION NOT NULL DEFAULT 0;
@@ -1,9 +1,18 @@
 import React, { useState, useEffect } from 'react';
 import Icon from '@/components/ui/icon';
+import { Input } from '@/components/ui/input';
+import { Button } from '@/components/ui/button';
 import { useToast } from '@/hooks/use-toast';
 import AdminStatsCards from './admin/AdminStatsCards';
 import UsersList from './admin/UsersList';
 import UserDetails from './admin/UserDetails';
+import { downloadExportArchive } from '@/utils/exportArchive';
+import { fetchByRanges } from '@/utils/rangeDownload';
+
+const LEADS_API_URL = 'https://functions.poehali.dev/a119ce14-9a5b-40de-b18f-3ef1f6dc7484';
+
+// Largest page the admin API serves (MAX_PAGE_SIZE); used when every lead of a user is needed
+const ADMIN_MAX_PAGE_SIZE = 200;
 
 interface Lead {
   id: string;
@@ -12,6 +21,17 @@ interface Lead {
   created_at: string;
   video_filename?: string;
   has_video: boolean;
+  video_content_type?: string;
+  video_size?: number;
+  video_duration_ms?: number;
+  video_width?: number;
+  video_height?: number;
+  video_codec?: string;
+  audio_codec?: string;
+  thumbnail_query?: string;
+  thumbnail_url?: string;
+  title_snippet?: string;
+  comments_snippet?: string;
 }
 
 interface User {
@@ -19,13 +39,19 @@ interface User {
   name: string;
   email: string;
   created_at: string;
+  lead_count: number;
+  video_count: number;
+  last_lead_at?: string;
+  // Leads loaded so far (only the matching ones while searching), and where the next page starts
   leads: Lead[];
+  leads_cursor?: string | null;
 }
 
 interface AdminStats {
   total_users: number;
   total_leads: number;
   total_videos: number;
+  estimated?: boolean;
 }
 
 interface AdminPanelProps {
@@ -42,10 +68,17 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
   const [loading, setLoading] = useState(true);
   const [selectedUser, setSelectedUser] = useState<User | null>(null);
   const [videoUrl, setVideoUrl] = useState<string>('');
+  // The MP4 byte-range URL of the open video; videoUrl may be an HLS playlist instead
+  const [playback, setPlayback] = useState<{ leadId: string; url: string } | null>(null);
   const [loadingVideo, setLoadingVideo] = useState(false);
   const [deletingLeadId, setDeletingLeadId] = useState<string | null>(null);
   const [deletingUserId, setDeletingUserId] = useState<string | null>(null);
   const [editingUserId, setEditingUserId] = useState<string | null>(null);
+  const [search, setSearch] = useState('');
+  const [activeSearch, setActiveSearch] = useState('');
+  const [usersCursor, setUsersCursor] = useState<string | null>(null);
+  const [loadingMoreUsers, setLoadingMoreUsers] = useState(false);
+  const [loadingMoreLeads, setLoadingMoreLeads] = useState(false);
   
   const { toast } = useToast();
 
@@ -53,38 +86,99 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
     loadAdminData();
   }, []);
 
-  const loadAdminData = async () => {
+  // Thumbnails come as signed query strings for the admin video function
+  const withThumbnails = (leads: Lead[]): Lead[] => leads.map((lead) => ({
+    ...lead,
+    thumbnail_url: lead.thumbnail_query ? `${videoApiUrl}?${lead.thumbnail_query}` : undefined
+  }));
+
+  const fetchAdmin = async (params: Record<string, string>) => {
+    const query = new URLSearchParams(params).toString();
+    const response = await fetch(`${adminApiUrl}${query ? `?${query}` : ''}`, {
+      method: 'GET',
+      headers: {
+        'X-Auth-Token': token,
+        'Content-Type': 'application/json'
+      }
+    });
+    const data = await response.json();
+    if (!response.ok || !data.success) {
+      throw new Error(data.error || 'Не удалось загрузить данные администратора');
+    }
+    return data;
+  };
+
+  // One page of a user's leads; the users list itself carries only counts
+  const fetchUserLeads = async (
+    userId: string,
+    cursor?: string | null,
+    limit?: number
+  ): Promise<{ leads: Lead[]; nextCursor: string | null }> => {
+    const params: Record<string, string> = { user_id: userId };
+    if (cursor) params.cursor = cursor;
+    if (limit) params.limit = String(limit);
+    const data = await fetchAdmin(params);
+    return { leads: withThumbnails(data.leads || []), nextCursor: data.next_cursor || null };
+  };
+
+  const selectUser = async (user: User, searchQuery: string = activeSearch) => {
+    // Search results already hold the user's matching leads
+    if (searchQuery) {
+      setSelectedUser(user);
+      return;
+    }
+    setSelectedUser({ ...user, leads: [], leads_cursor: null });
     try {
-      const response = await fetch(adminApiUrl, {
-        method: 'GET',
-        headers: {
-          'X-Auth-Token': token,
-          'Content-Type': 'application/json'
-        }
+      const { leads, nextCursor } = await fetchUserLeads(user.id);
+      setSelectedUser({ ...user, leads, leads_cursor: nextCursor });
+    } catch (error) {
+      toast({
+        title: 'Ошибка',
+        description: 'Не удалось загрузить лиды пользователя',
+        variant: 'destructive'
       });
+    }
+  };
 
-      if (response.ok) {
-        const data = await response.json();
-        const newUsers = data.users || [];
-        setUsers(newUsers);
-        setStats(data.statistics || { total_users: 0, total_leads: 0, total_videos: 0 });
-        
-        // Update selected user with fresh data if one was selected
-        if (selectedUser) {
-          const updatedSelectedUser = newUsers.find((u: User) => u.id === selectedUser.id);
+  const loadMoreUserLeads = async () => {
+    if (!selectedUser?.leads_cursor) return;
+    setLoadingMoreLeads(true);
+    try {
+      const { leads, nextCursor } = await fetchUserLeads(selectedUser.id, selectedUser.leads_cursor);
+      setSelectedUser({ ...selectedUser, leads: [...selectedUser.leads, ...leads], leads_cursor: nextCursor });
+    } catch (error) {
+      toast({
+        title: 'Ошибка',
+        description: 'Не удалось загрузить лиды пользователя',
+        variant: 'destructive'
+      });
+    } finally {
+      setLoadingMoreLeads(false);
+    }
+  };
+
+  // First page of users with lead counts; with a search the API returns only users that have matching leads, with highlighted snippets
+  const loadAdminData = async (searchQuery: string = activeSearch, refreshSelected: boolean = true) => {
+    try {
+      const data = await fetchAdmin(searchQuery ? { search: searchQuery } : {});
+      const newUsers = (data.users || []).map((u: User) => ({ ...u, leads: withThumbnails(u.leads || []) }));
+      setUsers(newUsers);
+      setUsersCursor(data.next_cursor || null);
+      setStats(data.statistics || { total_users: 0, total_leads: 0, total_videos: 0 });
+      
+      // Refresh the selected user's counts and leads if one was selected
+      if (selectedUser && refreshSelected) {
+        const updatedSelectedUser = newUsers.find((u: User) => u.id === selectedUser.id);
+        if (searchQuery) {
           setSelectedUser(updatedSelectedUser || null);
+        } else {
+          await selectUser(updatedSelectedUser || selectedUser, searchQuery);
         }
-      } else {
-        toast({
-          title: 'Ошибка загрузки',
-          description: 'Не удалось загрузить данные администратора',
-          variant: 'destructive'
-        });
       }
     } catch (error) {
       toast({
-        title: 'Ошибка',
-        description: 'Не удалось загрузить данные',
+        title: 'Ошибка загрузки',
+        description: 'Не удалось загрузить данные администратора',
         variant: 'destructive'
       });
     } finally {
@@ -92,12 +186,38 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
     }
   };
 
+  const loadMoreUsers = async () => {
+    if (!usersCursor) return;
+    setLoadingMoreUsers(true);
+    try {
+      const data = await fetchAdmin({ cursor: usersCursor });
+      setUsers(prev => [...prev, ...(data.users || []).map((u: User) => ({ ...u, leads: [] }))]);
+      setUsersCursor(data.next_cursor || null);
+    } catch (error) {
+      toast({
+        title: 'Ошибка загрузки',
+        description: 'Не удалось загрузить пользователей',
+        variant: 'destructive'
+      });
+    } finally {
+      setLoadingMoreUsers(false);
+    }
+  };
+
+  const handleSearch = async (event: React.FormEvent) => {
+    event.preventDefault();
+    setActiveSearch(search.trim());
+    await loadAdminData(search.trim());
+  };
+
   const loadVideo = async (leadId: string) => {
     setLoadingVideo(true);
     setVideoUrl('');
+    setPlayback(null);
     
     try {
-      const response = await fetch(`${videoApiUrl}?id=${leadId}`, {
+      // Signed, short-lived URL: the player streams byte ranges instead of a base64 data URL
+      const response = await fetch(`${videoApiUrl}?id=${leadId}&action=playback_url`, {
         method: 'GET',
         headers: {
           'X-Auth-Token': token
@@ -106,8 +226,13 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
 
       if (response.ok) {
         const data = await response.json();
-        if (data.video_url) {
-          setVideoUrl(data.video_url);
+        // Segmented HLS where the browser plays it natively, otherwise byte ranges of the original file
+        const query = data.hls_query && document.createElement('video').canPlayType('application/vnd.apple.mpegurl')
+          ? data.hls_query
+          : data.playback_query;
+        if (query) {
+          setVideoUrl(`${videoApiUrl}?${query}`);
+          setPlayback({ leadId, url: `${videoApiUrl}?${data.playback_query}` });
         } else {
           toast({
             title: 'Видео не найдено',
@@ -129,57 +254,63 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
 
   const closeVideo = () => {
     setVideoUrl('');
+    setPlayback(null);
   };
 
   const downloadVideo = async (leadId: string, leadTitle: string, userName: string) => {
     try {
-      const response = await fetch(`${videoApiUrl}?id=${leadId}`, {
-        method: 'GET',
-        headers: {
-          'X-Auth-Token': token
-        }
-      });
+      // Always the MP4 playback URL, never the HLS playlist the player may be showing
+      let playbackUrl = playback?.leadId === leadId ? playback.url : '';
+      if (!playbackUrl) {
+        const response = await fetch(`${videoApiUrl}?id=${leadId}&action=playback_url`, {
+          method: 'GET',
+          headers: {
+            'X-Auth-Token': token
+          }
+        });
 
-      if (response.ok) {
-        const data = await response.json();
-        if (data.video_url) {
-          const dataUrl = data.video_url;
-          const response = await fetch(dataUrl);
-          const blob = await response.blob();
-          
-          const blobUrl = URL.createObjectURL(blob);
-          const link = document.createElement('a');
-          link.href = blobUrl;
-          
-          const cleanUserName = userName.replace(/[^a-zA-Z0-9]/g, '_');
-          const cleanTitle = leadTitle.replace(/[^a-zA-Z0-9]/g, '_');
-          link.download = `${cleanUserName}_${cleanTitle}_${leadId}.mp4`;
-          
-          document.body.appendChild(link);
-          link.click();
-          document.body.removeChild(link);
-          
-          URL.revokeObjectURL(blobUrl);
-          
+        if (!response.ok) {
+          const errorData = await response.json();
           toast({
-            title: 'Скачивание начато',
-            description: `Видео "${leadTitle}" от ${userName} загружается`,
+            title: 'Ошибка доступа',
+            description: errorData.error || 'Не удалось получить видео',
+            variant: 'destructive'
           });
-        } else {
+          return;
+        }
+
+        const data = await response.json();
+        if (!data.playback_query) {
           toast({
             title: 'Видео не найдено',
             description: 'Видео для этого лида не существует',
             variant: 'destructive'
           });
+          return;
         }
-      } else {
-        const errorData = await response.json();
-        toast({
-          title: 'Ошибка доступа',
-          description: errorData.error || 'Не удалось получить видео',
-          variant: 'destructive'
-        });
+        playbackUrl = `${videoApiUrl}?${data.playback_query}`;
       }
+
+      const blob = await fetchByRanges(playbackUrl);
+      
+      const blobUrl = URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = blobUrl;
+      
+      const cleanUserName = userName.replace(/[^a-zA-Z0-9]/g, '_');
+      const cleanTitle = leadTitle.replace(/[^a-zA-Z0-9]/g, '_');
+      link.download = `${cleanUserName}_${cleanTitle}_${leadId}.mp4`;
+      
+      document.body.appendChild(link);
+      link.click();
+      document.body.removeChild(link);
+      
+      URL.revokeObjectURL(blobUrl);
+      
+      toast({
+        title: 'Скачивание начато',
+        description: `Видео "${leadTitle}" от ${userName} загружается`,
+      });
     } catch (error) {
       toast({
         title: 'Ошибка скачивания',
@@ -193,8 +324,7 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
     setDeletingLeadId(leadId);
     
     try {
-      const leadsApiUrl = 'https://functions.poehali.dev/a119ce14-9a5b-40de-b18f-3ef1f6dc7484';
-      const response = await fetch(`${leadsApiUrl}?lead_id=${leadId}`, {
+      const response = await fetch(`${LEADS_API_URL}?lead_id=${leadId}`, {
         method: 'DELETE',
         headers: {
           'X-Auth-Token': token
@@ -230,10 +360,43 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
     }
   };
 
+  const deleteAllUserLeads = async (user: User) => {
+    if (!confirm(`Удалить все лиды пользователя ${user.name} (${user.lead_count})?`)) {
+      return;
+    }
+
+    try {
+      // One bulk request: the server deletes in short batches and reports per-lead results
+      const response = await fetch(LEADS_API_URL, {
+        method: 'DELETE',
+        headers: {
+          'X-Auth-Token': token,
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ user_id: user.id })
+      });
+      const data = await response.json();
+
+      if (!response.ok || !data.success) {
+        throw new Error(data.error || 'Network error');
+      }
+
+      toast({
+        title: '✅ Лиды удалены',
+        description: `Удалено лидов: ${data.deleted_count}${data.has_more ? ' (остались ещё, повторите удаление)' : ''}`,
+      });
+      await loadAdminData();
+    } catch (error) {
+      toast({
+        title: 'Ошибка удаления',
+        description: `Не удалось удалить лиды: ${error instanceof Error ? error.message : 'Неизвестная ошибка'}`,
+        variant: 'destructive'
+      });
+    }
+  };
+
   const downloadAllUserVideos = async (user: User) => {
-    const videosToDownload = user.leads.filter(lead => lead.has_video);
-    
-    if (videosToDownload.length === 0) {
+    if (user.video_count === 0) {
       toast({
         title: 'Нет видео',
         description: `У пользователя ${user.name} нет видеозаписей`,
@@ -244,16 +407,35 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
 
     toast({
       title: 'Скачивание начато',
-      description: `Загружаю ${videosToDownload.length} видео от ${user.name}`,
+      description: `Собираю архив из ${user.video_count} видео от ${user.name}`,
     });
 
-    for (let i = 0; i < videosToDownload.length; i++) {
-      const lead = videosToDownload[i];
-      await downloadVideo(lead.id, lead.title, user.name);
-      
-      if (i < videosToDownload.length - 1) {
-        await new Promise(resolve => setTimeout(resolve, 1000));
-      }
+    // One server-built ZIP (videos plus a manifest of titles and comments) instead of a download per video
+    try {
+      // Only a page of leads is loaded in the panel, so collect every lead id first
+      const leadIds: string[] = [];
+      let cursor: string | null = null;
+      do {
+        const page = await fetchUserLeads(user.id, cursor, ADMIN_MAX_PAGE_SIZE);
+        leadIds.push(...page.leads.map(lead => lead.id));
+        cursor = page.nextCursor;
+      } while (cursor);
+
+      const result = await downloadExportArchive({
+        token,
+        leadsUrl: LEADS_API_URL,
+        leadIds
+      });
+      toast({
+        title: 'Архив скачан',
+        description: `${result.videoCount} видео и ${result.leadCount} лидов в ${result.fileName}`,
+      });
+    } catch (error) {
+      toast({
+        title: 'Ошибка скачивания',
+        description: `Не удалось скачать архив: ${error instanceof Error ? error.message : 'Неизвестная ошибка'}`,
+        variant: 'destructive'
+      });
     }
   };
 
@@ -282,12 +464,13 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
           });
           
           // Clear selected user if it was deleted
-          if (selectedUser && selectedUser.id === userId) {
+          const deletedSelected = selectedUser?.id === userId;
+          if (deletedSelected) {
             setSelectedUser(null);
           }
           
           // Reload admin data to refresh the UI
-          await loadAdminData();
+          await loadAdminData(activeSearch, !deletedSelected);
         } else {
           throw new Error(data.error || 'Failed to delete user');
         }
@@ -382,17 +565,32 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
     <div className="container mx-auto px-3 sm:px-4 py-4 sm:py-6 max-w-7xl">
       <AdminStatsCards stats={stats} />
       
+      <form onSubmit={handleSearch} className="flex gap-2 mb-4 sm:mb-6">
+        <Input
+          value={search}
+          onChange={(e) => setSearch(e.target.value)}
+          placeholder="Поиск по заголовкам и комментариям всех лидов"
+        />
+        <Button type="submit" variant="outline">
+          <Icon name="Search" size={16} className="mr-2" />
+          Найти
+        </Button>
+      </form>
+      
       <div className="grid grid-cols-1 lg:grid-cols-2 gap-4 sm:gap-6">
         <UsersList
           users={users}
           selectedUser={selectedUser}
-          onSelectUser={setSelectedUser}
+          onSelectUser={(user) => selectUser(user)}
           onDownloadAllUserVideos={downloadAllUserVideos}
           onDeleteUser={deleteUser}
           onEditUser={editUser}
           deletingUserId={deletingUserId}
           editingUserId={editingUserId}
           formatDate={formatDate}
+          hasMore={Boolean(usersCursor)}
+          loadingMore={loadingMoreUsers}
+          onLoadMore={loadMoreUsers}
         />
         
         <UserDetails
@@ -404,6 +602,9 @@ const AdminPanel: React.FC<AdminPanelProps> = ({ token, adminApiUrl, videoApiUrl
           onDownloadVideo={downloadVideo}
           onDeleteLead={deleteLead}
           onDownloadAllUserVideos={downloadAllUserVideos}
+          onDeleteAllUserLeads={deleteAllUserLeads}
+          onLoadMoreLeads={loadMoreUserLeads}
+          loadingMoreLeads={loadingMoreLeads}
           onCloseVideo={closeVideo}
           formatDate={formatDate}
         />
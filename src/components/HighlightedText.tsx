@@ -0,0 +1,25 @@
+import React from 'react';
+
+interface HighlightedTextProps {
+  // Search snippet from the API: plain text with matches wrapped in <mark>…</mark>
+  snippet: string;
+  className?: string;
+}
+
+// Renders the marks as elements and everything else as text, so snippets never go through innerHTML
+const HighlightedText: React.FC<HighlightedTextProps> = ({ snippet, className }) => {
+  const parts = snippet.split(/<mark>|<\/mark>/);
+  return (
+    <span className={className}>
+      {parts.map((part, index) =>
+        index % 2 === 1 ? (
+          <mark key={index} className="bg-yellow-200 rounded px-0.5">{part}</mark>
+        ) : (
+          <React.Fragment key={index}>{part}</React.Fragment>
+        )
+      )}
+    </span>
+  );
+};
+
+export default HighlightedText;
@@ -2,6 +2,20 @@ import React from 'react';
 import { useToast } from '@/hooks/use-toast';
 import { ChunkedUploader } from '@/utils/chunkedUpload';
 import { LeadFormData } from '@/types/lead';
+import { v4 as uuidv4 } from 'uuid';
+
+// One Idempotency-Key per recorded video: saving the same recording again after a timeout
+// gets the original lead back instead of storing a duplicate
+const leadUploadKeys = new WeakMap<Blob, string>();
+
+const idempotencyKeyFor = (videoBlob: Blob): string => {
+  let key = leadUploadKeys.get(videoBlob);
+  if (!key) {
+    key = uuidv4();
+    leadUploadKeys.set(videoBlob, key);
+  }
+  return key;
+};
 
 interface LeadUploadHandlerProps {
   token: string;
@@ -29,7 +43,6 @@ export const useLeadUploadHandler = ({
       comments: comments,
       token: token,
       uploadUrl: apiUrls.chunkedUpload,
-      chunkSize: 5 * 1024 * 1024, // 5MB chunks
       onProgress: (progress) => {
         onProgress(progress);
         console.log(`Upload progress: ${progress.toFixed(1)}%`);
@@ -65,123 +78,69 @@ export const useLeadUploadHandler = ({
 
   const handleStandardUpload = async (videoBlob: Blob, leadData: LeadFormData): Promise<void> => {
     try {
-      // Convert video blob to base64
-      const reader = new FileReader();
-      reader.onloadend = async () => {
-        const result = reader.result as string;
-        console.log('FileReader result length:', result.length);
-        console.log('FileReader result prefix:', result.substring(0, 100));
-        
-        // Найдем позицию base64 данных после "base64,"
-        const base64Index = result.indexOf('base64,');
-        if (base64Index === -1) {
-          console.error('Base64 marker not found in result');
-          throw new Error('Base64 marker not found in result');
-        }
-        
-        const base64Video = result.substring(base64Index + 7); // Skip "base64," (7 chars)
-        console.log('Video blob type:', videoBlob.type);
-        console.log('Video blob size:', videoBlob.size);
-        console.log('Base64 length after split:', base64Video.length);
-        
-        if (!base64Video || base64Video.length === 0) {
-          console.error('Base64 conversion failed - empty result');
-          toast({ 
-            title: 'Ошибка кодирования видео', 
-            description: 'Не удалось преобразовать видео в base64', 
-            variant: 'destructive' 
-          });
-          throw new Error('Base64 conversion failed');
-        }
-        
-        const comments = `Родитель: ${leadData.parentName}, Ребенок: ${leadData.childName}, Возраст: ${leadData.age}, Телефон: ${leadData.phone}`;
-        
-        console.log('Starting POST request to:', apiUrls.leads);
-        console.log('Token length:', token.length);
-        console.log('Comments:', comments);
-        console.log('Base64 video length:', base64Video.length);
-        
-        // Check file size limits
-        const videoSizeMB = videoBlob.size / (1024 * 1024);
-        const base64SizeMB = (base64Video.length * 3) / (4 * 1024 * 1024); // base64 is ~33% larger
-        console.log('Video blob size:', videoBlob.size, 'bytes (', videoSizeMB.toFixed(2), 'MB)');
-        console.log('Base64 size estimate:', base64SizeMB.toFixed(2), 'MB');
-        
-        // Warn if approaching limits
-        if (videoSizeMB > 8) {
-          console.warn('Video size approaching Cloud Function limits!');
-          toast({ 
-            title: '⚠️ Большой размер видео', 
-            description: `Размер: ${videoSizeMB.toFixed(1)}MB. Это может вызвать проблемы с загрузкой.`, 
-            variant: 'destructive' 
-          });
-        }
-        
-        const requestBody = {
-          title: `Лид от ${new Date().toLocaleDateString('ru-RU')}`,
-          comments: comments,
-          video_data: base64Video,
-          video_filename: 'recording.mp4',
-          video_content_type: 'video/mp4'
-        };
-        
-        console.log('Request body keys:', Object.keys(requestBody));
-        
-        // Create fetch with timeout
-        const controller = new AbortController();
-        const timeoutId = setTimeout(() => controller.abort(), 30000); // 30 second timeout
-        
-        const response = await fetch(apiUrls.leads, {
-          method: 'POST',
-          headers: {
-            'X-Auth-Token': token,
-            'Content-Type': 'application/json'
-          },
-          body: JSON.stringify(requestBody),
-          signal: controller.signal
+      const comments = `Родитель: ${leadData.parentName}, Ребенок: ${leadData.childName}, Возраст: ${leadData.age}, Телефон: ${leadData.phone}`;
+      const videoSizeMB = videoBlob.size / (1024 * 1024);
+      console.log('Video blob type:', videoBlob.type);
+      console.log('Video blob size:', videoBlob.size, 'bytes (', videoSizeMB.toFixed(2), 'MB)');
+      
+      // Warn if approaching limits
+      if (videoSizeMB > 8) {
+        console.warn('Video size approaching Cloud Function limits!');
+        toast({ 
+          title: '⚠️ Большой размер видео', 
+          description: `Размер: ${videoSizeMB.toFixed(1)}MB. Это может вызвать проблемы с загрузкой.`, 
+          variant: 'destructive' 
         });
-        
-        clearTimeout(timeoutId);
+      }
+      
+      console.log('Starting POST request to:', apiUrls.leads);
+      
+      // Create fetch with timeout
+      const controller = new AbortController();
+      const timeoutId = setTimeout(() => controller.abort(), 30000); // 30 second timeout
+      
+      // Raw video body: no base64 or JSON copy on either side; metadata goes in percent-encoded headers
+      const response = await fetch(apiUrls.leads, {
+        method: 'POST',
+        headers: {
+          'X-Auth-Token': token,
+          'Content-Type': videoBlob.type ? videoBlob.type.split(';')[0] : 'video/mp4',
+          'X-Lead-Title': encodeURIComponent(`Лид от ${new Date().toLocaleDateString('ru-RU')}`),
+          'X-Lead-Comments': encodeURIComponent(comments),
+          'X-Video-Filename': 'recording.mp4',
+          'Idempotency-Key': idempotencyKeyFor(videoBlob)
+        },
+        body: videoBlob,
+        signal: controller.signal
+      });
+      
+      clearTimeout(timeoutId);
 
-        console.log('Response status:', response.status);
-        console.log('Response headers:', Object.fromEntries(response.headers.entries()));
-        
-        const responseText = await response.text();
-        console.log('Raw response text:', responseText);
-        
-        let data;
-        try {
-          data = JSON.parse(responseText);
-        } catch (parseError) {
-          console.error('JSON parse error:', parseError);
-          console.error('Response text that failed to parse:', responseText);
-          throw new Error(`Invalid JSON response: ${responseText.substring(0, 200)}`);
-        }
-        
-        if (response.ok && data.success) {
-          // Reload leads
-          await onLoadLeads(token);
-        } else {
-          toast({ 
-            title: 'Ошибка сохранения', 
-            description: data.error || 'Не удалось сохранить лид', 
-            variant: 'destructive' 
-          });
-          throw new Error(data.error || 'Не удалось сохранить лид');
-        }
-      };
+      console.log('Response status:', response.status);
+      
+      const responseText = await response.text();
+      console.log('Raw response text:', responseText);
+      
+      let data;
+      try {
+        data = JSON.parse(responseText);
+      } catch (parseError) {
+        console.error('JSON parse error:', parseError);
+        console.error('Response text that failed to parse:', responseText);
+        throw new Error(`Invalid JSON response: ${responseText.substring(0, 200)}`);
+      }
       
-      reader.onerror = (error) => {
-        console.error('FileReader error:', error);
+      if (response.ok && data.success) {
+        // Reload leads
+        await onLoadLeads(token);
+      } else {
         toast({ 
-          title: 'Ошибка чтения файла', 
-          description: 'Не удалось прочитать видео файл', 
+          title: 'Ошибка сохранения', 
+          description: data.error || 'Не удалось сохранить лид', 
           variant: 'destructive' 
         });
-        throw new Error('FileReader error');
-      };
-      
-      reader.readAsDataURL(videoBlob);
+        throw new Error(data.error || 'Не удалось сохранить лид');
+      }
     } catch (error: any) {
       console.error('Full error object:', error);
       console.error('Error message:', error.message);
@@ -1,21 +1,62 @@
 import React, { useState } from 'react';
 import { Button } from '@/components/ui/button';
 import { Card, CardHeader, CardTitle, CardContent } from '@/components/ui/card';
+import { Input } from '@/components/ui/input';
 import Icon from '@/components/ui/icon';
+import HighlightedText from '@/components/HighlightedText';
 import { VideoLead } from '@/types/lead';
 
 interface LeadsArchiveProps {
   videoLeads: VideoLead[];
   onCreateLead: () => void;
   onLoadVideo: (leadId: string) => Promise<string | null>;
+  onExportArchive: (leadIds: string[]) => Promise<void>;
+  hasMore: boolean;
+  onLoadMore: () => Promise<void>;
+  onSearch: (search: string) => Promise<void>;
 }
 
 const LeadsArchive: React.FC<LeadsArchiveProps> = ({ 
   videoLeads, 
   onCreateLead,
-  onLoadVideo 
+  onLoadVideo,
+  onExportArchive,
+  hasMore,
+  onLoadMore,
+  onSearch
 }) => {
-  if (videoLeads.length === 0) {
+  const [exporting, setExporting] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [search, setSearch] = useState('');
+  const [activeSearch, setActiveSearch] = useState('');
+
+  // Search runs on the server, so results cover every lead, not only the loaded pages
+  const handleSearch = async (event: React.FormEvent) => {
+    event.preventDefault();
+    setActiveSearch(search.trim());
+    await onSearch(search.trim());
+  };
+
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    try {
+      await onLoadMore();
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const handleExport = async () => {
+    setExporting(true);
+    try {
+      await onExportArchive(videoLeads.map(lead => lead.id));
+    } finally {
+      setExporting(false);
+    }
+  };
+
+
+  if (videoLeads.length === 0 && !activeSearch) {
     return (
       <Card className="text-center py-8 sm:py-12 animate-fade-in">
         <CardContent className="px-4">
@@ -35,9 +76,49 @@ const LeadsArchive: React.FC<LeadsArchiveProps> = ({
 
   return (
     <div className="grid gap-4 sm:gap-6">
+      <div className="flex flex-col sm:flex-row gap-2 sm:justify-between">
+        <form onSubmit={handleSearch} className="flex gap-2 flex-1">
+          <Input
+            value={search}
+            onChange={(e) => setSearch(e.target.value)}
+            placeholder="Поиск по заголовкам и комментариям"
+            className="h-12 sm:h-10"
+          />
+          <Button type="submit" variant="outline" className="h-12 sm:h-10 px-4 touch-manipulation">
+            <Icon name="Search" size={16} />
+          </Button>
+        </form>
+        <Button
+          onClick={handleExport}
+          variant="outline"
+          disabled={exporting}
+          className="h-12 sm:h-10 px-4 text-base sm:text-sm font-medium touch-manipulation"
+        >
+          {exporting ? (
+            <Icon name="Loader2" size={16} className="mr-2 animate-spin" />
+          ) : (
+            <Icon name="Download" size={16} className="mr-2" />
+          )}
+          Скачать архив (ZIP)
+        </Button>
+      </div>
+      {activeSearch && videoLeads.length === 0 && (
+        <p className="text-center text-muted-foreground text-sm">Ничего не найдено по запросу «{activeSearch}»</p>
+      )}
       {videoLeads.map((lead) => (
         <VideoLeadCard key={lead.id} lead={lead} onLoadVideo={onLoadVideo} />
       ))}
+      {hasMore && (
+        <Button
+          onClick={handleLoadMore}
+          variant="outline"
+          disabled={loadingMore}
+          className="h-12 sm:h-10 px-6 text-base sm:text-sm font-medium touch-manipulation"
+        >
+          {loadingMore && <Icon name="Loader2" size={16} className="mr-2 animate-spin" />}
+          Показать ещё
+        </Button>
+      )}
     </div>
   );
 };
@@ -65,7 +146,9 @@ const VideoLeadCard: React.FC<{
     <Card className="animate-fade-in">
       <CardHeader className="pb-3 sm:pb-6">
         <div className="flex justify-between items-start gap-3">
-          <CardTitle className="text-base sm:text-lg leading-tight">{lead.title}</CardTitle>
+          <CardTitle className="text-base sm:text-lg leading-tight">
+            {lead.title_snippet ? <HighlightedText snippet={lead.title_snippet} /> : lead.title}
+          </CardTitle>
           <span className="text-xs sm:text-sm text-muted-foreground whitespace-nowrap">
             {lead.created_at}
           </span>
@@ -77,16 +160,25 @@ const VideoLeadCard: React.FC<{
             {videoDataUrl ? (
               <video
                 src={videoDataUrl}
+                poster={lead.poster_url}
                 controls
                 className="w-full h-full object-cover"
               />
             ) : (
               <div className="absolute inset-0 flex items-center justify-center p-4">
+                {lead.thumbnail_url && (
+                  <img
+                    src={lead.thumbnail_url}
+                    alt=""
+                    loading="lazy"
+                    className="absolute inset-0 w-full h-full object-cover"
+                  />
+                )}
                 <Button 
                   onClick={handleLoadVideo} 
                   variant="outline"
                   disabled={videoLoading}
-                  className="h-12 sm:h-10 px-4 text-base sm:text-sm font-medium touch-manipulation"
+                  className="relative h-12 sm:h-10 px-4 text-base sm:text-sm font-medium touch-manipulation"
                 >
                   {videoLoading ? (
                     <Icon name="Loader2" size={16} className="mr-2 animate-spin" />
@@ -102,6 +194,9 @@ const VideoLeadCard: React.FC<{
             <h4 className="font-medium text-sm sm:text-base">Информация о лиде:</h4>
             <div className="text-sm text-gray-600 bg-gray-50 p-3 sm:p-4 rounded-md leading-relaxed max-h-40 sm:max-h-48 overflow-y-auto">
               <LeadInfo comments={lead.comments} />
+              {lead.comments_snippet && lead.comments_snippet.includes('<mark>') && (
+                <HighlightedText snippet={lead.comments_snippet} className="block mt-2 text-xs" />
+              )}
             </div>
           </div>
         </div>
@@ -11,6 +11,10 @@ interface VideoLead {
   video_url?: string;
   created_at: string;
   video_filename?: string;
+  thumbnail_url?: string;
+  poster_url?: string;
+  title_snippet?: string;
+  comments_snippet?: string;
 }
 
 interface TabsNavigationProps {
@@ -23,6 +27,10 @@ interface TabsNavigationProps {
   onSaveLead: (videoBlob: Blob, comments: string) => Promise<void>;
   onCreateLead: () => void;
   onLoadVideo: (leadId: string) => Promise<string | null>;
+  onExportArchive: (leadIds: string[]) => Promise<void>;
+  hasMoreLeads: boolean;
+  onLoadMoreLeads: () => Promise<void>;
+  onSearchLeads: (search: string) => Promise<void>;
   onArchiveTabClick: () => void;
 }
 
@@ -36,6 +44,10 @@ const TabsNavigation: React.FC<TabsNavigationProps> = ({
   onSaveLead,
   onCreateLead,
   onLoadVideo,
+  onExportArchive,
+  hasMoreLeads,
+  onLoadMoreLeads,
+  onSearchLeads,
   onArchiveTabClick
 }) => {
   return (
@@ -55,7 +67,7 @@ const TabsNavigation: React.FC<TabsNavigationProps> = ({
           }}
         >
           <Icon name="Archive" size={14} className="sm:w-4 sm:h-4" />
-          <span className="hidden xs:inline">Архив ({videoLeads.length})</span>
+          <span className="hidden xs:inline">Архив ({videoLeads.length}{hasMoreLeads ? '+' : ''})</span>
           <span className="xs:hidden">Архив</span>
         </TabsTrigger>
       </TabsList>
@@ -76,6 +88,10 @@ const TabsNavigation: React.FC<TabsNavigationProps> = ({
             videoLeads={videoLeads}
             onCreateLead={onCreateLead}
             onLoadVideo={onLoadVideo}
+            onExportArchive={onExportArchive}
+            hasMore={hasMoreLeads}
+            onLoadMore={onLoadMoreLeads}
+            onSearch={onSearchLeads}
           />
         ) : (
           <div className="text-center py-12">
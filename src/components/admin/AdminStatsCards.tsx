@@ -6,6 +6,7 @@ interface AdminStats {
   total_users: number;
   total_leads: number;
   total_videos: number;
+  estimated?: boolean;
 }
 
 interface AdminStatsCardsProps {
@@ -13,6 +14,9 @@ interface AdminStatsCardsProps {
 }
 
 const AdminStatsCards: React.FC<AdminStatsCardsProps> = ({ stats }) => {
+  // Large tables are reported from planner statistics, so the figures are approximate
+  const approx = stats.estimated ? '≈ ' : '';
+
   return (
     <div className="grid grid-cols-1 md:grid-cols-3 gap-4 mb-8">
       <Card>
@@ -20,7 +24,7 @@ const AdminStatsCards: React.FC<AdminStatsCardsProps> = ({ stats }) => {
           <div className="flex items-center">
             <Icon name="Users" size={24} className="text-blue-500 mr-3" />
             <div>
-              <p className="text-2xl font-bold">{stats.total_users}</p>
+              <p className="text-2xl font-bold">{approx}{stats.total_users}</p>
               <p className="text-sm text-muted-foreground">Пользователей</p>
             </div>
           </div>
@@ -32,7 +36,7 @@ const AdminStatsCards: React.FC<AdminStatsCardsProps> = ({ stats }) => {
           <div className="flex items-center">
             <Icon name="FileText" size={24} className="text-green-500 mr-3" />
             <div>
-              <p className="text-2xl font-bold">{stats.total_leads}</p>
+              <p className="text-2xl font-bold">{approx}{stats.total_leads}</p>
               <p className="text-sm text-muted-foreground">Лидов</p>
             </div>
           </div>
@@ -44,7 +48,7 @@ const AdminStatsCards: React.FC<AdminStatsCardsProps> = ({ stats }) => {
           <div className="flex items-center">
             <Icon name="Video" size={24} className="text-red-500 mr-3" />
             <div>
-              <p className="text-2xl font-bold">{stats.total_videos}</p>
+              <p className="text-2xl font-bold">{approx}{stats.total_videos}</p>
               <p className="text-sm text-muted-foreground">Видеозаписей</p>
             </div>
           </div>
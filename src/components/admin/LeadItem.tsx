@@ -3,6 +3,7 @@ import { Badge } from '@/components/ui/badge';
 import { Button } from '@/components/ui/button';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger, DialogDescription } from '@/components/ui/dialog';
 import Icon from '@/components/ui/icon';
+import HighlightedText from '@/components/HighlightedText';
 
 interface Lead {
   id: string;
@@ -11,6 +12,17 @@ interface Lead {
   created_at: string;
   video_filename?: string;
   has_video: boolean;
+  video_content_type?: string;
+  video_size?: number;
+  video_duration_ms?: number;
+  video_width?: number;
+  video_height?: number;
+  video_codec?: string;
+  audio_codec?: string;
+  thumbnail_query?: string;
+  thumbnail_url?: string;
+  title_snippet?: string;
+  comments_snippet?: string;
 }
 
 interface LeadItemProps {
@@ -43,7 +55,17 @@ const LeadItem: React.FC<LeadItemProps> = ({
   return (
     <div className="p-3 sm:p-4 border rounded-lg">
       <div className="flex justify-between items-start mb-3 gap-2">
-        <p className="font-medium text-sm flex-1 min-w-0">{lead.title}</p>
+        {lead.thumbnail_url && (
+          <img
+            src={lead.thumbnail_url}
+            alt=""
+            loading="lazy"
+            className="w-16 h-9 rounded object-cover flex-shrink-0 bg-muted"
+          />
+        )}
+        <p className="font-medium text-sm flex-1 min-w-0">
+          {lead.title_snippet ? <HighlightedText snippet={lead.title_snippet} /> : lead.title}
+        </p>
         <Badge variant={lead.has_video ? 'default' : 'secondary'} className="flex-shrink-0">
           <Icon name={lead.has_video ? 'Video' : 'FileText'} size={12} className="mr-1" />
           {lead.has_video ? 'Видео' : 'Текст'}
@@ -51,7 +73,13 @@ const LeadItem: React.FC<LeadItemProps> = ({
       </div>
       <div className="text-sm text-muted-foreground mb-3">
         <LeadInfo comments={lead.comments} />
+        {lead.comments_snippet && lead.comments_snippet.includes('<mark>') && (
+          <HighlightedText snippet={lead.comments_snippet} className="block mt-1 text-xs" />
+        )}
       </div>
+      {lead.has_video && formatVideoDetails(lead) && (
+        <p className="text-xs text-muted-foreground mb-3">{formatVideoDetails(lead)}</p>
+      )}
       
       {/* Mobile: Stack date and buttons vertically */}
       <div className="flex flex-col sm:flex-row sm:justify-between sm:items-center gap-3">
@@ -136,6 +164,26 @@ const LeadItem: React.FC<LeadItemProps> = ({
   );
 };
 
+// Container metadata probed at upload, e.g. "1:23 · 1280×720 · avc1 / mp4a · 12.4 МБ"
+const formatVideoDetails = (lead: Lead): string => {
+  const parts: string[] = [];
+  if (lead.video_duration_ms) {
+    const totalSeconds = Math.round(lead.video_duration_ms / 1000);
+    parts.push(`${Math.floor(totalSeconds / 60)}:${String(totalSeconds % 60).padStart(2, '0')}`);
+  }
+  if (lead.video_width && lead.video_height) {
+    parts.push(`${lead.video_width}×${lead.video_height}`);
+  }
+  const codecs = [lead.video_codec, lead.audio_codec].filter(Boolean).join(' / ');
+  if (codecs) {
+    parts.push(codecs);
+  }
+  if (lead.video_size) {
+    parts.push(`${(lead.video_size / (1024 * 1024)).toFixed(1)} МБ`);
+  }
+  return parts.join(' · ');
+};
+
 // Component to display lead information in a structured way
 const LeadInfo: React.FC<{ comments: string }> = ({ comments }) => {
   // Try to parse structured data from comments
@@ -11,6 +11,17 @@ interface Lead {
   created_at: string;
   video_filename?: string;
   has_video: boolean;
+  video_content_type?: string;
+  video_size?: number;
+  video_duration_ms?: number;
+  video_width?: number;
+  video_height?: number;
+  video_codec?: string;
+  audio_codec?: string;
+  thumbnail_query?: string;
+  thumbnail_url?: string;
+  title_snippet?: string;
+  comments_snippet?: string;
 }
 
 interface User {
@@ -18,7 +29,11 @@ interface User {
   name: string;
   email: string;
   created_at: string;
+  lead_count: number;
+  video_count: number;
+  // Leads loaded so far, and where the next page starts (null when all are loaded)
   leads: Lead[];
+  leads_cursor?: string | null;
 }
 
 interface UserDetailsProps {
@@ -30,6 +45,9 @@ interface UserDetailsProps {
   onDownloadVideo: (leadId: string, leadTitle: string, userName: string) => void;
   onDeleteLead: (leadId: string, leadTitle: string) => void;
   onDownloadAllUserVideos: (user: User) => void;
+  onDeleteAllUserLeads: (user: User) => void;
+  onLoadMoreLeads: () => void;
+  loadingMoreLeads: boolean;
   onCloseVideo: () => void;
   formatDate: (dateString: string) => string;
 }
@@ -43,6 +61,9 @@ const UserDetails: React.FC<UserDetailsProps> = ({
   onDownloadVideo,
   onDeleteLead,
   onDownloadAllUserVideos,
+  onDeleteAllUserLeads,
+  onLoadMoreLeads,
+  loadingMoreLeads,
   onCloseVideo,
   formatDate
 }) => {
@@ -62,7 +83,7 @@ const UserDetails: React.FC<UserDetailsProps> = ({
               <div className="text-sm space-y-1">
                 <p><strong>Email:</strong> {selectedUser.email}</p>
                 <p><strong>Регистрация:</strong> {formatDate(selectedUser.created_at)}</p>
-                <p><strong>Лидов:</strong> {selectedUser.leads.length}</p>
+                <p><strong>Лидов:</strong> {selectedUser.lead_count}</p>
               </div>
             </div>
 
@@ -76,10 +97,19 @@ const UserDetails: React.FC<UserDetailsProps> = ({
                         size="sm"
                         variant="outline"
                         onClick={() => onDownloadAllUserVideos(selectedUser)}
-                        disabled={selectedUser.leads.filter(l => l.has_video).length === 0}
+                        disabled={selectedUser.video_count === 0}
                       >
                         <Icon name="Download" size={12} className="mr-1" />
-                        Скачать все видео ({selectedUser.leads.filter(l => l.has_video).length})
+                        Скачать все видео ({selectedUser.video_count})
+                      </Button>
+                      <Button
+                        size="sm"
+                        variant="outline"
+                        onClick={() => onDeleteAllUserLeads(selectedUser)}
+                        className="text-destructive"
+                      >
+                        <Icon name="Trash2" size={12} className="mr-1" />
+                        Удалить все лиды ({selectedUser.lead_count})
                       </Button>
                     </div>
                     
@@ -96,6 +126,19 @@ const UserDetails: React.FC<UserDetailsProps> = ({
                         formatDate={formatDate}
                       />
                     ))}
+                    
+                    {selectedUser.leads_cursor && (
+                      <Button
+                        size="sm"
+                        variant="outline"
+                        className="w-full"
+                        onClick={onLoadMoreLeads}
+                        disabled={loadingMoreLeads}
+                      >
+                        {loadingMoreLeads && <Icon name="Loader2" size={12} className="mr-1 animate-spin" />}
+                        Показать ещё
+                      </Button>
+                    )}
                   </>
                 ) : (
                   <p className="text-sm text-muted-foreground text-center py-4">
@@ -29,6 +29,8 @@ interface User {
   name: string;
   email: string;
   created_at: string;
+  lead_count: number;
+  video_count: number;
   leads: Lead[];
 }
 
@@ -42,6 +44,9 @@ interface UsersListProps {
   deletingUserId: string | null;
   editingUserId: string | null;
   formatDate: (dateString: string) => string;
+  hasMore: boolean;
+  loadingMore: boolean;
+  onLoadMore: () => void;
 }
 
 const UsersList: React.FC<UsersListProps> = ({
@@ -53,14 +58,17 @@ const UsersList: React.FC<UsersListProps> = ({
   onEditUser,
   deletingUserId,
   editingUserId,
-  formatDate
+  formatDate,
+  hasMore,
+  loadingMore,
+  onLoadMore
 }) => {
   return (
     <Card>
       <CardHeader>
         <CardTitle className="flex items-center gap-2">
           <Icon name="Users" size={20} />
-          Пользователи ({users.length})
+          Пользователи ({users.length}{hasMore ? '+' : ''})
         </CardTitle>
       </CardHeader>
       <CardContent className="max-h-96 overflow-y-auto">
@@ -83,10 +91,10 @@ const UsersList: React.FC<UsersListProps> = ({
                 </div>
                 <div className="flex flex-col gap-2 items-end">
                   <Badge variant="secondary">
-                    {user.leads.length} лидов
+                    {user.lead_count} лидов
                   </Badge>
                   <div className="flex gap-1">
-                    {user.leads.filter(l => l.has_video).length > 0 && (
+                    {user.video_count > 0 && (
                       <Button
                         size="sm"
                         variant="outline"
@@ -96,7 +104,7 @@ const UsersList: React.FC<UsersListProps> = ({
                         }}
                       >
                         <Icon name="Download" size={12} className="mr-1" />
-                        {user.leads.filter(l => l.has_video).length} видео
+                        {user.video_count} видео
                       </Button>
                     )}
                     
@@ -140,7 +148,7 @@ const UsersList: React.FC<UsersListProps> = ({
                             <span className="text-destructive">
                               ⚠️ Это действие удалит:
                               <br />• Учетную запись пользователя
-                              <br />• Все его лиды ({user.leads.length} шт.)
+                              <br />• Все его лиды ({user.lead_count} шт.)
                               <br />• Все связанные видеозаписи
                             </span>
                             <br /><br />
@@ -163,6 +171,19 @@ const UsersList: React.FC<UsersListProps> = ({
               </div>
             </div>
           ))}
+          
+          {hasMore && (
+            <Button
+              size="sm"
+              variant="outline"
+              className="w-full"
+              onClick={onLoadMore}
+              disabled={loadingMore}
+            >
+              {loadingMore && <Icon name="Loader2" size={12} className="mr-1 animate-spin" />}
+              Показать ещё
+            </Button>
+          )}
         </div>
       </CardContent>
     </Card>
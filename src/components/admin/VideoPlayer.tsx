@@ -2,6 +2,7 @@ import React, { useEffect, useState, useRef } from 'react';
 import { Button } from '@/components/ui/button';
 import Icon from '@/components/ui/icon';
 import { useToast } from '@/hooks/use-toast';
+import { fetchByRanges } from '@/utils/rangeDownload';
 
 interface VideoPlayerProps {
   videoUrl: string;
@@ -88,9 +89,8 @@ const VideoPlayer: React.FC<VideoPlayerProps> = ({ videoUrl, leadTitle, classNam
     try {
       setIsLoading(true);
       
-      // Convert data URL to blob for proper download
-      const response = await fetch(videoUrl);
-      const blob = await response.blob();
+      // Signed playback URLs are fetched range by range; data URLs come back whole
+      const blob = await fetchByRanges(videoUrl);
       
       // Create blob URL and download
       const blobUrl = URL.createObjectURL(blob);
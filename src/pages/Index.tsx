@@ -10,6 +10,7 @@ import UploadPage from '@/components/UploadPage';
 import TabsNavigation from '@/components/TabsNavigation';
 import ArchivePasswordDialog from '@/components/ArchivePasswordDialog';
 import { useLeadUploadHandler } from '@/components/LeadUploadHandler';
+import { downloadExportArchive } from '@/utils/exportArchive';
 
 // API URLs
 const API_URLS = {
@@ -36,6 +37,8 @@ const Index = () => {
   const [user, setUser] = useState<User | null>(null);
   const [token, setToken] = useState<string>('');
   const [videoLeads, setVideoLeads] = useState<VideoLead[]>([]);
+  const [leadsCursor, setLeadsCursor] = useState<string | null>(null);
+  const [leadsSearch, setLeadsSearch] = useState('');
   const [activeTab, setActiveTab] = useState('record');
   const [loading, setLoading] = useState(false);
   const [externalUploadProgress, setExternalUploadProgress] = useState<number | undefined>(undefined);
@@ -64,9 +67,14 @@ const Index = () => {
     }
   }, []);
 
-  const loadUserLeads = async (authToken: string) => {
+  // Without a cursor the first page replaces the list; with one, the next page is appended
+  const loadUserLeads = async (authToken: string, cursor?: string, search?: string) => {
     try {
-      const response = await fetch(API_URLS.leads, {
+      const params = new URLSearchParams();
+      if (cursor) params.set('cursor', cursor);
+      if (search) params.set('search', search);
+      const query = params.toString() ? `?${params.toString()}` : '';
+      const response = await fetch(`${API_URLS.leads}${query}`, {
         method: 'GET',
         headers: {
           'X-Auth-Token': authToken,
@@ -76,7 +84,17 @@ const Index = () => {
 
       if (response.ok) {
         const data = await response.json();
-        setVideoLeads(data.leads || []);
+        // Poster and thumbnail come as signed query strings for the video function
+        const pageLeads = (data.leads || []).map((lead: VideoLead & { thumbnail_query?: string; poster_query?: string }) => ({
+          ...lead,
+          thumbnail_url: lead.thumbnail_query ? `${API_URLS.video}?${lead.thumbnail_query}` : undefined,
+          poster_url: lead.poster_query ? `${API_URLS.video}?${lead.poster_query}` : undefined
+        }));
+        setVideoLeads(previous => cursor ? [...previous, ...pageLeads] : pageLeads);
+        if (!cursor) {
+          setLeadsSearch(search || '');
+        }
+        setLeadsCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error('Failed to load leads:', error);
@@ -134,7 +152,8 @@ const Index = () => {
 
   const loadVideoForLead = async (leadId: string): Promise<string | null> => {
     try {
-      const response = await fetch(`${API_URLS.video}?id=${leadId}`, {
+      // Signed, short-lived URL: the player streams byte ranges instead of a base64 data URL
+      const response = await fetch(`${API_URLS.video}?id=${leadId}&action=playback_url`, {
         method: 'GET',
         headers: {
           'X-Auth-Token': token
@@ -143,7 +162,11 @@ const Index = () => {
 
       if (response.ok) {
         const data = await response.json();
-        return data.video_url || null;
+        // Segmented HLS where the browser plays it natively, otherwise byte ranges of the original file
+        const query = data.hls_query && document.createElement('video').canPlayType('application/vnd.apple.mpegurl')
+          ? data.hls_query
+          : data.playback_query;
+        return query ? `${API_URLS.video}?${query}` : null;
       }
     } catch (error) {
       console.error('Failed to load video:', error);
@@ -151,10 +174,31 @@ const Index = () => {
     return null;
   };
 
+  const handleLoadMoreLeads = async () => {
+    if (leadsCursor) {
+      await loadUserLeads(token, leadsCursor, leadsSearch);
+    }
+  };
+
+  const handleSearchLeads = async (search: string) => {
+    await loadUserLeads(token, undefined, search);
+  };
+
+  const handleExportArchive = async (leadIds: string[]) => {
+    try {
+      const result = await downloadExportArchive({ token, leadsUrl: API_URLS.leads, leadIds });
+      toast({ title: 'Архив скачан', description: `${result.leadCount} лидов в ${result.fileName}` });
+    } catch (error: any) {
+      toast({ title: 'Ошибка', description: error.message || 'Не удалось скачать архив', variant: 'destructive' });
+    }
+  };
+
   const handleLogout = () => {
     setUser(null);
     setToken('');
     setVideoLeads([]);
+    setLeadsCursor(null);
+    setLeadsSearch('');
     setActiveTab('record');
     
     localStorage.removeItem('auth_token');
@@ -252,6 +296,10 @@ const Index = () => {
           onSaveLead={handleSaveLead}
           onCreateLead={handleCreateLead}
           onLoadVideo={loadVideoForLead}
+          onExportArchive={handleExportArchive}
+          hasMoreLeads={leadsCursor !== null}
+          onLoadMoreLeads={handleLoadMoreLeads}
+          onSearchLeads={handleSearchLeads}
           onArchiveTabClick={handleArchiveTabClick}
         />
       </div>
@@ -12,4 +12,9 @@ export interface VideoLead {
   video_url?: string;
   created_at: string;
   video_filename?: string;
+  thumbnail_url?: string;
+  poster_url?: string;
+  // Present in search results: text with matches wrapped in <mark>…</mark>
+  title_snippet?: string;
+  comments_snippet?: string;
 }
\ No newline at end of file
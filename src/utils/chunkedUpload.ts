@@ -5,6 +5,7 @@ export interface ChunkedUploadOptions {
   title: string;
   comments: string;
   chunkSize?: number;
+  concurrency?: number;
   token: string;
   uploadUrl: string;
   onProgress?: (progress: number) => void;
@@ -29,12 +30,13 @@ export class ChunkedUploader {
   private uploadedChunks: Set<number> = new Set();
   private totalChunks: number = 0;
   private isUploading: boolean = false;
+  private isCompleted: boolean = false;
   private abortController: AbortController | null = null;
 
   constructor(options: ChunkedUploadOptions) {
     this.uploadId = uuidv4();
     this.options = {
-      chunkSize: 5 * 1024 * 1024, // 5MB default chunk size
+      concurrency: 4, // chunks in flight at once
       ...options
     };
   }
@@ -51,26 +53,31 @@ export class ChunkedUploader {
     this.abortController = new AbortController();
 
     try {
-      // Step 1: Split file into chunks
-      this.splitFileIntoChunks();
+      // Step 1: Initialize upload session; the server picks the chunk size
+      const chunkSize = await this.initializeUploadSession();
+
+      // Step 2: Split file into chunks
+      this.splitFileIntoChunks(chunkSize);
       
       console.log(`Starting chunked upload: ${this.totalChunks} chunks, ${this.options.file.size} bytes total`);
 
-      // Step 2: Initialize upload session
-      await this.initializeUploadSession();
-
-      // Step 3: Upload chunks sequentially with retry
-      for (let i = 0; i < this.totalChunks; i++) {
-        if (this.abortController?.signal.aborted) {
-          throw new Error('Upload cancelled');
+      // Step 3: Upload chunks in parallel with retry; the server finalizes exactly once
+      let nextChunk = 0;
+      const worker = async () => {
+        while (nextChunk < this.totalChunks) {
+          if (this.abortController?.signal.aborted) {
+            throw new Error('Upload cancelled');
+          }
+
+          const chunkIndex = nextChunk++;
+          await this.uploadChunk(chunkIndex);
+          this.options.onChunkUploaded?.(this.uploadedChunks.size, this.totalChunks);
+          this.options.onProgress?.(this.progress);
         }
+      };
 
-        await this.uploadChunk(i);
-        this.options.onChunkUploaded?.(i + 1, this.totalChunks);
-        
-        const progress = ((i + 1) / this.totalChunks) * 100;
-        this.options.onProgress?.(progress);
-      }
+      const workers = Math.min(this.options.concurrency!, this.totalChunks);
+      await Promise.all(Array.from({ length: workers }, worker));
 
       console.log('All chunks uploaded successfully');
       return { success: true, upload_complete: true };
@@ -98,13 +105,13 @@ export class ChunkedUploader {
   /**
    * Split the file into chunks
    */
-  private splitFileIntoChunks(): void {
-    const { file, chunkSize } = this.options;
+  private splitFileIntoChunks(chunkSize: number): void {
+    const { file } = this.options;
     this.chunks = [];
     
     let offset = 0;
     while (offset < file.size) {
-      const end = Math.min(offset + chunkSize!, file.size);
+      const end = Math.min(offset + chunkSize, file.size);
       const chunk = file.slice(offset, end);
       this.chunks.push(chunk);
       offset = end;
@@ -115,20 +122,21 @@ export class ChunkedUploader {
   }
 
   /**
-   * Initialize upload session on the server
+   * Initialize upload session on the server and return the negotiated chunk size
    */
-  private async initializeUploadSession(): Promise<void> {
+  private async initializeUploadSession(): Promise<number> {
     const response = await fetch(this.options.uploadUrl, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
-        'X-Auth-Token': this.options.token
+        'X-Auth-Token': this.options.token,
+        'Idempotency-Key': `${this.uploadId}:start`
       },
       body: JSON.stringify({
         action: 'start_upload',
         upload_id: this.uploadId,
         total_size: this.options.file.size,
-        total_chunks: this.totalChunks,
+        chunk_size: this.options.chunkSize, // preference only; omitted lets the server recommend
         filename: 'video.mp4',
         title: this.options.title,
         comments: this.options.comments
@@ -147,6 +155,7 @@ export class ChunkedUploader {
     }
 
     console.log('Upload session initialized:', result);
+    return result.chunk_size;
   }
 
   /**
@@ -157,23 +166,25 @@ export class ChunkedUploader {
     
     for (let attempt = 0; attempt < retries; attempt++) {
       try {
-        // Convert chunk to base64
-        const base64Chunk = await this.blobToBase64(chunk);
         const chunkHash = await this.calculateMD5(chunk);
 
-        const response = await fetch(this.options.uploadUrl, {
+        // Send raw chunk bytes; upload parameters travel in the query string
+        const params = new URLSearchParams({
+          action: 'upload_chunk',
+          upload_id: this.uploadId,
+          chunk_index: String(chunkIndex),
+          chunk_hash: chunkHash
+        });
+
+        const response = await fetch(`${this.options.uploadUrl}?${params.toString()}`, {
           method: 'POST',
           headers: {
-            'Content-Type': 'application/json',
-            'X-Auth-Token': this.options.token
+            'Content-Type': 'application/octet-stream',
+            'X-Auth-Token': this.options.token,
+            // Stable across retries, so a resent final chunk replays the completed upload instead of finalizing again
+            'Idempotency-Key': `${this.uploadId}:chunk:${chunkIndex}`
           },
-          body: JSON.stringify({
-            action: 'upload_chunk',
-            upload_id: this.uploadId,
-            chunk_index: chunkIndex,
-            chunk_data: base64Chunk,
-            chunk_hash: chunkHash
-          }),
+          body: chunk,
           signal: this.abortController?.signal
         });
 
@@ -191,7 +202,8 @@ export class ChunkedUploader {
         console.log(`Chunk ${chunkIndex + 1}/${this.totalChunks} uploaded (${result.progress?.toFixed(1)}%)`);
 
         // Check if upload is complete
-        if (result.upload_complete) {
+        if (result.upload_complete && !this.isCompleted) {
+          this.isCompleted = true;
           console.log('Upload completed on server:', result);
           this.options.onComplete?.(result);
         }
@@ -212,22 +224,6 @@ export class ChunkedUploader {
     }
   }
 
-  /**
-   * Convert Blob to base64
-   */
-  private blobToBase64(blob: Blob): Promise<string> {
-    return new Promise((resolve, reject) => {
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        const result = reader.result as string;
-        const base64Data = result.split(',')[1]; // Remove data:type;base64, prefix
-        resolve(base64Data);
-      };
-      reader.onerror = reject;
-      reader.readAsDataURL(blob);
-    });
-  }
-
   /**
    * Calculate MD5 hash for chunk verification
    */
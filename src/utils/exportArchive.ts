@@ -0,0 +1,73 @@
+export interface ExportArchiveOptions {
+  token: string;
+  leadsUrl: string;
+  leadIds: string[];
+  onProgress?: (progress: number) => void;
+}
+
+export interface ExportArchiveResult {
+  fileName: string;
+  archiveSize: number;
+  leadCount: number;
+  videoCount: number;
+}
+
+// Download slices stay under the server's per-response limit (MAX_RANGE_BYTES)
+const EXPORT_RANGE_BYTES = 2 * 1024 * 1024;
+
+/**
+ * Build a ZIP export of the given leads on the server, then download it by byte ranges
+ * and save it as one file.
+ */
+export async function downloadExportArchive(options: ExportArchiveOptions): Promise<ExportArchiveResult> {
+  const { token, leadsUrl, leadIds, onProgress } = options;
+
+  const response = await fetch(`${leadsUrl}?action=export`, {
+    method: 'POST',
+    headers: {
+      'X-Auth-Token': token,
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify({ lead_ids: leadIds })
+  });
+
+  const result = await response.json();
+  if (!response.ok || !result.success) {
+    throw new Error(result.error || 'Failed to create export archive');
+  }
+
+  const downloadUrl = `${leadsUrl}?${result.download_query}`;
+  const parts: Blob[] = [];
+  let received = 0;
+  while (received < result.archive_size) {
+    const end = Math.min(received + EXPORT_RANGE_BYTES, result.archive_size) - 1;
+    const part = await fetch(downloadUrl, { headers: { Range: `bytes=${received}-${end}` } });
+    if (!part.ok) {
+      throw new Error(`Failed to download archive bytes ${received}-${end}`);
+    }
+    // The server may cap a range below what was asked for, so advance by what actually arrived
+    const blob = await part.blob();
+    if (blob.size === 0) {
+      throw new Error('Archive download stalled');
+    }
+    parts.push(blob);
+    received += blob.size;
+    onProgress?.(Math.round((received / result.archive_size) * 100));
+  }
+
+  const blobUrl = URL.createObjectURL(new Blob(parts, { type: 'application/zip' }));
+  const link = document.createElement('a');
+  link.href = blobUrl;
+  link.download = result.file_name;
+  document.body.appendChild(link);
+  link.click();
+  document.body.removeChild(link);
+  URL.revokeObjectURL(blobUrl);
+
+  return {
+    fileName: result.file_name,
+    archiveSize: result.archive_size,
+    leadCount: result.lead_count,
+    videoCount: result.video_count
+  };
+}
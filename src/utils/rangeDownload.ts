@@ -0,0 +1,38 @@
+// Download slices stay under the server's per-response limit (MAX_RANGE_BYTES)
+const DOWNLOAD_RANGE_BYTES = 2 * 1024 * 1024;
+
+/**
+ * Fetch a file range by range and join the slices into one blob.
+ * Signed playback URLs answer at most one capped range per request; a URL that ignores
+ * Range (e.g. a data URL) comes back whole with a 200.
+ */
+export async function fetchByRanges(url: string, contentType = 'video/mp4'): Promise<Blob> {
+  const parts: Blob[] = [];
+  let received = 0;
+  let totalSize = Infinity;
+  while (received < totalSize) {
+    const response = await fetch(url, {
+      headers: { Range: `bytes=${received}-${received + DOWNLOAD_RANGE_BYTES - 1}` }
+    });
+    // A stored file shorter than its recorded size runs out of ranges early
+    if (response.status === 416 && received > 0) {
+      break;
+    }
+    if (!response.ok) {
+      throw new Error(`Failed to download bytes from ${received}`);
+    }
+    const part = await response.blob();
+    parts.push(part);
+    if (response.status !== 206) {
+      break;
+    }
+    const contentRange = response.headers.get('Content-Range')?.match(/\/(\d+)$/);
+    totalSize = contentRange ? parseInt(contentRange[1], 10) : received + part.size;
+    if (part.size === 0) {
+      throw new Error('Download stalled');
+    }
+    // The server may cap a range below what was asked for, so advance by what actually arrived
+    received += part.size;
+  }
+  return new Blob(parts, { type: contentType });
+}